@@ -1,13 +1,13 @@
-from pricing_app.data_loader import load_cost_data
-from pricing_app.costing import compute_product_costs, compute_package_costs
+from pricing_app.cost_graph import get_cost_graph
 from pricing_app.reports import build_full_pricing_table
 from pricing_app.models import ChannelFees
 def main():
     # Load data
-    materials, products_df, packages_df = load_cost_data('data')
+    cost_graph = get_cost_graph('data')
+    products_df, packages_df = cost_graph.products_summary, cost_graph.packages_summary
     # Compute costs
-    product_costs = compute_product_costs(products_df, materials)
-    package_costs = compute_package_costs(packages_df, product_costs, materials)
+    product_costs = cost_graph.product_costs
+    package_costs = cost_graph.package_costs
     # Build pricing table
     channel_fees = ChannelFees()
     pricing_table = build_full_pricing_table(
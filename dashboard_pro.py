@@ -1,14 +1,25 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from pricing_app.data_loader import load_cost_data
+from pricing_app.data_loader import load_materials
+from pricing_app.cost_graph import get_cost_graph
+from pricing_app.cost_index import changed_materials
 from pricing_app.models import ChannelFees
 from pricing_app.fees import extract_channel_fees_from_pl
 from pricing_app.channels import load_channels, save_channels, ChannelFees as ChannelFeesData
-from pricing_app.advanced_pricing import calculate_price_breakdown, create_pricing_table
+from pricing_app.advanced_pricing import (
+    calculate_price_breakdown,
+    calculate_price_breakdown_array,
+    create_pricing_table,
+    solve_price_for_margin_array,
+)
 from pricing_app.ui_components import UIComponents, ChartBuilder, TableFormatter
 from pricing_app.utils import ExportManager, FormatHelper, ColorScheme, DateTimeHelper
 from pricing_app.advanced_pricing_engine import AdvancedPricingEngine
+from pricing_app.compiled_channel import NUMERIC_FIELDS, CompiledChannel
+from pricing_app.bulk_pricing import price_catalog
+from pricing_app.sensitivity import catalog_sensitivity
 from pricing_app.salla_signals import get_signals_for
 import plotly.express as px
 import plotly.graph_objects as go
@@ -143,12 +154,46 @@ st.markdown(
 # ========== دوال محسّنة للأداء ==========
 
 @st.cache_data(ttl=3600, show_spinner=False)
-def load_salla_orders_cached(file_path):
-    """تحميل طلبات سلة مع تخزين مؤقت"""
+def load_salla_orders_cached(file_path, columns=None):
+    """تحميل طلبات سلة مع تخزين مؤقت (من المخزن العمودي إن وُجد؛ columns = الأعمدة المطلوبة فقط)"""
+    from pricing_app.order_store import load_orders_table
+
     if os.path.exists(file_path):
-        return pd.read_csv(file_path, low_memory=False)
+        return load_orders_table(file_path, columns)
     return None
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_filtered_orders_cached(store_path, filters, store_mtime, columns):
+    """
+    الطلبات المطابقة للفلاتر من المخزن المقسّم (store_mtime لإبطال النسخة المؤقتة عند إعادة الحفظ)
+    columns: الأعمدة المطلوبة فقط (مع أعمدة الأقسام year / month)
+    """
+    from pricing_app.order_store import PARTITION_COLUMNS, load_order_store
+
+    return load_order_store(store_path, list(columns) + PARTITION_COLUMNS, filters)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_order_dimensions_cached(store_path, store_mtime):
+    """قيم الفلاتر المتاحة في المخزن المقسّم"""
+    from pricing_app.order_store import load_dimensions
+
+    return load_dimensions(store_path)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def catalog_sensitivity_cached(
+    _cost_graph, cost_version, _channel, channel_key, channel_name, history_file, history_mtime, target_margin
+):
+    """
+    شبكة حساسية الكتالوج بأسعار القائمة الحالية (آخر سعر لكل SKU على القناة من سجل التسعير)
+    cost_version / channel_key / history_mtime لإبطال النسخة المؤقتة عند تغير التكاليف أو الرسوم أو السجل
+    Returns: (الشبكة، عدد الـ SKU المسعّرة من السجل)
+    """
+    from pricing_app.elasticity import latest_list_prices, load_price_history
+
+    list_prices = latest_list_prices(load_price_history(history_file), channel_name)
+    surface = catalog_sensitivity(_cost_graph, _channel, list_prices, target_margin=target_margin)
+    return surface, int(surface.skus.isin(list_prices.index).sum())
+
 @st.cache_data(ttl=3600, show_spinner=False)
 def load_pricing_data_cached(products_file, packages_file):
     """تحميل بيانات التسعير مع تخزين مؤقت"""
@@ -201,14 +246,28 @@ st.markdown(
 
 
 # Load data
-@st.cache_data
-def load_all_data():
-    materials, product_recipes, products_summary, package_compositions, packages_summary = load_cost_data("data")
-    return materials, product_recipes, products_summary, package_compositions, packages_summary
+@st.cache_resource(show_spinner=False)
+def load_cost_graph():
+    """خدمة التكلفة المشتركة بين كل الجلسات: تُحمّل مرة واحدة لكل نسخة من ملفات البيانات"""
+    return get_cost_graph("data")
+
+
+def clear_cost_caches():
+    """إعادة تحميل بيانات التكلفة فقط (تبقى طلبات سلة وملفات P&L محفوظة)"""
+    load_cost_graph().reload()
 
 
 try:
-    materials, product_recipes, products_summary, package_compositions, packages_summary = load_all_data()
+    cost_graph = load_cost_graph()
+    cost_graph.refresh_if_stale()
+    materials = cost_graph.materials
+    product_recipes = cost_graph.product_recipes
+    products_summary = cost_graph.products_summary
+    package_compositions = cost_graph.package_compositions
+    packages_summary = cost_graph.packages_summary
+    product_costs = cost_graph.product_costs
+    package_report = cost_graph.report
+    package_costs = cost_graph.package_costs
 except Exception as e:
     # رسالة ترحيبية بدلاً من رسالة خطأ
     st.markdown("""
@@ -405,7 +464,25 @@ if st.session_state.page == "upload":
                     try:
                         df.to_csv("data/raw_materials_template.csv", index=False, encoding="utf-8-sig")
                         st.success("تم حفظ المواد الخام في data/raw_materials_template.csv")
-                        st.cache_data.clear()
+
+                        # إعادة حساب الأصناف المتأثرة فقط وعرض الفروقات
+                        new_materials, rejected_rows = load_materials(
+                            "data/raw_materials_template.csv", with_rejections=True
+                        )
+                        if not rejected_rows.empty:
+                            st.warning(f"تم تجاهل {len(rejected_rows)} صف غير صالح:")
+                            st.dataframe(rejected_rows, width="stretch")
+                        changed = changed_materials(materials, new_materials)
+                        cogs_delta = cost_graph.update_materials(new_materials)
+                        if changed:
+                            st.info(f"تغيرت تكلفة {len(changed)} مادة وتأثر {len(cogs_delta)} صنف")
+                            st.dataframe(
+                                cogs_delta.rename(columns={
+                                    "type": "النوع", "old_cogs": "التكلفة السابقة", "new_cogs": "التكلفة الجديدة",
+                                    "change": "الفرق", "change_pct": "الفرق %",
+                                }),
+                                width="stretch",
+                            )
                     except Exception as e:
                         st.error(f"خطأ في الحفظ: {e}")
             except Exception as e:
@@ -442,7 +519,7 @@ cost_per_unit"""
                     try:
                         df.to_csv("data/products_template.csv", index=False, encoding="utf-8-sig")
                         st.success("تم حفظ المنتجات في data/products_template.csv")
-                        st.cache_data.clear()
+                        clear_cost_caches()
                     except Exception as e:
                         st.error(f"خطأ في الحفظ: {e}")
             except Exception as e:
@@ -478,7 +555,7 @@ quantity"""
                     try:
                         df.to_csv("data/packages_template.csv", index=False, encoding="utf-8-sig")
                         st.success("تم حفظ البكجات في data/packages_template.csv")
-                        st.cache_data.clear()
+                        clear_cost_caches()
                     except Exception as e:
                         st.error(f"خطأ في الحفظ: {e}")
             except Exception as e:
@@ -673,7 +750,10 @@ quantity"""
         existing_files = [f for f in os.listdir("data") if f.startswith("salla_orders") and not f.endswith(".db")]
         if existing_files:
             # أعطِ الأولوية للملف المفكك ثم الكامل ثم العينة
-            priority = {"salla_orders_exploded.csv": 0, "salla_orders.csv": 1, "salla_orders_sample.csv": 2}
+            priority = {
+                "salla_orders_exploded.parquet": 0, "salla_orders_exploded.csv": 1,
+                "salla_orders.csv": 2, "salla_orders_sample.csv": 3,
+            }
             existing_files = sorted(existing_files, key=lambda x: priority.get(x, 99))
             default_index = 0  # أول عنصر هو الأعلى أولوية
             selected = st.selectbox("اختر ملفاً موجوداً في data/", existing_files, key="existing_salla_file", index=default_index)
@@ -683,6 +763,9 @@ quantity"""
                     name = selected.lower()
 
                     def read_any(file_path, name):
+                        if name.endswith((".parquet", ".feather")):
+                            from pricing_app.order_store import load_order_store
+                            return load_order_store(file_path)
                         if name.endswith(".csv"):
                             return pd.read_csv(file_path, low_memory=False)
                         if name.endswith(".xlsx"):
@@ -803,6 +886,14 @@ elif st.session_state.page == "cogs":
     else:
         st.success("جميع البكجات لديها مكونات موجودة")
 
+    # Cycles in nested packages cannot be costed
+    if package_report.cycles:
+        st.error(f"وجدنا {len(package_report.cycles)} دورة في البكجات المتداخلة (لا يمكن حساب تكلفتها):")
+        for cycle in package_report.cycles:
+            st.write(" → ".join(cycle + cycle[:1]))
+    if package_report.blocked:
+        st.error(f"بكجات لم تُحسب تكلفتها لاعتمادها على دورة: {', '.join(package_report.blocked)}")
+
     st.markdown("---")
 
     # COGS Calculation Table
@@ -810,50 +901,17 @@ elif st.session_state.page == "cogs":
 
     cogs_data = []
 
-    # Helper function to calculate cost of any component (material, product, or package)
-    def calculate_component_cost(sku, component_type="product"):
-        """Calculate cost of a component based on its type"""
-        if component_type == "material" and sku in materials:
-            return materials[sku].cost_per_unit
-        elif component_type == "product" and sku in product_recipes:
-            # Sum all materials in this product
-            total = 0
-            for material_code, mat_qty in product_recipes[sku].items():
-                if material_code in materials:
-                    total += materials[material_code].cost_per_unit * mat_qty
-            return total
-        elif component_type == "package" and sku in package_compositions:
-            # Recursively calculate package cost
-            total = 0
-            for comp_sku, comp_qty in package_compositions[sku].items():
-                # Determine type: check if it's a product, package, or material
-                if comp_sku in product_recipes:
-                    comp_cost = calculate_component_cost(comp_sku, "product")
-                elif comp_sku in package_compositions:
-                    comp_cost = calculate_component_cost(comp_sku, "package")
-                elif comp_sku in materials:
-                    comp_cost = calculate_component_cost(comp_sku, "material")
-                else:
-                    comp_cost = 0
-                total += comp_cost * comp_qty
-            return total
-        return 0
-
     # Product COGS
     st.write("**تكلفة المنتجات:**")
-    for product_sku, materials_dict in product_recipes.items():
+    for product_sku in product_recipes:
         product_name = products_summary[products_summary["Product_SKU"] == product_sku]["Product_Name"].values
         product_name = product_name[0] if len(product_name) > 0 else product_sku
 
-        total_cost = 0
-        details = []
-
-        for material_code, quantity in materials_dict.items():
-            if material_code in materials:
-                material = materials[material_code]
-                cost = material.cost_per_unit * quantity
-                total_cost += cost
-                details.append(f"{material_code}: {quantity} x {material.cost_per_unit:.2f} = {cost:.2f}")
+        total_cost = product_costs.get(product_sku, 0.0)
+        details = [
+            f"{row['component_sku']}: {row['quantity']} x {row['unit_cost']:.2f} = {row['cost']:.2f}"
+            for row in cost_graph.breakdown(product_sku)
+        ]
 
         cogs_data.append(
             {
@@ -867,34 +925,18 @@ elif st.session_state.page == "cogs":
 
     # Package COGS
     st.write("**تكلفة البكجات:**")
-    for package_sku, components_dict in package_compositions.items():
+    component_type_labels = {"product": "منتج", "package": "بكج", "material": "مادة"}
+    for package_sku in package_compositions:
         package_name = packages_summary[packages_summary["Package_SKU"] == package_sku]["Package_Name"].values
         package_name = package_name[0] if len(package_name) > 0 else package_sku
 
-        total_cost = 0
-        details = []
-
-        for component_sku, quantity in components_dict.items():
-            # Determine component type and calculate its cost
-            if component_sku in product_recipes:
-                # It's a product
-                comp_cost = calculate_component_cost(component_sku, "product")
-                comp_type = "منتج"
-            elif component_sku in package_compositions:
-                # It's a package
-                comp_cost = calculate_component_cost(component_sku, "package")
-                comp_type = "بكج"
-            elif component_sku in materials:
-                # It's a material
-                comp_cost = calculate_component_cost(component_sku, "material")
-                comp_type = "مادة"
-            else:
-                comp_cost = 0
-                comp_type = "غير معروف"
-
-            cost = comp_cost * quantity
-            total_cost += cost
-            details.append(f"{component_sku} ({comp_type}): {quantity} x {comp_cost:.2f} = {cost:.2f}")
+        breakdown = cost_graph.breakdown(package_sku)
+        total_cost = sum(row["cost"] for row in breakdown)
+        details = [
+            f"{row['component_sku']} ({component_type_labels.get(row['component_type'], 'غير معروف')}): "
+            f"{row['quantity']} x {row['unit_cost']:.2f} = {row['cost']:.2f}"
+            for row in breakdown
+        ]
 
         cogs_data.append(
             {
@@ -1632,7 +1674,7 @@ elif st.session_state.page == "pricing":
     if not channels:
         st.error("⚠️ لا توجد قنوات محفوظة! يجب إضافة قناة أولاً من صفحة الإعدادات")
     else:
-        # Use already loaded data (from load_all_data at the top)
+        # Use already loaded data (shared cost graph loaded at the top)
         products_df = products_summary
         packages_df = packages_summary
 
@@ -1642,27 +1684,6 @@ elif st.session_state.page == "pricing":
             "💡",
         )
 
-        # Helper function to calculate cost of any component
-        def calculate_component_cost(sku, component_type="product"):
-            if component_type == "material" and sku in materials:
-                return materials[sku].cost_per_unit
-            if component_type == "product" and sku in product_recipes:
-                total = 0
-                for material_code, mat_qty in product_recipes[sku].items():
-                    if material_code in materials:
-                        total += materials[material_code].cost_per_unit * mat_qty
-                return total
-            if component_type == "package" and sku in package_compositions:
-                total = 0
-                for comp_sku, comp_qty in package_compositions[sku].items():
-                    if comp_sku in materials:
-                        total += materials[comp_sku].cost_per_unit * comp_qty
-                    elif comp_sku in product_recipes:
-                        total += calculate_component_cost(comp_sku, "product") * comp_qty
-                    elif comp_sku in package_compositions:
-                        total += calculate_component_cost(comp_sku, "package") * comp_qty
-                return total
-            return 0.0
 
         # Build selector options (unique)
         sku_options = []
@@ -1681,14 +1702,14 @@ elif st.session_state.page == "pricing":
                 sku = row["Product_SKU"]
                 name = row["Product_Name"]
                 option = f"{name} - {sku}"
-                add_item(option, sku, name, "منتج", calculate_component_cost(sku, "product"))
+                add_item(option, sku, name, "منتج", cost_graph.cost(sku, "product"))
 
         if not packages_df.empty:
             for _, row in packages_df.iterrows():
                 sku = row["Package_SKU"]
                 name = row["Package_Name"]
                 option = f"{name} - {sku}"
-                add_item(option, sku, name, "باقة", calculate_component_cost(sku, "package"))
+                add_item(option, sku, name, "باقة", cost_graph.cost(sku, "package"))
 
         # === Inputs ===
         col_left, col_mid, col_right = st.columns([1.2, 1, 1.1])
@@ -2064,6 +2085,42 @@ elif st.session_state.page == "pricing":
                 )
                 st.dataframe(styled_price, width="stretch", hide_index=True, height=280)
 
+            with st.expander("🔎 حساسية الكتالوج كاملاً على هذه القناة (تكلفة × سعر × خصم)"):
+                catalog_channel = CompiledChannel.from_channel(
+                    ch,
+                    marketing_pct=marketing_effective,
+                    discount_rate=discount_rate,
+                    shipping_fixed=shipping,
+                    preparation_fee=preparation,
+                )
+                history_file = os.path.join(os.path.dirname(__file__), "data", "pricing_history.csv")
+                surface, priced_count = catalog_sensitivity_cached(
+                    cost_graph,
+                    cost_graph.version,
+                    catalog_channel,
+                    tuple(getattr(catalog_channel, name) for name in NUMERIC_FIELDS) + (catalog_channel.custom_lines,),
+                    selected_channel,
+                    history_file,
+                    os.path.getmtime(history_file) if os.path.exists(history_file) else None,
+                    target_margin,
+                )
+                cogs_tolerance = st.slider("زيادة التكلفة المحتملة %", 0, 50, 10, 5) / 100
+                fragile = surface.fragile_skus(cogs_tolerance)
+                st.caption(
+                    f"أسعار القائمة من سجل التسعير لـ {priced_count} SKU، والباقي عند الهامش المستهدف {target_margin_pct:.0f}% — "
+                    f"{len(fragile)} من {len(surface.skus)} SKU يصبح هامشها سالباً بزيادة تكلفة أقل من {cogs_tolerance*100:.0f}%"
+                )
+                fragile_view = pd.DataFrame({
+                    "SKU": fragile.index,
+                    "تكلفة البضاعة": fragile["cogs"].round(2).to_numpy(),
+                    "السعر": fragile["list_price"].round(2).to_numpy(),
+                    "هامش %": fragile["margin_pct"].round(2).to_numpy(),
+                    "الهامش سالب عند تغير تكلفة %": (fragile["cogs_change_at_zero"] * 100).round(1).to_numpy(),
+                    "الهامش سالب عند تغير سعر %": (fragile["price_change_at_zero"] * 100).round(1).to_numpy(),
+                    "خلايا سالبة %": (fragile["negative_share"] * 100).round(1).to_numpy(),
+                })
+                st.dataframe(fragile_view, width="stretch", hide_index=True)
+
             # Positioning vs competitor with side-by-side detailed tables
             if competitor_price > 0:
                 our_price_after_discount = breakdown["price_after_discount"]
@@ -2329,36 +2386,12 @@ elif st.session_state.page == "custom_package":
     if not channels:
         st.error("⚠️ لا توجد قنوات محفوظة! يجب إضافة قناة أولاً من صفحة الإعدادات")
     else:
-        # Load all data
-        materials, product_recipes, products_df, package_compositions, packages_df = load_cost_data("data")
-
         UIComponents.render_section_header(
             "بناء بكج مخصص",
             "اختر عدة منتجات أو بكجات وحدد كمياتها لإنشاء بكج جديد",
             "🎁",
         )
 
-        # Helper function to calculate cost
-        def calculate_component_cost(sku, component_type="product"):
-            if component_type == "material" and sku in materials:
-                return materials[sku].cost_per_unit
-            if component_type == "product" and sku in product_recipes:
-                total = 0
-                for material_code, mat_qty in product_recipes[sku].items():
-                    if material_code in materials:
-                        total += materials[material_code].cost_per_unit * mat_qty
-                return total
-            if component_type == "package" and sku in package_compositions:
-                total = 0
-                for comp_sku, comp_qty in package_compositions[sku].items():
-                    if comp_sku in materials:
-                        total += materials[comp_sku].cost_per_unit * comp_qty
-                    elif comp_sku in product_recipes:
-                        total += calculate_component_cost(comp_sku, "product") * comp_qty
-                    elif comp_sku in package_compositions:
-                        total += calculate_component_cost(comp_sku, "package") * comp_qty
-                return total
-            return 0.0
 
         # Build selector options
         all_items = {}
@@ -2501,7 +2534,7 @@ elif st.session_state.page == "custom_package":
                         if selected_item and selected_item in filtered_items:
                             sku = filtered_items[selected_item]
                             component_type = item_types[sku]
-                            cost = calculate_component_cost(
+                            cost = cost_graph.cost(
                                 sku, 
                                 "product" if component_type == "منتج" else "package"
                             )
@@ -3039,6 +3072,15 @@ elif st.session_state.page == "profit_margins":
     min_cogs = 0.0
     max_cogs = 0.0
 
+    execution_modes = {"مباشر": "serial", "متوازي (عمليات)": "process", "متوازي (خيوط)": "thread"}
+    execution_mode = st.radio(
+        "وضع التنفيذ",
+        options=list(execution_modes.keys()),
+        horizontal=True,
+        key="pm_execution",
+        help="الوضع المتوازي يقسم الكتالوج إلى شرائح على أنوية المعالج - مفيد للكتالوجات الكبيرة",
+    )
+
     st.caption("يتم تطبيق الخصم على السعر النهائي للعميل، بينما يبقى الهامش المستهدف بعد الخصم.")
 
     # Auto-recalculate when channel changes
@@ -3058,27 +3100,6 @@ elif st.session_state.page == "profit_margins":
         st.markdown("---")
         UIComponents.render_section_header("نتائج التسعير الجماعي", "حساب شامل لكل منتج وبكج", "📑")
 
-        # Helper: calculate component cost
-        def calculate_component_cost(sku, component_type):
-            if component_type == "material" and sku in materials:
-                return materials[sku].cost_per_unit
-            if component_type == "product" and sku in product_recipes:
-                total = 0
-                for material_code, mat_qty in product_recipes[sku].items():
-                    if material_code in materials:
-                        total += materials[material_code].cost_per_unit * mat_qty
-                return total
-            if component_type == "package" and sku in package_compositions:
-                total = 0
-                for comp_sku, comp_qty in package_compositions[sku].items():
-                    if comp_sku in materials:
-                        total += materials[comp_sku].cost_per_unit * comp_qty
-                    elif comp_sku in product_recipes:
-                        total += calculate_component_cost(comp_sku, "product") * comp_qty
-                    elif comp_sku in package_compositions:
-                        total += calculate_component_cost(comp_sku, "package") * comp_qty
-                return total
-            return 0.0
 
         # Build items list
         all_items = []
@@ -3088,7 +3109,7 @@ elif st.session_state.page == "profit_margins":
                     "sku": row["Product_SKU"],
                     "name": row.get("Product_Name", row["Product_SKU"]),
                     "type": "منتج",
-                    "cogs": calculate_component_cost(row["Product_SKU"], "product"),
+                    "cogs": cost_graph.cost(row["Product_SKU"], "product"),
                 }
             )
 
@@ -3098,7 +3119,7 @@ elif st.session_state.page == "profit_margins":
                     "sku": row["Package_SKU"],
                     "name": row.get("Package_Name", row["Package_SKU"]),
                     "type": "بكج",
-                    "cogs": calculate_component_cost(row["Package_SKU"], "package"),
+                    "cogs": cost_graph.cost(row["Package_SKU"], "package"),
                 }
             )
 
@@ -3114,8 +3135,6 @@ elif st.session_state.page == "profit_margins":
             st.stop()
 
         # Pricing calculations
-        progress_bar = st.progress(0)
-        status_placeholder = st.empty()
         results = []
 
         shipping = channel.shipping_fixed
@@ -3131,102 +3150,41 @@ elif st.session_state.page == "profit_margins":
             "opex_pct": channel.opex_pct,
             "vat_rate": vat_rate,
         }
+        pricing_args = dict(
+            shipping=shipping,
+            preparation=preparation,
+            discount_rate=discount_rate,
+            vat_rate=vat_rate,
+            free_shipping_threshold=free_shipping_threshold,
+            custom_fees=custom_fees,
+        )
 
-        # Binary Search Function (نفس الطريقة من صفحة التسعير الفردي)
-        def solve_price_for_margin(cogs_val, target_margin_val):
-            """استخدام Binary Search للوصول للسعر الذي يحقق الهامش المستهدف بدقة"""
-            low = cogs_val * 1.1
-            high = cogs_val * 10
-            best_price = high
-            best_bd = None
-
-            tolerance = 0.0001
-            for iteration in range(100):
-                mid = (low + high) / 2
-                bd = calculate_price_breakdown(
-                    cogs=cogs_val,
-                    channel_fees=channel_dict,
-                    shipping=shipping,
-                    preparation=preparation,
-                    discount_rate=discount_rate,
-                    vat_rate=vat_rate,
-                    free_shipping_threshold=free_shipping_threshold,
-                    custom_fees=custom_fees,
-                    price_with_vat=mid,
-                )
-
-                margin_diff = bd["margin_pct"] - target_margin_val
-
-                if abs(margin_diff) < tolerance:
-                    return mid, bd
-
-                if margin_diff < 0:
-                    low = mid
-                else:
-                    high = mid
-
-                best_price = mid
-                best_bd = bd
-
-            return best_price, best_bd
-
-        for idx, item in enumerate(filtered_items):
-            status_placeholder.text(f"جاري تسعير {item['sku']} ({idx + 1}/{len(filtered_items)})")
+        # حل مباشر لكل العناصر دفعة واحدة (مع مراعاة حد الشحن المجاني)، ثم التفاصيل الكاملة كمصفوفات
+        cogs_values = np.array([item["cogs"] for item in filtered_items], dtype=float)
+        if execution_modes[execution_mode] == "serial":
+            solved_prices = solve_price_for_margin_array(cogs_values, channel_dict, target_margin, **pricing_args)
+            breakdowns = calculate_price_breakdown_array(
+                cogs_values, channel_dict, price_with_vat=np.nan_to_num(solved_prices), **pricing_args
+            ).to_dict("records")
+        else:
+            shard_progress = st.progress(0.0)
+            priced_catalog = price_catalog(
+                [item["sku"] for item in filtered_items],
+                cogs_values,
+                {selected_channel: CompiledChannel.from_channel(channel, discount_rate=discount_rate)},
+                target_margin=target_margin,
+                executor=execution_modes[execution_mode],
+                progress=lambda done, total, label: shard_progress.progress(done / total, text=f"شريحة {done}/{total}: {label}"),
+            )
+            shard_progress.empty()
+            solved_prices = priced_catalog["price_with_vat"].to_numpy()
+            breakdowns = priced_catalog.drop(columns=["channel", "SKU", "price_with_vat"]).to_dict("records")
 
+        for item, price_with_vat, breakdown in zip(filtered_items, solved_prices, breakdowns):
             cogs_val = item["cogs"]
 
-            # استخدام Binary Search للحصول على السعر الدقيق
-            try:
-                price_with_vat, breakdown = solve_price_for_margin(cogs_val, target_margin)
-
-                # حساب السعر قبل الخصم
-                price_before_discount = (
-                    price_with_vat / (1 - discount_rate) if discount_rate > 0 else price_with_vat
-                )
-
-                # توليد تنبيهات
-                alerts = []
-                if breakdown["margin_pct"] < 0:
-                    alerts.append("⛔ تحذير: السعر الحالي يحقق خسارة!")
-                elif breakdown["margin_pct"] < 0.05:
-                    alerts.append("⚠️ تحذير: هامش الربح أقل من الحد الأدنى المقبول (5.0%)")
-                elif breakdown["margin_pct"] < 0.15:
-                    alerts.append("💡 ملاحظة: هامش الربح أقل من الموصى به (15.0%)")
-                elif breakdown["margin_pct"] >= 0.25:
-                    alerts.append(f"✅ ممتاز: هامش ربح ممتاز ({breakdown['margin_pct']*100:.1f}%)")
-
-                alerts_text = " | ".join(alerts) if alerts else "جيد"
-
-                # حساب ROI
-                roi = (breakdown["profit"] / breakdown["total_costs_fees"]) * 100 if breakdown["total_costs_fees"] > 0 else 0
-
-                results.append(
-                    {
-                        "SKU": item["sku"],
-                        "الاسم": item["name"],
-                        "النوع": item["type"],
-                        "الحالة": "تم التسعير",
-                        "التكلفة": breakdown["cogs"],
-                        "رسوم الشحن": breakdown["shipping_fee"],
-                        "رسوم التحضير": breakdown["preparation_fee"],
-                        "رسوم إدارية": breakdown["admin_fee"],
-                        "رسوم تسويق": breakdown["marketing_fee"],
-                        "رسوم المنصة": breakdown["platform_fee"],
-                        "رسوم إضافية مخصصة": breakdown.get("custom_fees_total", 0),
-                        "إجمالي الرسوم": breakdown["total_costs_fees"] - breakdown["cogs"],
-                        "سعر قبل الخصم": price_before_discount,
-                        "السعر النهائي بعد الخصم": breakdown["price_after_discount"],
-                        "الربح": breakdown["profit"],
-                        "هامش الربح %": breakdown["margin_pct"] * 100,
-                        "ROI %": roi,
-                        "نقطة التعادل": breakdown["breakeven_price"],
-                        "الهامش الآمن %": ((breakdown["price_after_discount"] - breakdown["breakeven_price"]) / breakdown["breakeven_price"] * 100) if breakdown["breakeven_price"] > 0 else 0,
-                        "توصية السعر": price_with_vat,
-                        "تنبيهات": alerts_text,
-                    }
-                )
-            except Exception as e:
-                # في حالة فشل الحساب
+            if np.isnan(price_with_vat):
+                # الهامش المستهدف غير قابل للتحقيق مع نسب الرسوم الحالية
                 results.append(
                     {
                         "SKU": item["sku"],
@@ -3248,15 +3206,52 @@ elif st.session_state.page == "profit_margins":
                         "نقطة التعادل": 0.0,
                         "الهامش الآمن %": 0.0,
                         "توصية السعر": 0.0,
-                        "تنبيهات": f"خطأ في الحساب: {str(e)}",
+                        "تنبيهات": "الهامش المستهدف أعلى من المتاح بعد نسب الرسوم",
                     }
                 )
+                continue
+
+            # توليد تنبيهات
+            alerts = []
+            if breakdown["margin_pct"] < 0:
+                alerts.append("⛔ تحذير: السعر الحالي يحقق خسارة!")
+            elif breakdown["margin_pct"] < 0.05:
+                alerts.append("⚠️ تحذير: هامش الربح أقل من الحد الأدنى المقبول (5.0%)")
+            elif breakdown["margin_pct"] < 0.15:
+                alerts.append("💡 ملاحظة: هامش الربح أقل من الموصى به (15.0%)")
+            elif breakdown["margin_pct"] >= 0.25:
+                alerts.append(f"✅ ممتاز: هامش ربح ممتاز ({breakdown['margin_pct']*100:.1f}%)")
 
+            alerts_text = " | ".join(alerts) if alerts else "جيد"
 
-            progress_bar.progress((idx + 1) / len(filtered_items))
+            # حساب ROI
+            roi = (breakdown["profit"] / breakdown["total_costs_fees"]) * 100 if breakdown["total_costs_fees"] > 0 else 0
 
-        status_placeholder.empty()
-        progress_bar.empty()
+            results.append(
+                {
+                    "SKU": item["sku"],
+                    "الاسم": item["name"],
+                    "النوع": item["type"],
+                    "الحالة": "تم التسعير",
+                    "التكلفة": breakdown["cogs"],
+                    "رسوم الشحن": breakdown["shipping_fee"],
+                    "رسوم التحضير": breakdown["preparation_fee"],
+                    "رسوم إدارية": breakdown["admin_fee"],
+                    "رسوم تسويق": breakdown["marketing_fee"],
+                    "رسوم المنصة": breakdown["platform_fee"],
+                    "رسوم إضافية مخصصة": breakdown["custom_fees_total"],
+                    "إجمالي الرسوم": breakdown["total_costs_fees"] - breakdown["cogs"],
+                    "سعر قبل الخصم": breakdown["sale_price"],
+                    "السعر النهائي بعد الخصم": breakdown["price_after_discount"],
+                    "الربح": breakdown["profit"],
+                    "هامش الربح %": breakdown["margin_pct"] * 100,
+                    "ROI %": roi,
+                    "نقطة التعادل": breakdown["breakeven_price"],
+                    "الهامش الآمن %": ((breakdown["price_after_discount"] - breakdown["breakeven_price"]) / breakdown["breakeven_price"] * 100) if breakdown["breakeven_price"] > 0 else 0,
+                    "توصية السعر": price_with_vat,
+                    "تنبيهات": alerts_text,
+                }
+            )
 
         if not results:
             st.warning("لا توجد نتائج للعرض")
@@ -3842,7 +3837,14 @@ elif st.session_state.page == "salla_analysis":
     st.markdown("تحليل تفصيلي للطلبات")
     
     # قراءة ملف الطلبات المفكك باستخدام التخزين المؤقت
-    exploded_file = "data/salla_orders_exploded.csv"
+    from pricing_app.order_store import ORDER_STORE_FILE, STORE_FORMATS, order_dimensions, resolve_orders_file
+
+    # الأعمدة التي تقرؤها هذه الصفحة من المخزن: التاريخ للسنة/الشهر، الحالة/المدينة/الدفع للفلاتر والجداول،
+    # order_id لعدد الطلبات، و sku_code/sku_name/qty للمبيعات والتكلفة
+    SALLA_ANALYSIS_COLUMNS = (
+        "order_id", "order_date", "status", "city", "payment_method", "sku_code", "sku_name", "qty",
+    )
+    exploded_file = resolve_orders_file("data/salla_orders_exploded.csv")
     orders_file = "data/salla_orders.csv"
     sample_file = "data/salla_orders_sample.csv"
     
@@ -3879,141 +3881,96 @@ elif st.session_state.page == "salla_analysis":
         st.warning("⚠️ ملف الطلبات غير موجود!")
         st.stop()
 
-    # استخدام التخزين المؤقت لتسريع التحميل
-    with st.spinner("جاري تحميل البيانات..."):
-        orders_df = load_salla_orders_cached(file_to_load)
+    # مخزن مقسّم حسب السنة/الشهر: لا يُحمّل السجل كاملاً، الفلاتر تُطبق أثناء القراءة (order_store)
+    partitioned_store = use_exploded and os.path.isdir(exploded_file)
+    if not partitioned_store:
+        # استخدام التخزين المؤقت لتسريع التحميل
+        with st.spinner("جاري تحميل البيانات..."):
+            orders_df = load_salla_orders_cached(
+                file_to_load, list(SALLA_ANALYSIS_COLUMNS) if file_to_load.endswith(STORE_FORMATS) else None,
+            )
     
-    if orders_df is None:
-        st.error("❌ فشل تحميل البيانات")
-        st.stop()
+        if orders_df is None:
+            st.error("❌ فشل تحميل البيانات")
+            st.stop()
 
-    try:
-        # التأكد من أن order_date هو datetime (خاصة بعد تحميل ملف مفكك محفوظ)
-        if 'order_date' in orders_df.columns:
-            orders_df['order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
+        try:
+            # التأكد من أن order_date هو datetime (خاصة بعد تحميل ملف مفكك محفوظ)
+            if 'order_date' in orders_df.columns:
+                orders_df['order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
         
-        # توحيد أسماء الأعمدة للإنجليزية
-        column_mapping = {
-            'رقم الطلب': 'order_id',
-            'حالة الطلب': 'status',
-            'المدينة': 'city',
-            'SKU': 'sku_raw',
-            'طريقة الدفع': 'payment_method',
-            'تاريخ الطلب': 'order_date'
-        }
+            # توحيد أسماء الأعمدة للإنجليزية
+            column_mapping = {
+                'رقم الطلب': 'order_id',
+                'حالة الطلب': 'status',
+                'المدينة': 'city',
+                'SKU': 'sku_raw',
+                'طريقة الدفع': 'payment_method',
+                'تاريخ الطلب': 'order_date'
+            }
         
-        # تطبيق التحويل إذا كانت الأعمدة بالعربي
-        if 'رقم الطلب' in orders_df.columns:
-            orders_df = orders_df.rename(columns=column_mapping)
+            # تطبيق التحويل إذا كانت الأعمدة بالعربي
+            if 'رقم الطلب' in orders_df.columns:
+                orders_df = orders_df.rename(columns=column_mapping)
         
-        # حفظ نسخة من التاريخ الأصلي قبل التحويل (للاستخدام في حالة الفشل)
-        orders_df['order_date_original'] = orders_df['order_date'].astype(str)
+            # حفظ نسخة من التاريخ الأصلي قبل التحويل (للاستخدام في حالة الفشل)
+            orders_df['order_date_original'] = orders_df['order_date'].astype(str)
         
-        # تحويل التاريخ مع تعزيزات للفورمات المختلفة حتى لا نفقد سنوات حديثة (2024/2025)
-        orders_df['order_date'] = pd.to_datetime(
-            orders_df['order_date'], errors='coerce', dayfirst=True, infer_datetime_format=True
-        )
-        if orders_df['order_date'].isna().any():
-            # محاولة ثانية بصيغة ISO/UTC مثل 2024-12-01T10:00:00Z
-            orders_df.loc[orders_df['order_date'].isna(), 'order_date'] = pd.to_datetime(
-                orders_df.loc[orders_df['order_date'].isna(), 'order_date_original'],
-                errors='coerce',
-                format='ISO8601',
-                utc=True,
+            # تحويل التاريخ مع تعزيزات للفورمات المختلفة حتى لا نفقد سنوات حديثة (2024/2025)
+            orders_df['order_date'] = pd.to_datetime(
+                orders_df['order_date'], errors='coerce', dayfirst=True, infer_datetime_format=True
             )
-        if orders_df['order_date'].isna().any():
-            # أخيراً: استخرج السنة/الشهر من التاريخ الأصلي (قبل التحويل)
-            mask = orders_df['order_date'].isna()
-            raw_dates = orders_df.loc[mask, 'order_date_original']
+            if orders_df['order_date'].isna().any():
+                # محاولة ثانية بصيغة ISO/UTC مثل 2024-12-01T10:00:00Z
+                orders_df.loc[orders_df['order_date'].isna(), 'order_date'] = pd.to_datetime(
+                    orders_df.loc[orders_df['order_date'].isna(), 'order_date_original'],
+                    errors='coerce',
+                    format='ISO8601',
+                    utc=True,
+                )
+            if orders_df['order_date'].isna().any():
+                # أخيراً: استخرج السنة/الشهر من التاريخ الأصلي (قبل التحويل)
+                mask = orders_df['order_date'].isna()
+                raw_dates = orders_df.loc[mask, 'order_date_original']
             
-            # تحويل إلى string والتأكد من وجود قيم صالحة
-            if len(raw_dates) > 0 and not raw_dates.isna().all():
-                extracted_year = raw_dates.str.extract(r'(20\d{2})', expand=False)
-                extracted_month = raw_dates.str.extract(r'-(\d{1,2})-', expand=False)
-                orders_df.loc[mask, 'year'] = pd.to_numeric(extracted_year, errors='coerce')
-                orders_df.loc[mask, 'month'] = pd.to_numeric(extracted_month, errors='coerce')
+                # تحويل إلى string والتأكد من وجود قيم صالحة
+                if len(raw_dates) > 0 and not raw_dates.isna().all():
+                    extracted_year = raw_dates.str.extract(r'(20\d{2})', expand=False)
+                    extracted_month = raw_dates.str.extract(r'-(\d{1,2})-', expand=False)
+                    orders_df.loc[mask, 'year'] = pd.to_numeric(extracted_year, errors='coerce')
+                    orders_df.loc[mask, 'month'] = pd.to_numeric(extracted_month, errors='coerce')
         
-        # تفكيك SKU إذا لزم الأمر (وإذا لم يكن الملف مفككاً مسبقاً)
-        if not skip_explode and 'sku_raw' in orders_df.columns and 'sku_code' not in orders_df.columns:
-            with st.spinner("🔄 جاري تفكيك المنتجات والبكجات..."):
-                from pricing_app.salla_normalizer import parse_sku_cell
-                
-                normalized_rows = []
-                total_rows = len(orders_df)
-                progress_bar = st.progress(0)
-                
-                for idx, row in orders_df.iterrows():
-                    if idx % 100 == 0:
-                        progress_bar.progress(min(idx / total_rows, 1.0))
-                    
-                    sku_items = parse_sku_cell(row["sku_raw"])
-                    
-                    if not sku_items:
-                        normalized_rows.append({
-                            "order_id": row["order_id"],
-                            "order_date": row["order_date"],
-                            "status": row["status"],
-                            "city": row["city"],
-                            "payment_method": row["payment_method"],
-                            "sku_code": "",
-                            "sku_name": "",
-                            "qty": 0,
-                        })
-                        continue
-                    
-                    for item in sku_items:
-                        normalized_rows.append({
-                            "order_id": row["order_id"],
-                            "order_date": row["order_date"],
-                            "status": row["status"],
-                            "city": row["city"],
-                            "payment_method": row["payment_method"],
-                            "sku_code": item["sku_code"],
-                            "sku_name": item["sku_name"],
-                            "qty": item["qty"],
-                        })
+            # تفكيك SKU إذا لزم الأمر (وإذا لم يكن الملف مفككاً مسبقاً)
+            if not skip_explode and 'sku_raw' in orders_df.columns and 'sku_code' not in orders_df.columns:
+                with st.spinner("🔄 جاري تفكيك المنتجات والبكجات..."):
+                    from pricing_app.order_store import save_order_store
+                    from pricing_app.parallel_orders import explode_parallel
+                    from pricing_app.salla_normalizer import explode_orders_frame
                 
-                progress_bar.progress(1.0)
-                orders_df = pd.DataFrame(normalized_rows)
-                orders_df['order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
+                    total_rows = len(orders_df)
+                    progress_bar = st.progress(0)
+                    orders_df = explode_parallel(
+                        orders_df, explode_orders_frame, use_shared_memory=True,
+                        progress=lambda done, total, label: progress_bar.progress(done / total),
+                    )
+                    progress_bar.empty()
+                    orders_df['order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
                 
-                # حفظ النتيجة المفككة
-                orders_df.to_csv("data/salla_orders_exploded.csv", index=False)
-                st.success(f"✅ تم التفكيك! {len(orders_df):,} صف من {total_rows:,} طلب")
-                progress_bar.empty()
+                    # حفظ النتيجة المفككة
+                    orders_df = save_order_store(orders_df, os.path.join("data", ORDER_STORE_FILE))
+                    st.success(f"✅ تم التفكيك! {len(orders_df):,} صف من {total_rows:,} طلب")
         
-        # استخراج السنة والشهر مع استكمال النواقص من التاريخ المحوّل
-        year_series = orders_df.get('year')
-        if year_series is None:
-            year_series = pd.Series(dtype='float64', index=orders_df.index)
-        month_series = orders_df.get('month')
-        if month_series is None:
-            month_series = pd.Series(dtype='float64', index=orders_df.index)
-
-        # التأكد أن العمود datetime قبل استخدام .dt accessor
-        # استخراج السنة والشهر فقط من التواريخ الصالحة
-        if pd.api.types.is_datetime64_any_dtype(orders_df['order_date']):
-            valid_dates_mask = orders_df['order_date'].notna()
-            if valid_dates_mask.any():
-                orders_df.loc[valid_dates_mask, 'year'] = year_series[valid_dates_mask].fillna(
-                    orders_df.loc[valid_dates_mask, 'order_date'].dt.year
-                )
-                orders_df.loc[valid_dates_mask, 'month'] = month_series[valid_dates_mask].fillna(
-                    orders_df.loc[valid_dates_mask, 'order_date'].dt.month
-                )
-                orders_df.loc[valid_dates_mask, 'year_month'] = (
-                    orders_df.loc[valid_dates_mask, 'order_date'].dt.to_period('M').astype(str)
-                )
-            else:
-                # لا توجد تواريخ صالحة، نستخدم القيم الموجودة فقط
-                orders_df['year'] = year_series
-                orders_df['month'] = month_series
-                orders_df['year_month'] = None
-        else:
-            # العمود ليس datetime، نحاول التحويل مرة أخرى
-            orders_df['order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
+            # استخراج السنة والشهر مع استكمال النواقص من التاريخ المحوّل
+            year_series = orders_df.get('year')
+            if year_series is None:
+                year_series = pd.Series(dtype='float64', index=orders_df.index)
+            month_series = orders_df.get('month')
+            if month_series is None:
+                month_series = pd.Series(dtype='float64', index=orders_df.index)
+
+            # التأكد أن العمود datetime قبل استخدام .dt accessor
+            # استخراج السنة والشهر فقط من التواريخ الصالحة
             if pd.api.types.is_datetime64_any_dtype(orders_df['order_date']):
-                # نجح التحويل، نحاول مرة أخرى
                 valid_dates_mask = orders_df['order_date'].notna()
                 if valid_dates_mask.any():
                     orders_df.loc[valid_dates_mask, 'year'] = year_series[valid_dates_mask].fillna(
@@ -4025,26 +3982,53 @@ elif st.session_state.page == "salla_analysis":
                     orders_df.loc[valid_dates_mask, 'year_month'] = (
                         orders_df.loc[valid_dates_mask, 'order_date'].dt.to_period('M').astype(str)
                     )
+                else:
+                    # لا توجد تواريخ صالحة، نستخدم القيم الموجودة فقط
+                    orders_df['year'] = year_series
+                    orders_df['month'] = month_series
+                    orders_df['year_month'] = None
             else:
-                # فشل التحويل تماماً
-                orders_df['year'] = year_series
-                orders_df['month'] = month_series
-                orders_df['year_month'] = None
+                # العمود ليس datetime، نحاول التحويل مرة أخرى
+                orders_df['order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
+                if pd.api.types.is_datetime64_any_dtype(orders_df['order_date']):
+                    # نجح التحويل، نحاول مرة أخرى
+                    valid_dates_mask = orders_df['order_date'].notna()
+                    if valid_dates_mask.any():
+                        orders_df.loc[valid_dates_mask, 'year'] = year_series[valid_dates_mask].fillna(
+                            orders_df.loc[valid_dates_mask, 'order_date'].dt.year
+                        )
+                        orders_df.loc[valid_dates_mask, 'month'] = month_series[valid_dates_mask].fillna(
+                            orders_df.loc[valid_dates_mask, 'order_date'].dt.month
+                        )
+                        orders_df.loc[valid_dates_mask, 'year_month'] = (
+                            orders_df.loc[valid_dates_mask, 'order_date'].dt.to_period('M').astype(str)
+                        )
+                else:
+                    # فشل التحويل تماماً
+                    orders_df['year'] = year_series
+                    orders_df['month'] = month_series
+                    orders_df['year_month'] = None
         
-    except Exception as e:
-        st.error(f"❌ خطأ في قراءة الملف: {e}")
-        import traceback
-        st.code(traceback.format_exc())
-        st.stop()
+        except Exception as e:
+            st.error(f"❌ خطأ في قراءة الملف: {e}")
+            import traceback
+            st.code(traceback.format_exc())
+            st.stop()
 
     # ========== الفلاتر أعلى الصفحة ==========
     st.markdown("### 🔍 فلاتر التحليل")
     
     col_f1, col_f2, col_f3, col_f4, col_f5 = st.columns(5)
     
+    # قيم الفلاتر: من ملف الأبعاد في المخزن المقسّم، أو من الجدول المحمّل
+    if partitioned_store:
+        dimensions = load_order_dimensions_cached(exploded_file, os.path.getmtime(exploded_file))
+    else:
+        dimensions = order_dimensions(orders_df)
+    
     # فلتر السنة
     with col_f1:
-        years = sorted(orders_df['year'].dropna().unique().astype(int))
+        years = dimensions["year"]
         selected_year = st.selectbox("📅 السنة", ["الكل"] + years, key="salla_year_filter")
     
     # فلتر الشهر
@@ -4054,43 +4038,40 @@ elif st.session_state.page == "salla_analysis":
             5: "مايو", 6: "يونيو", 7: "يوليو", 8: "أغسطس",
             9: "سبتمبر", 10: "أكتوبر", 11: "نوفمبر", 12: "ديسمبر"
         }
-        months = sorted(orders_df['month'].dropna().unique().astype(int))
+        months = dimensions["month"]
         month_options = ["الكل"] + [f"{months_ar.get(m, m)} ({m})" for m in months]
         selected_month = st.selectbox("📆 الشهر", month_options, key="salla_month_filter")
     
     # فلتر حالة الطلب
     with col_f3:
-        statuses = ["الكل"] + sorted(orders_df['status'].dropna().unique().tolist())
+        statuses = ["الكل"] + dimensions["status"]
         selected_status = st.selectbox("📋 حالة الطلب", statuses, key="salla_status_filter")
     
     # فلتر المدينة
     with col_f4:
-        cities = ["الكل"] + sorted(orders_df['city'].dropna().unique().tolist())
+        cities = ["الكل"] + dimensions["city"]
         selected_city = st.selectbox("🏙️ المدينة", cities, key="salla_city_filter")
     
     # فلتر طريقة الدفع
     with col_f5:
-        payments = ["الكل"] + sorted(orders_df['payment_method'].dropna().unique().tolist())
+        payments = ["الكل"] + dimensions["payment"]
         selected_payment = st.selectbox("💳 طريقة الدفع", payments, key="salla_payment_filter")
     
     # تطبيق الفلاتر
-    filtered_df = orders_df.copy()
-    
-    if selected_year != "الكل":
-        filtered_df = filtered_df[filtered_df['year'] == selected_year]
-    
-    if selected_month != "الكل":
-        month_num = int(selected_month.split("(")[1].split(")")[0])
-        filtered_df = filtered_df[filtered_df['month'] == month_num]
-    
-    if selected_status != "الكل":
-        filtered_df = filtered_df[filtered_df['status'] == selected_status]
-    
-    if selected_city != "الكل":
-        filtered_df = filtered_df[filtered_df['city'] == selected_city]
-    
-    if selected_payment != "الكل":
-        filtered_df = filtered_df[filtered_df['payment_method'] == selected_payment]
+    filters = {
+        "year": selected_year,
+        "month": int(selected_month.split("(")[1].split(")")[0]) if selected_month != "الكل" else "الكل",
+        "status": selected_status,
+        "city": selected_city,
+        "payment": selected_payment,
+    }
+    if partitioned_store:
+        # قراءة أقسام السنة/الشهر المطابقة فقط
+        filtered_df = load_filtered_orders_cached(
+            exploded_file, filters, os.path.getmtime(exploded_file), SALLA_ANALYSIS_COLUMNS,
+        )
+    else:
+        filtered_df = process_salla_data_lite(orders_df, filters)
     
     # زر لتوليد التحليلات وحفظها
     if st.button("🔄 تحديث وحفظ جميع التحليلات", type="primary"):
@@ -4098,8 +4079,8 @@ elif st.session_state.page == "salla_analysis":
             try:
                 from pricing_app.salla_insights import SallaInsights
                 # تحديد الملف المتاح
-                if os.path.exists("data/salla_orders_exploded.csv"):
-                    data_file = "data/salla_orders_exploded.csv"
+                if os.path.exists(exploded_file):
+                    data_file = exploded_file
                 elif os.path.exists("data/salla_orders.csv"):
                     data_file = "data/salla_orders.csv"
                 else:
@@ -4143,7 +4124,7 @@ elif st.session_state.page == "salla_analysis":
     st.subheader("🏆 أكثر المنتجات والبكجات مبيعًا")
     
     # حساب الكميات حسب SKU
-    sku_sales = filtered_df.groupby(['sku_code', 'sku_name'])['qty'].sum().reset_index()
+    sku_sales = filtered_df.groupby(['sku_code', 'sku_name'], observed=True)['qty'].sum().reset_index()
     sku_sales = sku_sales.sort_values('qty', ascending=False)
     sku_sales.columns = ['كود المنتج', 'اسم المنتج', 'الكمية المباعة']
     
@@ -4161,7 +4142,7 @@ elif st.session_state.page == "salla_analysis":
     # ========== المبيعات حسب المدينة ==========
     st.subheader("🗺️ المبيعات حسب المدينة")
     
-    city_sales = filtered_df.groupby('city').agg({
+    city_sales = filtered_df.groupby('city', observed=True).agg({
         'order_id': 'nunique',
         'qty': 'sum',
         'sku_code': 'nunique'
@@ -4176,9 +4157,9 @@ elif st.session_state.page == "salla_analysis":
     with col2:
         # أكثر منتج مبيع في كل مدينة
         st.markdown("**🏆 أكثر منتج مبيعًا لكل مدينة**")
-        top_per_city = filtered_df.groupby(['city', 'sku_code', 'sku_name'])['qty'].sum().reset_index()
+        top_per_city = filtered_df.groupby(['city', 'sku_code', 'sku_name'], observed=True)['qty'].sum().reset_index()
         top_per_city = top_per_city.sort_values(['city', 'qty'], ascending=[True, False])
-        top_per_city = top_per_city.groupby('city').first().reset_index()
+        top_per_city = top_per_city.groupby('city', observed=True).first().reset_index()
         top_per_city.columns = ['المدينة', 'كود المنتج', 'اسم المنتج', 'الكمية']
         st.dataframe(top_per_city, hide_index=True, use_container_width=True)
 
@@ -4187,7 +4168,7 @@ elif st.session_state.page == "salla_analysis":
     # ========== المبيعات حسب طريقة الدفع ==========
     st.subheader("💳 المبيعات حسب طريقة الدفع")
     
-    payment_sales = filtered_df.groupby('payment_method').agg({
+    payment_sales = filtered_df.groupby('payment_method', observed=True).agg({
         'order_id': 'nunique',
         'qty': 'sum',
         'sku_code': 'nunique'
@@ -4202,9 +4183,9 @@ elif st.session_state.page == "salla_analysis":
     with col2:
         # أكثر منتج مبيع لكل طريقة دفع
         st.markdown("**🏆 أكثر منتج مبيعًا لكل طريقة دفع**")
-        top_per_payment = filtered_df.groupby(['payment_method', 'sku_code', 'sku_name'])['qty'].sum().reset_index()
+        top_per_payment = filtered_df.groupby(['payment_method', 'sku_code', 'sku_name'], observed=True)['qty'].sum().reset_index()
         top_per_payment = top_per_payment.sort_values(['payment_method', 'qty'], ascending=[True, False])
-        top_per_payment = top_per_payment.groupby('payment_method').first().reset_index()
+        top_per_payment = top_per_payment.groupby('payment_method', observed=True).first().reset_index()
         top_per_payment.columns = ['طريقة الدفع', 'كود المنتج', 'اسم المنتج', 'الكمية']
         st.dataframe(top_per_payment, hide_index=True, use_container_width=True)
 
@@ -4213,7 +4194,7 @@ elif st.session_state.page == "salla_analysis":
     # ========== المبيعات حسب الحالة ==========
     st.subheader("📋 المبيعات حسب حالة الطلب")
     
-    status_sales = filtered_df.groupby('status').agg({
+    status_sales = filtered_df.groupby('status', observed=True).agg({
         'order_id': 'nunique',
         'qty': 'sum',
         'sku_code': 'nunique'
@@ -4442,7 +4423,7 @@ elif st.session_state.page == "salla_analysis":
                         st.metric("منتجات / بكجات", f"{products} / {packages}")
                     
                     st.markdown("**التفاصيل:**")
-                    cost_summary = sales_with_cost.groupby(['sku_code', 'sku_name', 'item_type']).agg({
+                    cost_summary = sales_with_cost.groupby(['sku_code', 'sku_name', 'item_type'], observed=True).agg({
                         'qty': 'sum',
                         'unit_cogs': 'first',
                         'total_cogs': 'sum',
@@ -4512,24 +4493,24 @@ elif st.session_state.page == "salla_analysis":
                     st.markdown("### 🏙️ أفضل منتج لكل مدينة")
                     top_city = (
                         filtered_df.dropna(subset=['city'])
-                        .groupby(['city', 'sku_code', 'sku_name'])['qty']
+                        .groupby(['city', 'sku_code', 'sku_name'], observed=True)['qty']
                         .sum()
                         .reset_index()
                         .sort_values(['city', 'qty'], ascending=[True, False])
                     )
-                    top_city = top_city.groupby('city').head(1).reset_index(drop=True)
+                    top_city = top_city.groupby('city', observed=True).head(1).reset_index(drop=True)
                     top_city.columns = ['المدينة', 'SKU', 'اسم المنتج', 'الكمية']
                     st.dataframe(top_city, hide_index=True, use_container_width=True)
 
                     st.markdown("### 💳 أفضل منتج لكل طريقة دفع")
                     top_payment = (
                         filtered_df.dropna(subset=['payment_method'])
-                        .groupby(['payment_method', 'sku_code', 'sku_name'])['qty']
+                        .groupby(['payment_method', 'sku_code', 'sku_name'], observed=True)['qty']
                         .sum()
                         .reset_index()
                         .sort_values(['payment_method', 'qty'], ascending=[True, False])
                     )
-                    top_payment = top_payment.groupby('payment_method').head(1).reset_index(drop=True)
+                    top_payment = top_payment.groupby('payment_method', observed=True).head(1).reset_index(drop=True)
                     top_payment.columns = ['طريقة الدفع', 'SKU', 'اسم المنتج', 'الكمية']
                     st.dataframe(top_payment, hide_index=True, use_container_width=True)
             
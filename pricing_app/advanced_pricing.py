@@ -1,9 +1,14 @@
+import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, Tuple, Union
+
+from .compiled_channel import NUMERIC_FIELDS, CompiledChannel, as_compiled_channel
+
+FeeModel = Union[Dict, CompiledChannel]
 
 def calculate_breakeven_price(
     cogs: float,
-    channel_fees: Dict,
+    channel_fees: FeeModel,
     shipping: float = 0,
     preparation: float = 0,
     discount_rate: float = 0.1,
@@ -22,27 +27,21 @@ def calculate_breakeven_price(
     D × (1 - admin% - marketing% - payment% - custom%) = COGS + شحن + تجهيز + رسوم مخصصة ثابتة
     
     ثم تحويل السعر الصافي إلى سعر شامل الضريبة قبل الخصم
+
+    channel_fees: قاموس الرسوم، أو CompiledChannel (ويحمل عندها الشحن والتحضير والخصم والضريبة والرسوم المخصصة)
     """
     
-    if custom_fees is None:
-        custom_fees = {}
-    
-    # حساب نسب الرسوم
-    admin_pct = channel_fees.get('opex_pct', 0.04)
-    marketing_pct = channel_fees.get('marketing_pct', 0.28)
-    platform_pct = channel_fees.get('platform_pct', 0.0)
-    total_pct = admin_pct + marketing_pct + platform_pct
-    
-    # حساب الرسوم الثابتة والنسبية المخصصة
-    custom_fixed_fees = 0
-    custom_pct_fees = 0
+    ch = as_compiled_channel(
+        channel_fees, shipping=shipping, preparation=preparation, discount_rate=discount_rate,
+        vat_rate=vat_rate, free_shipping_threshold=free_shipping_threshold, custom_fees=custom_fees,
+    )
+    shipping, preparation = ch.shipping_fixed, ch.preparation_fee
+    discount_rate, vat_rate = ch.discount_rate, ch.vat_rate
+    total_pct = ch.channel_pct
     
-    if custom_fees:
-        for fee_name, fee_data in custom_fees.items():
-            if fee_data.get('fee_type') == 'percentage':
-                custom_pct_fees += fee_data['amount']
-            else:
-                custom_fixed_fees += fee_data['amount']
+    # الرسوم الثابتة والنسبية المخصصة (محسوبة مسبقاً في القناة المُجمّعة)
+    custom_fixed_fees = ch.custom_fixed
+    custom_pct_fees = ch.custom_pct
     
     # المجموع الثابت = COGS + شحن + تجهيز + رسوم مخصصة ثابتة
     fixed_costs = cogs + shipping + preparation + custom_fixed_fees
@@ -74,7 +73,7 @@ def calculate_breakeven_price(
 
 def calculate_price_breakdown(
     cogs: float,
-    channel_fees: Dict,
+    channel_fees: FeeModel,
     shipping: float = 0,
     preparation: float = 0,
     discount_rate: float = 0.1,
@@ -94,15 +93,22 @@ def calculate_price_breakdown(
     - نحسب السعر بناءً على COGS والهامش المستهدف
     
     ملاحظة: رسوم المنصات لا تُحسب (تم إزالتها)
+
+    channel_fees: قاموس الرسوم، أو CompiledChannel (ويحمل عندها الشحن والتحضير والخصم والضريبة والحد والرسوم المخصصة)
     """
     
-    if custom_fees is None:
-        custom_fees = {}
+    ch = as_compiled_channel(
+        channel_fees, shipping=shipping, preparation=preparation, discount_rate=discount_rate,
+        vat_rate=vat_rate, free_shipping_threshold=free_shipping_threshold, custom_fees=custom_fees,
+    )
+    shipping, preparation = ch.shipping_fixed, ch.preparation_fee
+    discount_rate, vat_rate = ch.discount_rate, ch.vat_rate
+    free_shipping_threshold = ch.free_shipping_threshold
     
     # حساب نسبة الرسوم الإجمالية
-    admin_pct = channel_fees.get('opex_pct', 0.04)  # مصاريف إدارية (H)
-    marketing_pct = channel_fees.get('marketing_pct', 0.28)  # مصاريف تسويق (I)
-    platform_pct = channel_fees.get('platform_pct', 0.0)  # رسوم المنصة (K)
+    admin_pct = ch.opex_pct  # مصاريف إدارية (H)
+    marketing_pct = ch.marketing_pct  # مصاريف تسويق (I)
+    platform_pct = ch.platform_pct  # رسوم المنصة (K)
     
     # Step 1: حساب السعر الصافي بدون ضريبة وبدون خصم
     if price_with_vat is not None and price_with_vat > 0:
@@ -160,23 +166,11 @@ def calculate_price_breakdown(
 
     total_fees = admin_fee + marketing_fee + platform_fee  # مجموع الرسوم النسبية
     
-    # حساب الرسوم الإضافية المخصصة مع تتبع الثابت والنِسبي
-    custom_fees_dict = {}
-    custom_fees_total = 0
-    custom_fixed_fees = 0
-    custom_pct_fees = 0
-    if custom_fees:
-        for fee_name, fee_data in custom_fees.items():
-            if fee_data.get('fee_type') == 'percentage':
-                # نسبة من السعر بعد الخصم بدون ضريبة
-                fee_amount = net_price_excl_vat_and_discount * fee_data['amount']
-                custom_pct_fees += fee_data['amount']
-            else:
-                # مبلغ ثابت
-                fee_amount = fee_data['amount']
-                custom_fixed_fees += fee_amount
-            custom_fees_dict[fee_name] = fee_amount
-            custom_fees_total += fee_amount
+    # حساب الرسوم الإضافية المخصصة (النسبية من السعر بعد الخصم بدون ضريبة، والثابتة بالريال)
+    custom_fees_dict = ch.custom_fee_amounts(net_price_excl_vat_and_discount)
+    custom_fees_total = sum(custom_fees_dict.values())
+    custom_fixed_fees = ch.custom_fixed
+    custom_pct_fees = ch.custom_pct
     
     # تحديد ما إذا كان الشحن والتجهيز مجاني بناءً على حد منصة سلة
     # قاعدة سلة البسيطة: إذا السعر النهائي < 98 ريال → شحن وتحضير = 0 (تلقائياً)
@@ -270,6 +264,279 @@ def calculate_price_breakdown(
         'margin_prices': margin_prices  # أسعار البيع المطلوبة لهوامش 0%/5%/10%/15%/20%
     }
 
+def _compile(channel_fees, shipping, preparation, discount_rate, vat_rate, free_shipping_threshold, custom_fees):
+    return as_compiled_channel(
+        channel_fees, shipping=shipping, preparation=preparation, discount_rate=discount_rate,
+        vat_rate=vat_rate, free_shipping_threshold=free_shipping_threshold, custom_fees=custom_fees,
+    )
+
+
+def price_for_margin_array(
+    cogs,
+    channel_fees: FeeModel,
+    target_margin=0.10,
+    shipping=0,
+    preparation=0,
+    discount_rate=0.1,
+    vat_rate=0.15,
+    free_shipping_threshold=0,
+    custom_fees: Dict = None
+) -> np.ndarray:
+    """
+    نسخة مصفوفية من margin_prices في calculate_price_breakdown:
+    سعر البيع شامل الضريبة قبل الخصم لتحقيق الهامش، لأي شكل من COGS والهوامش ومعاملات القناة (broadcasting)
+    """
+    ch = _compile(channel_fees, shipping, preparation, discount_rate, vat_rate, free_shipping_threshold, custom_fees)
+    cogs = np.asarray(cogs, dtype=float)
+    denom = 1 - ch.variable_pct - np.asarray(target_margin, dtype=float)
+    valid = (denom > 0) & (np.asarray(ch.discount_rate) < 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        def calc_price(fixed_costs):
+            return np.where(valid, fixed_costs / denom / ch.net_factor, 0.0)
+
+        price_with_fees = calc_price(cogs + ch.fulfilment + ch.custom_fixed)
+        price_free_fees = calc_price(cogs + ch.custom_fixed)
+    under_threshold = ch.has_threshold & (price_free_fees > 0) & (price_free_fees < ch.free_shipping_threshold)
+    fallback = ch.has_threshold & ~(price_with_fees > 0)
+    return np.where(under_threshold | fallback, price_free_fees, price_with_fees)
+
+
+def margin_at_price_array(
+    price_with_vat,
+    cogs,
+    channel_fees: FeeModel,
+    shipping=0,
+    preparation=0,
+    discount_rate=0.1,
+    vat_rate=0.15,
+    free_shipping_threshold=0,
+    custom_fees: Dict = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    نسخة مصفوفية من وضع "السعر المدخل" في calculate_price_breakdown
+    Returns: (الربح, نسبة الهامش) لكل زوج سعر/COGS (broadcasting)
+    """
+    ch = _compile(channel_fees, shipping, preparation, discount_rate, vat_rate, free_shipping_threshold, custom_fees)
+    price_with_vat = np.asarray(price_with_vat, dtype=float)
+    cogs = np.asarray(cogs, dtype=float)
+
+    net_price = price_with_vat * ch.net_factor
+    fulfilment = np.where(ch.is_free_fulfilment(price_with_vat), 0.0, ch.fulfilment)
+    profit = net_price * (1 - ch.variable_pct) - cogs - fulfilment - ch.custom_fixed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margin = np.where(net_price > 0, profit / net_price, 0.0)
+    return profit, margin
+
+
+def solve_price_for_margin_array(
+    cogs,
+    channel_fees: FeeModel,
+    target_margin=0.10,
+    shipping=0,
+    preparation=0,
+    discount_rate=0.1,
+    vat_rate=0.15,
+    free_shipping_threshold=0,
+    custom_fees: Dict = None
+) -> np.ndarray:
+    """
+    السعر (شامل الضريبة قبل الخصم) الذي يعطي الهامش المستهدف بالضبط في calculate_price_breakdown(price_with_vat=...)
+
+    الهامش = 1 - النسب - (COGS + الشحن والتحضير + الرسوم الثابتة) / D، و D = السعر × (1 - خصم) / (1 + ضريبة)،
+    فهو خطي في 1/D داخل كل منطقة من منطقتي حد الشحن المجاني:
+    - تحت الحد: بدون شحن/تحضير، والحل مقبول إذا كان أقل من الحد (الأرخص للعميل، مثل margin_prices)
+    - فوق الحد: مع الشحن والتحضير، والحل مقبول إذا كان ≥ الحد
+    إذا لم يوجد حل تحليلي (رسوم سالبة مثلاً) نرجع لبحث جذري محصور؛ الهامش غير القابل للتحقيق = NaN
+    """
+    ch = _compile(channel_fees, shipping, preparation, discount_rate, vat_rate, free_shipping_threshold, custom_fees)
+    cogs = np.atleast_1d(np.asarray(cogs, dtype=float))
+    target_margin = np.asarray(target_margin, dtype=float)
+
+    net_factor = ch.net_factor  # D = السعر × net_factor
+    denom = 1 - ch.variable_pct - target_margin
+    fixed_free = cogs + ch.custom_fixed
+    fixed_paid = fixed_free + ch.fulfilment
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_free = fixed_free / denom / net_factor
+        price_paid = fixed_paid / denom / net_factor
+    solvable = (denom > 0) & (np.asarray(net_factor) > 0)
+    free_ok = solvable & ch.has_threshold & (fixed_free > 0) & (price_free < ch.free_shipping_threshold)
+    paid_ok = solvable & (fixed_paid > 0) & (~ch.has_threshold | (price_paid >= ch.free_shipping_threshold))
+    price = np.where(free_ok, price_free, np.where(paid_ok, price_paid, np.nan))
+
+    # حالات نادرة بدون حل تحليلي: بحث جذري محصور لكل عنصر
+    fallback = np.argwhere(np.isnan(price) & solvable)
+    if len(fallback):
+        price = np.array(price, copy=True)
+        # كل حقول القناة العددية قد تكون مصفوفات لكل صف، فتُؤخذ قيمة الصف من كل منها
+        arrays = np.broadcast_arrays(cogs, target_margin, *(getattr(ch, name) for name in NUMERIC_FIELDS))
+        for idx in map(tuple, fallback):
+            c, m, *row_values = (float(arr[idx]) for arr in arrays)
+            row_channel = CompiledChannel.from_channel(ch, **dict(zip(NUMERIC_FIELDS, row_values)))
+            price[idx] = _bracketed_price_for_margin(c, row_channel, m)
+    return price
+
+
+def _bracketed_price_for_margin(cogs: float, channel: CompiledChannel, target_margin: float) -> float:
+    """
+    أرخص سعر يعطي الهامش المستهدف بالضبط: شبكة أسعار هندسية لإيجاد تغير الإشارة ثم بحث جذري (brentq)؛
+    NaN إذا لم يتقاطع الهامش مع المستهدف (مثلاً رسوم ثابتة سالبة تبقي الهامش فوقه عند كل سعر)
+    """
+    from scipy.optimize import brentq
+
+    def margin_gap(price):
+        _, margin = margin_at_price_array(price, cogs, channel)
+        return np.asarray(margin, dtype=float) - target_margin
+
+    prices = np.geomspace(1e-6, max(abs(cogs), 1.0) * 2.0 ** 60, 600)
+    threshold = float(channel.free_shipping_threshold)
+    if threshold > 0:
+        # طرفا حد الشحن المجاني في الشبكة: قفزة الهامش عنده ليست جذراً
+        prices = np.union1d(prices, [np.nextafter(threshold, 0.0), threshold])
+    gaps = margin_gap(prices)
+    for i in np.flatnonzero(np.sign(gaps[:-1]) * np.sign(gaps[1:]) <= 0):
+        if gaps[i] == 0:
+            return float(prices[i])
+        if gaps[i + 1] == 0:
+            return float(prices[i + 1])
+        root = brentq(lambda price: float(margin_gap(price)), prices[i], prices[i + 1], xtol=1e-9)
+        if abs(float(margin_gap(root))) < 1e-6:
+            return root
+    return float('nan')
+
+
+def solve_price_for_margin(
+    cogs: float,
+    channel_fees: FeeModel,
+    target_margin: float = 0.10,
+    shipping: float = 0,
+    preparation: float = 0,
+    discount_rate: float = 0.1,
+    vat_rate: float = 0.15,
+    free_shipping_threshold: float = 0,
+    custom_fees: Dict = None
+) -> float:
+    """نسخة لعنصر واحد من solve_price_for_margin_array (NaN إذا كان الهامش غير قابل للتحقيق)"""
+    return float(solve_price_for_margin_array(
+        cogs, channel_fees, target_margin, shipping, preparation, discount_rate, vat_rate,
+        free_shipping_threshold, custom_fees,
+    )[0])
+
+
+MARGIN_LADDER = (0.00, 0.05, 0.10, 0.15, 0.20)
+
+
+def calculate_price_breakdown_array(
+    cogs,
+    channel_fees: FeeModel,
+    shipping=0,
+    preparation=0,
+    discount_rate=0.1,
+    vat_rate=0.15,
+    free_shipping_threshold=0,
+    custom_fees: Dict = None,
+    price_with_vat=None,
+    target_margin=0.10,
+    index=None
+) -> pd.DataFrame:
+    """
+    نسخة مصفوفية من calculate_price_breakdown لكتالوج كامل: صف لكل عنصر وعمود لكل حقل
+
+    cogs وأي معامل آخر (بما فيها قيم channel_fees) يمكن أن يكون رقماً أو مصفوفة بطول الكتالوج.
+    price_with_vat: أسعار مدخلة؛ الصف الذي سعره ≤ 0 أو NaN يُسعّر بالهامش المستهدف (مثل الدالة الأصلية).
+    الرسوم المخصصة تظهر في أعمدة custom_fee_<الاسم>، وسلم الهوامش في margin_price_0 … margin_price_20.
+    """
+    ch = _compile(channel_fees, shipping, preparation, discount_rate, vat_rate, free_shipping_threshold, custom_fees)
+    shipping = np.asarray(ch.shipping_fixed, dtype=float)
+    preparation = np.asarray(ch.preparation_fee, dtype=float)
+    discount_rate = np.asarray(ch.discount_rate, dtype=float)
+    vat_rate = np.asarray(ch.vat_rate, dtype=float)
+    cogs = np.atleast_1d(np.asarray(cogs, dtype=float))
+    target_margin = np.asarray(target_margin, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # وضع الهامش المستهدف (نفس فرع else في الدالة الأصلية، بدون الرسوم المخصصة)
+        denom = 1 - ch.channel_pct - target_margin
+        price_factor = 1 / ch.net_factor
+        price_without_shipping = np.where(denom > 0, cogs / denom * price_factor, 0.0)
+        price_with_shipping = np.where(denom > 0, (cogs + ch.fulfilment) / denom * price_factor, 0.0)
+        free_regime = ch.has_threshold & (price_without_shipping > 0) & (price_without_shipping < ch.free_shipping_threshold)
+        target_price = np.where(
+            free_regime,
+            price_without_shipping,
+            np.where(price_with_shipping > 0, price_with_shipping, price_without_shipping),
+        )
+        target_net = np.where(free_regime, cogs, cogs + ch.fulfilment) / denom
+
+        # وضع السعر المدخل
+        if price_with_vat is None:
+            given = np.zeros(1, dtype=bool)
+            price_with_vat = np.zeros(1)
+        else:
+            price_with_vat = np.asarray(price_with_vat, dtype=float)
+            given = price_with_vat > 0
+        given_net = price_with_vat * ch.net_factor
+
+        price_before_discount = np.where(given, price_with_vat, target_price)
+        net_price = np.where(given, given_net, target_net)
+    price_before_discount, net_price, cogs = np.broadcast_arrays(price_before_discount, net_price, cogs)
+
+    discount_amount = price_before_discount * discount_rate
+    price_after_discount = price_before_discount - discount_amount
+
+    admin_fee = net_price * ch.opex_pct
+    marketing_fee = net_price * ch.marketing_pct
+    platform_fee = net_price * ch.platform_pct
+    total_fees = admin_fee + marketing_fee + platform_fee
+
+    custom_columns = {
+        f'custom_fee_{fee_name}': np.broadcast_to(amount, net_price.shape)
+        for fee_name, amount in ch.custom_fee_amounts(net_price).items()
+    }
+    custom_fees_total = net_price * ch.custom_pct + ch.custom_fixed
+
+    free = ch.is_free_fulfilment(price_before_discount)
+    actual_shipping = np.where(free, 0.0, shipping) * np.ones(net_price.shape)
+    actual_preparation = np.where(free, 0.0, preparation) * np.ones(net_price.shape)
+
+    total_costs_fees = cogs + actual_shipping + actual_preparation + total_fees + custom_fees_total
+    profit = net_price - total_costs_fees
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margin_pct = np.where(net_price > 0, profit / net_price, 0.0)
+
+    ladder = {
+        f'margin_price_{round(margin * 100)}': np.broadcast_to(
+            price_for_margin_array(cogs, ch, margin), net_price.shape
+        )
+        for margin in MARGIN_LADDER
+    }
+
+    result = pd.DataFrame({
+        'sale_price': price_before_discount,
+        'discount_amount': discount_amount,
+        'discount_rate': np.broadcast_to(discount_rate, net_price.shape),
+        'price_after_discount': price_after_discount,
+        'vat_rate': np.broadcast_to(vat_rate, net_price.shape),
+        'net_price': net_price,
+        **custom_columns,
+        'custom_fees_total': custom_fees_total,
+        'cogs': cogs,
+        'preparation_fee': actual_preparation,
+        'shipping_fee': actual_shipping,
+        'admin_fee': admin_fee,
+        'marketing_fee': marketing_fee,
+        'platform_fee': platform_fee,
+        'total_costs_fees': total_costs_fees,
+        'profit': profit,
+        'margin_pct': margin_pct,
+        'breakeven_price': ladder['margin_price_0'],
+        **ladder,
+    }, index=index)
+    return result
+
+
 def create_pricing_table(item_sku: str, item_type: str, cogs: float, channel_fees: Dict, 
                          shipping: float = 0, preparation: float = 0, target_margin: float = 0.10) -> pd.DataFrame:
     """إنشاء جدول تفاصيل التسعير الكامل"""
@@ -4,8 +4,27 @@ Professional pricing calculation with comprehensive analysis
 """
 
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import numpy as np
+import pandas as pd
+
+from .compiled_channel import CompiledChannel, as_compiled_channel
+
+# المحرك يعتبر النسب غير المذكورة في قاموس الرسوم صفراً
+ENGINE_FEE_DEFAULTS: Dict[str, float] = {}
+
+# رموز التنبيهات في التقييم الجماعي (نفس شروط _generate_price_alerts)
+MARGIN_BANDS = ["LOSS", "BELOW_MIN", "BELOW_RECOMMENDED", "OK", "EXCELLENT"]
+ALERT_MESSAGES = {
+    "LOSS": "⛔ تحذير: السعر الحالي يحقق خسارة!",
+    "BELOW_MIN": "⚠️ تحذير: هامش الربح أقل من الحد الأدنى المقبول",
+    "BELOW_RECOMMENDED": "💡 ملاحظة: هامش الربح أقل من الموصى به",
+    "EXCELLENT": "✅ ممتاز: هامش ربح ممتاز",
+    "BELOW_BREAKEVEN": "🔴 خطر: السعر أقل من نقطة التعادل",
+    "NEAR_COST": "📊 ملاحظة: السعر قريب جداً من التكلفة، قد يكون هناك مجال لزيادة السعر",
+    "NO_COST": "❓ لا توجد تكلفة لهذا الـ SKU",
+    "NO_CHANNEL": "❓ القناة غير معرفة",
+}
 
 
 @dataclass
@@ -75,7 +94,7 @@ class AdvancedPricingEngine:
         item_type: str,
         channel: str,
         cogs: float,
-        channel_fees: Dict[str, float],
+        channel_fees: Union[Dict[str, float], CompiledChannel],
         shipping: float = 0,
         preparation: float = 0,
         price_with_vat: float = 0,
@@ -83,10 +102,19 @@ class AdvancedPricingEngine:
         custom_fees: Optional[Dict[str, float]] = None,
         free_shipping_threshold: float = 0
     ) -> PricingResult:
-        """حساب تسعير شامل مع تحليل متقدم"""
+        """
+        حساب تسعير شامل مع تحليل متقدم
+
+        channel_fees: قاموس الرسوم، أو CompiledChannel (ويحمل عندها الشحن والتحضير والخصم والضريبة والحد والرسوم المخصصة)
+        """
         
-        if custom_fees is None:
-            custom_fees = {}
+        ch = self._compile(
+            channel_fees, shipping=shipping, preparation=preparation, discount_rate=discount_rate,
+            free_shipping_threshold=free_shipping_threshold, custom_fees=custom_fees,
+        )
+        shipping, preparation = ch.shipping_fixed, ch.preparation_fee
+        discount_rate, free_shipping_threshold = ch.discount_rate, ch.free_shipping_threshold
+        vat_rate = ch.vat_rate
         
         # Apply free shipping/preparation if applicable
         if price_with_vat >= free_shipping_threshold > 0:
@@ -104,20 +132,15 @@ class AdvancedPricingEngine:
         price_after_discount = price_before_discount - discount_amount
         
         # السعر غير شامل الضريبة بعد الخصم = السعر_شامل_بعد_الخصم / 1.15
-        net_price = price_after_discount / (1 + self.vat_rate)
+        net_price = price_after_discount / (1 + vat_rate)
         
         # Calculate fees
-        platform_fee = net_price * channel_fees.get('platform_pct', 0)
-        marketing_fee = net_price * channel_fees.get('marketing_pct', 0)
-        admin_fee = net_price * channel_fees.get('opex_pct', 0)
+        platform_fee = net_price * ch.platform_pct
+        marketing_fee = net_price * ch.marketing_pct
+        admin_fee = net_price * ch.opex_pct
         
         # Calculate custom fees
-        custom_fees_total = {}
-        for fee_name, fee_data in custom_fees.items():
-            if fee_data.get('fee_type') == 'percentage':
-                custom_fees_total[fee_name] = net_price * fee_data.get('amount', 0)
-            else:
-                custom_fees_total[fee_name] = fee_data.get('amount', 0)
+        custom_fees_total = ch.custom_fee_amounts(net_price)
         
         # Total costs
         total_costs = (
@@ -134,7 +157,7 @@ class AdvancedPricingEngine:
         roi = net_profit / total_costs if total_costs > 0 else 0
         
         # Break-even analysis
-        breakeven_price = total_costs * (1 + self.vat_rate)
+        breakeven_price = total_costs * (1 + vat_rate)
         breakeven_units = total_costs / (net_price - cogs) if (net_price - cogs) > 0 else float('inf')
         safety_margin = (price_with_vat - breakeven_price) / price_with_vat if price_with_vat > 0 else 0
         
@@ -144,9 +167,7 @@ class AdvancedPricingEngine:
         )
         
         # Recommended price
-        recommended_price = self._calculate_recommended_price(
-            cogs, channel_fees, shipping, preparation, custom_fees
-        )
+        recommended_price = self._price_at_margin(ch, cogs, shipping + preparation, self.recommended_margin)
         
         return PricingResult(
             sku=sku,
@@ -177,6 +198,111 @@ class AdvancedPricingEngine:
             price_alerts=alerts
         )
     
+    def evaluate_price_list(
+        self,
+        price_list: pd.DataFrame,
+        cogs: Union[pd.Series, Dict[str, float]],
+        channels: Dict[str, object],
+    ) -> pd.DataFrame:
+        """
+        تقييم قائمة أسعار حالية كاملة دفعة واحدة (نفس معادلات calculate_comprehensive_pricing لكل صف)
+
+        price_list: أعمدة SKU, channel, price_with_vat (شامل الضريبة قبل الخصم)
+        cogs: تكلفة كل SKU؛ channels: {الاسم: channels.ChannelFees أو CompiledChannel}
+        معاملات كل قناة تُوزع على الصفوف كمصفوفات فلا يُبنى PricingResult لكل صف.
+        Returns: أعمدة الربحية لكل صف + margin_band (فئة مرتبة MARGIN_BANDS)
+                 و alert_codes (فئة: الرموز مفصولة بـ "|" - انظر ALERT_MESSAGES)
+        """
+        rows = price_list.reset_index(drop=True)
+        compiled = {
+            name: channel if isinstance(channel, CompiledChannel) else CompiledChannel.from_channel(channel)
+            for name, channel in channels.items()
+        }
+        names = list(compiled)
+        # أسماء القنوات في channels.json قد تحمل مسافات زائدة
+        position = rows["channel"].astype(str).str.strip().map({name.strip(): i for i, name in enumerate(names)})
+        known_channel = position.notna().to_numpy()
+        position = position.fillna(0).astype(int).to_numpy()
+
+        def per_row(attribute: str) -> np.ndarray:
+            values = np.array([float(getattr(compiled[name], attribute)) for name in names] or [np.nan])
+            return np.where(known_channel, values[position], np.nan)
+
+        price = rows["price_with_vat"].to_numpy(dtype=float)
+        cost = rows["SKU"].map(pd.Series(cogs, dtype=float)).to_numpy(dtype=float)
+        vat, discount = per_row("vat_rate"), per_row("discount_rate")
+        threshold = per_row("free_shipping_threshold")
+
+        # الشحن والتحضير مجاني إذا كان السعر ≥ الحد (قاعدة المحرك)
+        free = (threshold > 0) & (price >= threshold)
+        shipping = np.where(free, 0.0, per_row("shipping_fixed"))
+        preparation = np.where(free, 0.0, per_row("preparation_fee"))
+
+        price_after_discount = price - price * discount
+        net_price = price_after_discount / (1 + vat)
+        platform_fee = net_price * per_row("platform_pct")
+        marketing_fee = net_price * per_row("marketing_pct")
+        admin_fee = net_price * per_row("opex_pct")
+        custom_fees_total = net_price * per_row("custom_pct") + per_row("custom_fixed")
+        total_costs = cost + shipping + preparation + platform_fee + marketing_fee + admin_fee + custom_fees_total
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            net_profit = net_price - total_costs
+            profit_margin = np.where(net_price > 0, net_profit / net_price, 0.0)
+            markup = np.where(cost > 0, net_profit / cost, 0.0)
+            roi = np.where(total_costs > 0, net_profit / total_costs, 0.0)
+            breakeven_price = total_costs * (1 + vat)
+            breakeven_units = np.where(net_price - cost > 0, total_costs / (net_price - cost), np.inf)
+            safety_margin = np.where(price > 0, (price - breakeven_price) / price, 0.0)
+            denominator = 1 - per_row("channel_pct") - self.recommended_margin
+            recommended_price = np.where(
+                denominator > 0,
+                (cost + shipping + preparation + per_row("custom_fixed")) / denominator * (1 + vat),
+                np.inf,
+            )
+
+        band = np.select(
+            [profit_margin < 0, profit_margin < self.min_profit_margin, profit_margin < self.recommended_margin,
+             profit_margin >= self.excellent_margin],
+            ["LOSS", "BELOW_MIN", "BELOW_RECOMMENDED", "EXCELLENT"],
+            default="OK",
+        )
+        invalid = np.isnan(cost) | ~known_channel
+        codes = np.where(band == "OK", "", band).astype(object)
+        for code, mask in (("BELOW_BREAKEVEN", price < breakeven_price), ("NEAR_COST", net_price < cost * 1.5)):
+            codes = np.where(mask, np.where(codes == "", code, codes + "|" + code), codes)
+        codes = np.where(np.isnan(cost), "NO_COST", codes)
+        codes = np.where(~known_channel, "NO_CHANNEL", codes)
+        band = pd.Categorical(np.where(invalid, None, band), categories=MARGIN_BANDS, ordered=True)
+
+        return pd.DataFrame({
+            "SKU": rows["SKU"],
+            "channel": rows["channel"],
+            "cogs": cost,
+            "price_with_vat": price,
+            "discount_rate": discount,
+            "price_after_discount": price_after_discount,
+            "net_price": net_price,
+            "shipping_fee": shipping,
+            "preparation_fee": preparation,
+            "platform_fee": platform_fee,
+            "marketing_fee": marketing_fee,
+            "admin_fee": admin_fee,
+            "custom_fees_total": custom_fees_total,
+            "total_costs": total_costs,
+            "gross_profit": net_price - cost,
+            "net_profit": net_profit,
+            "profit_margin": profit_margin,
+            "markup_percentage": markup,
+            "roi": roi,
+            "breakeven_price": breakeven_price,
+            "breakeven_units": breakeven_units,
+            "safety_margin": safety_margin,
+            "recommended_price": recommended_price,
+            "margin_band": band,
+            "alert_codes": pd.Categorical(codes),
+        })
+
     def _generate_price_alerts(
         self,
         profit_margin: float,
@@ -205,100 +331,64 @@ class AdvancedPricingEngine:
         
         return alerts
     
+    def _compile(self, channel_fees, shipping=0, preparation=0, discount_rate=0, free_shipping_threshold=0,
+                 custom_fees=None) -> CompiledChannel:
+        """قاموس الرسوم + المعاملات → CompiledChannel (بضريبة المحرك)، والمُجمّع يُستخدم كما هو"""
+        return as_compiled_channel(
+            channel_fees, defaults=ENGINE_FEE_DEFAULTS, shipping=shipping, preparation=preparation,
+            discount_rate=discount_rate, vat_rate=self.vat_rate, free_shipping_threshold=free_shipping_threshold,
+            custom_fees=custom_fees,
+        )
+
+    def _price_at_margin(self, ch: CompiledChannel, cogs: float, fulfilment: float, target_margin: float) -> float:
+        """السعر شامل الضريبة لهامش معين: (COGS + شحن/تحضير + رسوم ثابتة) / (1 - النسب - الهامش) × (1 + ضريبة)"""
+        denominator = 1 - ch.channel_pct - target_margin
+        if denominator <= 0:
+            return float('inf')
+        net_price = (cogs + fulfilment + ch.custom_fixed) / denominator
+        return net_price * (1 + ch.vat_rate)
+
     def _calculate_recommended_price(
         self,
         cogs: float,
-        channel_fees: Dict[str, float],
+        channel_fees: Union[Dict[str, float], CompiledChannel],
         shipping: float,
         preparation: float,
         custom_fees: Optional[Dict[str, float]] = None
     ) -> float:
-        """حساب السعر الموصى به"""
-        
-        # Calculate total percentage fees
-        total_pct = (
-            channel_fees.get('platform_pct', 0) +
-            channel_fees.get('marketing_pct', 0) +
-            channel_fees.get('opex_pct', 0)
-        )
-        
-        # Fixed costs
-        fixed_costs = cogs + shipping + preparation
-        
-        # Add custom fixed fees
-        if custom_fees:
-            for fee_name, fee_data in custom_fees.items():
-                if fee_data.get('fee_type') == 'fixed':
-                    fixed_costs += fee_data.get('amount', 0)
-        
-        # Calculate recommended net price (15% margin)
-        denominator = 1 - total_pct - self.recommended_margin
-        
-        if denominator <= 0:
-            return float('inf')
-        
-        net_price = fixed_costs / denominator
-        
-        # Return price with VAT
-        return net_price * (1 + self.vat_rate)
+        """حساب السعر الموصى به (هامش 15%)"""
+        ch = self._compile(channel_fees, shipping=shipping, preparation=preparation, custom_fees=custom_fees)
+        return self._price_at_margin(ch, cogs, ch.fulfilment, self.recommended_margin)
     
     def calculate_price_at_margin(
         self,
         cogs: float,
         target_margin: float,
-        channel_fees: Dict[str, float],
+        channel_fees: Union[Dict[str, float], CompiledChannel],
         shipping: float = 0,
         preparation: float = 0,
         custom_fees: Optional[Dict[str, float]] = None
     ) -> float:
         """حساب السعر المطلوب لتحقيق هامش ربح معين"""
-        
-        if custom_fees is None:
-            custom_fees = {}
-        
-        # Calculate total percentage fees
-        total_pct = (
-            channel_fees.get('platform_pct', 0) +
-            channel_fees.get('marketing_pct', 0) +
-            channel_fees.get('opex_pct', 0)
-        )
-        
-        # Fixed costs
-        fixed_costs = cogs + shipping + preparation
-        
-        # Add custom fixed fees
-        for fee_name, fee_data in custom_fees.items():
-            if fee_data.get('fee_type') == 'fixed':
-                fixed_costs += fee_data.get('amount', 0)
-        
-        # Calculate net price for target margin
-        denominator = 1 - total_pct - target_margin
-        
-        if denominator <= 0:
-            return float('inf')
-        
-        net_price = fixed_costs / denominator
-        
-        # Return price with VAT
-        return net_price * (1 + self.vat_rate)
+        ch = self._compile(channel_fees, shipping=shipping, preparation=preparation, custom_fees=custom_fees)
+        return self._price_at_margin(ch, cogs, ch.fulfilment, target_margin)
     
     def calculate_margin_scenarios(
         self,
         cogs: float,
-        channel_fees: Dict[str, float],
+        channel_fees: Union[Dict[str, float], CompiledChannel],
         shipping: float = 0,
         preparation: float = 0,
         custom_fees: Optional[Dict[str, float]] = None
     ) -> Dict[float, float]:
         """حساب سيناريوهات هوامش ربح مختلفة"""
         
+        ch = self._compile(channel_fees, shipping=shipping, preparation=preparation, custom_fees=custom_fees)
         scenarios = {}
         margins = [0.00, 0.05, 0.10, 0.15, 0.20, 0.25, 0.30, 0.35, 0.40]
         
         for margin in margins:
-            price = self.calculate_price_at_margin(
-                cogs, margin, channel_fees, shipping, preparation, custom_fees
-            )
+            price = self._price_at_margin(ch, cogs, ch.fulfilment, margin)
             if price != float('inf'):
                 scenarios[margin] = price
         
@@ -308,61 +398,34 @@ class AdvancedPricingEngine:
         self,
         base_cogs: float,
         base_price: float,
-        channel_fees: Dict[str, float],
+        channel_fees: Union[Dict[str, float], CompiledChannel],
         shipping: float = 0,
         preparation: float = 0
     ) -> Dict[str, List[Dict[str, float]]]:
         """تحليل الحساسية للتغيرات في التكلفة والسعر"""
         
-        results = {
-            'cogs_sensitivity': [],
-            'price_sensitivity': []
-        }
+        ch = self._compile(channel_fees, shipping=shipping, preparation=preparation)
+        shipping, preparation = ch.shipping_fixed, ch.preparation_fee
+        total_pct = ch.channel_pct
         
+        changes = np.arange(-0.2, 0.21, 0.05)
+
+        def rows(value_key, values, net_prices, cogs_values):
+            fees = net_prices * total_pct
+            profits = net_prices - (cogs_values + shipping + preparation + fees)
+            margins = np.where(net_prices > 0, profits / np.where(net_prices > 0, net_prices, 1), 0)
+            return [
+                {'change_pct': change * 100, value_key: value, 'profit': profit, 'margin': margin * 100}
+                for change, value, profit, margin in zip(changes, values, profits, margins)
+            ]
+
         # COGS sensitivity (-20% to +20%)
-        for change_pct in np.arange(-0.2, 0.21, 0.05):
-            new_cogs = base_cogs * (1 + change_pct)
-            net_price = base_price / (1 + self.vat_rate)
-            
-            total_pct = sum([
-                channel_fees.get('platform_pct', 0),
-                channel_fees.get('marketing_pct', 0),
-                channel_fees.get('opex_pct', 0)
-            ])
-            
-            fees = net_price * total_pct
-            total_costs = new_cogs + shipping + preparation + fees
-            profit = net_price - total_costs
-            margin = profit / net_price if net_price > 0 else 0
-            
-            results['cogs_sensitivity'].append({
-                'change_pct': change_pct * 100,
-                'cogs': new_cogs,
-                'profit': profit,
-                'margin': margin * 100
-            })
-        
+        new_cogs = base_cogs * (1 + changes)
+        base_net = np.full_like(changes, base_price / (1 + ch.vat_rate))
         # Price sensitivity (-20% to +20%)
-        for change_pct in np.arange(-0.2, 0.21, 0.05):
-            new_price = base_price * (1 + change_pct)
-            net_price = new_price / (1 + self.vat_rate)
-            
-            total_pct = sum([
-                channel_fees.get('platform_pct', 0),
-                channel_fees.get('marketing_pct', 0),
-                channel_fees.get('opex_pct', 0)
-            ])
-            
-            fees = net_price * total_pct
-            total_costs = base_cogs + shipping + preparation + fees
-            profit = net_price - total_costs
-            margin = profit / net_price if net_price > 0 else 0
-            
-            results['price_sensitivity'].append({
-                'change_pct': change_pct * 100,
-                'price': new_price,
-                'profit': profit,
-                'margin': margin * 100
-            })
-        
-        return results
+        new_prices = base_price * (1 + changes)
+
+        return {
+            'cogs_sensitivity': rows('cogs', new_cogs, base_net, new_cogs),
+            'price_sensitivity': rows('price', new_prices, new_prices / (1 + ch.vat_rate), base_cogs),
+        }
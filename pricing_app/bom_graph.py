@@ -0,0 +1,171 @@
+"""
+مُحلّل تكلفة البكجات المتداخلة - BOM Graph Resolver
+Costs nested packages in one topological pass and reports cycles / dangling references
+"""
+
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from .models import Material
+
+
+@dataclass
+class BOMReport:
+    """نتيجة حل شجرة المكونات مع تقرير الأخطاء"""
+    costs: Dict[str, float]
+    order: List[str]  # ترتيب الحساب (المكونات قبل البكجات التي تحتويها)
+    cycles: List[List[str]] = field(default_factory=list)  # كل دورة كقائمة SKU
+    dangling: List[Tuple[str, str]] = field(default_factory=list)  # (SKU الأب, مكون غير معروف)
+    blocked: List[str] = field(default_factory=list)  # تعتمد على دورة أو مكون مفقود فلم تُحسب
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.cycles or self.dangling or self.blocked)
+
+    @property
+    def unresolved(self) -> List[str]:
+        """كل SKU لم يتم حساب تكلفته (داخل دورة أو معتمد عليها)"""
+        in_cycles = [sku for cycle in self.cycles for sku in cycle]
+        return in_cycles + self.blocked
+
+    def errors_frame(self) -> pd.DataFrame:
+        """جدول الأخطاء: SKU, issue (cycle/dangling/blocked), detail"""
+        rows = []
+        for cycle in self.cycles:
+            path = " → ".join(cycle + cycle[:1])
+            for sku in cycle:
+                rows.append({"SKU": sku, "issue": "cycle", "detail": path})
+        for parent, component in self.dangling:
+            rows.append({"SKU": parent, "issue": "dangling", "detail": component})
+        for sku in self.blocked:
+            rows.append({"SKU": sku, "issue": "blocked", "detail": ""})
+        return pd.DataFrame(rows, columns=["SKU", "issue", "detail"])
+
+
+def _find_cycles(graph: Dict[str, List[str]]) -> List[List[str]]:
+    """Tarjan SCC (iterative) - returns strongly connected components that form cycles"""
+    index: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack = set()
+    cycles = []
+    counter = 0
+
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph.get(child, ()))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                scc = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    scc.append(member)
+                    if member == node:
+                        break
+                if len(scc) > 1 or node in graph.get(node, ()):
+                    cycles.append(scc[::-1])
+    return cycles
+
+
+def resolve_costs(
+    compositions: Dict[str, Dict[str, float]],
+    leaf_costs: Dict[str, float],
+    strict: bool = False,
+) -> BOMReport:
+    """
+    حساب تكلفة كل SKU مركب في مرور طوبولوجي واحد O(V+E)
+
+    compositions: {SKU مركب: {مكون: كمية}} - المكون قد يكون ورقة (مادة/منتج محسوب) أو SKU مركب آخر
+    leaf_costs: تكلفة الوحدة للمكونات النهائية (لها الأولوية عند تكرار SKU)
+    strict: إذا True لا تُحسب البكجات التي تحتوي مكوناً مفقوداً (ولا ما يعتمد عليها)،
+            وإلا يُحسب المكون المفقود بصفر ويظهر في التقرير
+    """
+    pending: Dict[str, int] = {}
+    parents: Dict[str, List[str]] = defaultdict(list)
+    children: Dict[str, List[str]] = {}
+    dangling: List[Tuple[str, str]] = []
+    broken = set()
+
+    for sku, components in compositions.items():
+        composite_children = []
+        for comp in components:
+            if comp in leaf_costs:
+                continue
+            if comp in compositions:
+                composite_children.append(comp)
+                parents[comp].append(sku)
+            else:
+                dangling.append((sku, comp))
+                broken.add(sku)
+        children[sku] = composite_children
+        pending[sku] = len(composite_children)
+
+    costs: Dict[str, float] = {}
+    order: List[str] = []
+    failed = set()
+    queue = deque(sku for sku, n in pending.items() if n == 0)
+
+    while queue:
+        sku = queue.popleft()
+        if (strict and sku in broken) or any(child in failed for child in children[sku]):
+            failed.add(sku)
+        else:
+            total = 0.0
+            for comp, qty in compositions[sku].items():
+                if comp in leaf_costs:
+                    total += leaf_costs[comp] * qty
+                elif comp in costs:
+                    total += costs[comp] * qty
+            costs[sku] = total
+            order.append(sku)
+        for parent in parents[sku]:
+            pending[parent] -= 1
+            if pending[parent] == 0:
+                queue.append(parent)
+
+    remaining = {sku: [c for c in children[sku] if pending[c] > 0] for sku, n in pending.items() if n > 0}
+    cycles = _find_cycles(remaining)
+    in_cycles = {sku for cycle in cycles for sku in cycle}
+    blocked = [sku for sku in compositions if sku not in costs and sku not in in_cycles]
+
+    return BOMReport(costs=costs, order=order, cycles=cycles, dangling=dangling, blocked=blocked)
+
+
+def resolve_package_costs(
+    package_compositions: Dict[str, Dict[str, float]],
+    product_costs: Dict[str, float],
+    materials: Dict[str, Material],
+    strict: bool = False,
+) -> BOMReport:
+    """حساب تكلفة البكجات (مواد + منتجات + بكجات متداخلة) مع تقرير الدورات والمراجع المفقودة"""
+    leaf_costs = {sku: mat.cost_per_unit for sku, mat in materials.items()}
+    leaf_costs.update({sku: cost for sku, cost in product_costs.items() if sku not in leaf_costs})
+    return resolve_costs(package_compositions, leaf_costs, strict=strict)
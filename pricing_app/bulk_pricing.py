@@ -0,0 +1,117 @@
+"""
+التسعير الجماعي المتوازي - Parallel Bulk Pricing
+The catalog × channels split into shards priced on a process or thread pool,
+with one read-only COGS snapshot per worker, per-shard progress and results in input order
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .advanced_pricing import calculate_price_breakdown_array, solve_price_for_margin_array
+from .compiled_channel import CompiledChannel
+
+EXECUTORS = ("serial", "thread", "process")
+DEFAULT_SHARD_SIZE = 2_000
+
+# لقطة COGS للقراءة فقط داخل كل عملية (تُرسل مرة واحدة عند بدء العامل وليس مع كل دفعة)
+_shared_cogs: Optional[np.ndarray] = None
+
+ProgressCallback = Callable[[int, int, str], None]
+
+
+def _init_worker(cogs: np.ndarray):
+    global _shared_cogs
+    _shared_cogs = cogs
+    _shared_cogs.setflags(write=False)
+
+
+def _price_shard(channel: CompiledChannel, start: int, stop: int, target_margin: float,
+                 cogs: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """تسعير شريحة [start, stop) من الكتالوج على قناة واحدة: السعر المحلول + التفصيل الكامل"""
+    cogs = (_shared_cogs if cogs is None else cogs)[start:stop]
+    solved = solve_price_for_margin_array(cogs, channel, target_margin=target_margin)
+    breakdown = calculate_price_breakdown_array(cogs, channel, price_with_vat=np.nan_to_num(solved))
+    breakdown.insert(0, "price_with_vat", solved)
+    return breakdown
+
+
+def _shards(n_items: int, channels: Dict[str, CompiledChannel], shard_size: int) -> List[Tuple[str, int, int]]:
+    return [
+        (name, start, min(start + shard_size, n_items))
+        for name in channels
+        for start in range(0, n_items, shard_size)
+    ]
+
+
+def price_catalog(
+    skus: Sequence[str],
+    cogs: Sequence[float],
+    channels: Dict[str, object],
+    target_margin: float = 0.10,
+    executor: str = "process",
+    workers: Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    progress: Optional[ProgressCallback] = None,
+) -> pd.DataFrame:
+    """
+    تسعير الكتالوج على عدة قنوات بالهامش المستهدف
+
+    channels: {الاسم: channels.ChannelFees أو CompiledChannel} - مرّر CompiledChannel لتغيير الخصم مثلاً
+    executor: "process" (عمليات متوازية)، "thread" (المسار المصفوفي يحرر الـ GIL جزئياً)، أو "serial"
+    progress(منجز، الإجمالي، وصف الشريحة): يُستدعى بعد كل شريحة بترتيب الانتهاء
+    Returns: صف لكل (قناة، SKU) بنفس ترتيب القنوات ثم ترتيب skus مهما كان ترتيب انتهاء الشرائح؛
+             price_with_vat = NaN إذا كان الهامش غير قابل للتحقيق، وباقي الأعمدة من calculate_price_breakdown_array
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor يجب أن يكون واحداً من {EXECUTORS}")
+    cogs = np.ascontiguousarray(cogs, dtype=float)
+    skus = list(skus)
+    if len(skus) != len(cogs):
+        raise ValueError("عدد الـ SKU لا يطابق عدد قيم COGS")
+    compiled = {
+        name: channel if isinstance(channel, CompiledChannel) else CompiledChannel.from_channel(channel)
+        for name, channel in channels.items()
+    }
+    shards = _shards(len(cogs), compiled, max(1, shard_size))
+    results: List[Optional[pd.DataFrame]] = [None] * len(shards)
+
+    def report(done: int, shard: Tuple[str, int, int]):
+        if progress is not None:
+            name, start, stop = shard
+            progress(done, len(shards), f"{name} [{start}:{stop}]")
+
+    if executor == "serial" or len(shards) <= 1:
+        for i, (name, start, stop) in enumerate(shards):
+            results[i] = _price_shard(compiled[name], start, stop, target_margin, cogs)
+            report(i + 1, shards[i])
+    else:
+        workers = workers or os.cpu_count() or 1
+        if executor == "process":
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cogs,))
+            shared = None
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+            shared = cogs
+        with pool:
+            futures = {
+                pool.submit(_price_shard, compiled[name], start, stop, target_margin, shared): i
+                for i, (name, start, stop) in enumerate(shards)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                results[i] = future.result()
+                report(done, shards[i])
+
+    if not results:
+        return pd.DataFrame(columns=["channel", "SKU", "price_with_vat"])
+    frames = []
+    for (name, start, stop), frame in zip(shards, results):
+        frame = frame.reset_index(drop=True)
+        frame.insert(0, "SKU", skus[start:stop])
+        frame.insert(0, "channel", name)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
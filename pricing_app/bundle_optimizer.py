@@ -0,0 +1,236 @@
+"""
+محسّن أسعار البكجات - Bundle Price Optimizer
+Every candidate bundle (mined combos, product associations, existing packages) costed through the BOM
+and priced in one vectorized pass: the discount that maximizes expected profit on each channel
+"""
+
+import argparse
+import ast
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from config.settings import BUSINESS_RULES
+from .advanced_pricing import margin_at_price_array, solve_price_for_margin_array
+from .channels import load_channels
+from .compiled_channel import CompiledChannel
+from .cost_graph import CostGraph, get_cost_graph
+from .elasticity import ELASTICITY_BOUNDS
+from .salla_signals import TOP_COMBOS_FILE
+
+ASSOCIATIONS_FILE = "salla_product_associations.csv"
+# إقبال البكج أكثر حساسية للسعر من المنتج المنفرد: البديل (شراء المكونات منفردة) مطابق تماماً
+BUNDLE_ELASTICITY = ELASTICITY_BOUNDS[0]
+BUNDLE_COLUMNS = [
+    "channel", "bundle", "source", "components", "popularity", "cogs", "standalone_price",
+    "bundle_price", "discount", "margin", "unit_profit", "expected_qty", "expected_profit", "free_fulfilment",
+]
+
+
+def _bundle_key(components: Dict[str, float]) -> str:
+    return " + ".join(f"{sku}×{qty:g}" for sku, qty in sorted(components.items()))
+
+
+def combo_candidates(top_combos_df: pd.DataFrame) -> pd.DataFrame:
+    """البكجات من salla_top_combos.csv: عمود combo نص قائمة ['A', 'B'] وعمود count"""
+    rows = []
+    for combo, count in zip(top_combos_df["combo"], top_combos_df["count"]):
+        try:
+            skus = ast.literal_eval(combo) if isinstance(combo, str) else list(combo)
+        except (ValueError, SyntaxError):
+            continue
+        components: Dict[str, float] = {}
+        for sku in skus:
+            sku = str(sku).strip()
+            if sku:
+                components[sku] = components.get(sku, 0) + 1
+        if len(components) > 1 or sum(components.values()) > 1:
+            rows.append({"source": "combo", "components": components, "popularity": float(count)})
+    return pd.DataFrame(rows, columns=["source", "components", "popularity"])
+
+
+def association_candidates(associations_df: pd.DataFrame) -> pd.DataFrame:
+    """البكجات من ناتج SallaInsights.find_product_associations (زوج منتجات وعدد مرات الشراء معاً)"""
+    rows = [
+        {"source": "association", "components": {str(a): 1.0, str(b): 1.0}, "popularity": float(count)}
+        for a, b, count in zip(
+            associations_df["المنتج الأول"], associations_df["المنتج الثاني"], associations_df["عدد مرات الشراء معًا"],
+        )
+        if a != b
+    ]
+    return pd.DataFrame(rows, columns=["source", "components", "popularity"])
+
+
+def package_candidates(package_compositions: Dict[str, Dict[str, float]]) -> pd.DataFrame:
+    """البكجات الحالية من packages_template.csv (بدون شعبية معروفة)"""
+    rows = [
+        {"source": "package", "components": dict(components), "popularity": np.nan, "bundle": sku}
+        for sku, components in package_compositions.items()
+        if components
+    ]
+    return pd.DataFrame(rows, columns=["source", "components", "popularity", "bundle"])
+
+
+def collect_candidates(
+    cost_graph: CostGraph,
+    top_combos_df: Optional[pd.DataFrame] = None,
+    associations_df: Optional[pd.DataFrame] = None,
+    include_packages: bool = True,
+) -> pd.DataFrame:
+    """
+    كل البكجات المرشحة بدون تكرار (نفس المكونات والكميات = بكج واحد، يبقى الأعلى شعبية)
+    إذا لم تُمرر الجداول تُقرأ من مجلد بيانات cost_graph إن وُجدت
+    """
+    data_dir = cost_graph.data_dir
+    if top_combos_df is None and os.path.exists(os.path.join(data_dir, TOP_COMBOS_FILE)):
+        top_combos_df = pd.read_csv(os.path.join(data_dir, TOP_COMBOS_FILE), encoding="utf-8-sig")
+    if associations_df is None and os.path.exists(os.path.join(data_dir, ASSOCIATIONS_FILE)):
+        associations_df = pd.read_csv(os.path.join(data_dir, ASSOCIATIONS_FILE))
+
+    frames = []
+    if include_packages:
+        frames.append(package_candidates(cost_graph.package_compositions))
+    if top_combos_df is not None and not top_combos_df.empty:
+        frames.append(combo_candidates(top_combos_df))
+    if associations_df is not None and not associations_df.empty:
+        frames.append(association_candidates(associations_df))
+    if not frames:
+        return pd.DataFrame(columns=["bundle", "source", "components", "popularity"])
+
+    candidates = pd.concat(frames, ignore_index=True)
+    candidates["key"] = candidates["components"].map(_bundle_key)
+    candidates["bundle"] = candidates["bundle"].fillna(candidates["key"]) if "bundle" in candidates else candidates["key"]
+    candidates = candidates.sort_values("popularity", ascending=False, na_position="last", kind="stable")
+    candidates = candidates.drop_duplicates("key").reset_index(drop=True)
+    return candidates[["bundle", "source", "components", "popularity"]]
+
+
+def bundle_matrix(candidates: pd.DataFrame) -> Tuple[sparse.csr_matrix, List[str]]:
+    """مصفوفة الكميات (بكجات × مكونات فريدة)"""
+    components = sorted({sku for comp in candidates["components"] for sku in comp})
+    position = {sku: j for j, sku in enumerate(components)}
+    rows, cols, values = [], [], []
+    for i, comp in enumerate(candidates["components"]):
+        for sku, qty in comp.items():
+            rows.append(i)
+            cols.append(position[sku])
+            values.append(float(qty))
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(candidates), len(components)))
+    return matrix, components
+
+
+def optimize_bundles(
+    cost_graph: CostGraph,
+    channels: Dict[str, object],
+    candidates: Optional[pd.DataFrame] = None,
+    component_prices: Optional[Union[pd.Series, Dict[str, float]]] = None,
+    elasticity: float = BUNDLE_ELASTICITY,
+    max_discount: float = BUSINESS_RULES["max_discount_rate"],
+    min_margin: float = BUSINESS_RULES["min_profit_margin"],
+    reference_margin: float = BUSINESS_RULES["recommended_profit_margin"],
+    grid_points: int = 101,
+) -> pd.DataFrame:
+    """
+    خصم البكج (من مجموع أسعار مكوناته منفردة) الذي يعظم الربح المتوقع لكل بكج على كل قناة
+
+    التكلفة: Σ كمية × COGS المكون (مادة/منتج/بكج) من cost_graph؛ البكج بمكون غير معروف يُستبعد.
+    السعر المنفرد: component_prices (شامل الضريبة قبل الخصم)، أو سعر كل مكون عند reference_margin على القناة.
+    الطلب المتوقع: الشعبية (أو 1) × (سعر البكج / السعر المنفرد)^elasticity.
+    البحث: شبكة خصومات 0..max_discount لكل البكجات معاً + النقطة تحت حد الشحن المجاني مباشرة،
+    مع استبعاد الخصومات التي تنزل بالهامش تحت min_margin (BUSINESS_RULES).
+    """
+    if candidates is None:
+        candidates = collect_candidates(cost_graph)
+    if candidates.empty:
+        return pd.DataFrame(columns=BUNDLE_COLUMNS)
+
+    matrix, components = bundle_matrix(candidates)
+    known = np.array([cost_graph.component_type(sku) is not None for sku in components])
+    unit_costs = np.array([cost_graph.cost(sku) for sku in components])
+    missing = np.asarray(matrix[:, ~known].sum(axis=1)).ravel() > 0
+    cogs = np.where(missing, np.nan, matrix @ unit_costs)
+    popularity = candidates["popularity"].fillna(1.0).to_numpy()
+    current = pd.Series(component_prices, dtype=float).reindex(components) if component_prices is not None else None
+
+    discounts = np.linspace(0.0, max_discount, grid_points)
+    rows = np.arange(len(candidates))
+    blocks = []
+    for channel_name, channel in channels.items():
+        compiled = channel if isinstance(channel, CompiledChannel) else CompiledChannel.from_channel(channel)
+        prices = solve_price_for_margin_array(unit_costs, compiled, target_margin=reference_margin)
+        if current is not None:
+            prices = current.fillna(pd.Series(prices, index=components)).to_numpy()
+        # مكون بلا سعر ممكن على القناة ⇒ لا سعر منفرد للبكج
+        unpriced = np.asarray(matrix @ np.isnan(prices).astype(float)).ravel() > 0
+        standalone = np.where(unpriced, np.nan, matrix @ np.nan_to_num(prices))
+
+        # شبكة الخصومات + الخصم الذي يضع السعر تحت حد الشحن المجاني بهللة
+        threshold_discount = np.full(len(candidates), np.nan)
+        if compiled.has_threshold:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                threshold_discount = 1 - (compiled.free_shipping_threshold - 0.01) / standalone
+            threshold_discount = np.where(
+                (threshold_discount >= 0) & (threshold_discount <= max_discount), threshold_discount, np.nan,
+            )
+        grid = np.column_stack([np.broadcast_to(discounts, (len(candidates), grid_points)), threshold_discount])
+        bundle_prices = standalone[:, None] * (1 - grid)
+
+        unit_profit, margin = margin_at_price_array(bundle_prices, cogs[:, None], compiled)
+        qty = popularity[:, None] * (1 - grid) ** elasticity
+        expected = np.where((margin >= min_margin - 1e-12) & ~np.isnan(grid), unit_profit * qty, -np.inf)
+        expected = np.where(np.isnan(expected), -np.inf, expected)
+        best = np.argmax(expected, axis=1)
+        feasible = np.isfinite(expected[rows, best]) & ~missing & (np.nan_to_num(standalone) > 0)
+
+        def pick(values):
+            return np.where(feasible, values[rows, best], np.nan)
+
+        best_prices = pick(bundle_prices)
+        blocks.append(pd.DataFrame({
+            "channel": channel_name,
+            "bundle": candidates["bundle"].to_numpy(),
+            "source": candidates["source"].to_numpy(),
+            "components": candidates["components"].map(_bundle_key).to_numpy(),
+            "popularity": candidates["popularity"].to_numpy(),
+            "cogs": cogs,
+            "standalone_price": standalone,
+            "bundle_price": best_prices,
+            "discount": pick(grid),
+            "margin": pick(margin),
+            "unit_profit": pick(unit_profit),
+            "expected_qty": pick(qty),
+            "expected_profit": pick(expected),
+            "free_fulfilment": feasible & compiled.is_free_fulfilment(np.nan_to_num(best_prices)),
+        }))
+
+    result = pd.concat(blocks, ignore_index=True)[BUNDLE_COLUMNS]
+    return result.sort_values(["channel", "expected_profit"], ascending=[True, False], na_position="last")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize bundle prices for mined combos and existing packages")
+    parser.add_argument("--data-dir", default="data", help="Data directory")
+    parser.add_argument("--no-packages", action="store_true", help="Only mined combos and associations")
+    parser.add_argument("--elasticity", type=float, default=BUNDLE_ELASTICITY, help="Bundle demand elasticity")
+    parser.add_argument("--output", default=None, help="Output CSV (default: <data-dir>/salla_bundle_prices.csv)")
+    args = parser.parse_args()
+
+    channels = load_channels(os.path.join(args.data_dir, "channels.json"))
+    if not channels:
+        print("⚠️ لا توجد قنوات محفوظة")
+        return
+    cost_graph = get_cost_graph(args.data_dir)
+    candidates = collect_candidates(cost_graph, include_packages=not args.no_packages)
+    result = optimize_bundles(cost_graph, channels, candidates, elasticity=args.elasticity)
+
+    output = args.output or os.path.join(args.data_dir, "salla_bundle_prices.csv")
+    result.to_csv(output, index=False, encoding="utf-8-sig")
+    priced = int(result["bundle_price"].notna().sum())
+    print(f"✅ {len(candidates)} بكج مرشح × {len(channels)} قناة ({priced} مسعّر) → {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import os
 from typing import Dict, List
 from dataclasses import dataclass, asdict, field
 
+from .compiled_channel import CompiledChannel
+
 @dataclass
 class CustomFee:
     """Custom fee for a channel"""
@@ -67,12 +69,15 @@ def calculate_price_with_fees(cogs: float, channel_fees: ChannelFees, target_mar
     الصيغة:
     السعر = COGS / (1 - (رسوم + هامش))
     """
-    # Calculate total fees percentage
-    total_fees_pct = (
-        channel_fees.platform_pct +
-        channel_fees.marketing_pct +
-        channel_fees.opex_pct
-    )
+    # Calculate total fees percentage (محسوبة مسبقاً إذا كانت القناة مُجمّعة)
+    if isinstance(channel_fees, CompiledChannel):
+        total_fees_pct = channel_fees.channel_pct
+    else:
+        total_fees_pct = (
+            channel_fees.platform_pct +
+            channel_fees.marketing_pct +
+            channel_fees.opex_pct
+        )
     
     # Calculate net price (before VAT)
     net_price_excl_vat = cogs / (1 - total_fees_pct - target_margin)
@@ -1,6 +1,5 @@
 import argparse
-from .data_loader import load_cost_data
-from .costing import compute_product_costs, compute_package_costs
+from .cost_graph import get_cost_graph
 from .pricing import price_item
 from .models import ChannelFees
 def main():
@@ -9,9 +8,9 @@ def main():
     parser.add_argument('--data-dir', default='data', help='Data directory')
     args = parser.parse_args()
     # Load data
-    materials, products_df, packages_df = load_cost_data(args.data_dir)
-    product_costs = compute_product_costs(products_df, materials)
-    package_costs = compute_package_costs(packages_df, product_costs, materials)
+    cost_graph = get_cost_graph(args.data_dir)
+    product_costs = cost_graph.product_costs
+    package_costs = cost_graph.package_costs
     # Price the SKU
     sku = args.sku
     channel_fees = ChannelFees()
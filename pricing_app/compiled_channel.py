@@ -0,0 +1,146 @@
+"""
+نموذج رسوم القناة المُجمّع - Compiled Channel Fee Model
+Channel fees resolved once (variable %, fixed add-ons, VAT/discount factors, threshold regime)
+and accepted by every pricing function in place of the per-call fee dict
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+import numpy as np
+
+# الافتراضات عند غياب المفاتيح في قاموس الرسوم (نفس قيم advanced_pricing)
+DEFAULT_FEE_DICT = {"opex_pct": 0.04, "marketing_pct": 0.28, "platform_pct": 0.0}
+# الحقول العددية التي يمكن أن تحمل مصفوفة (قيمة لكل صف)
+NUMERIC_FIELDS = (
+    "platform_pct", "marketing_pct", "opex_pct", "vat_rate", "discount_rate",
+    "shipping_fixed", "preparation_fee", "free_shipping_threshold",
+)
+
+
+def _custom_fee_lines(custom_fees) -> Tuple[Tuple[str, str, float], ...]:
+    """(الاسم، النوع، القيمة) من قاموس الرسوم المخصصة: dict أو كائنات CustomFee"""
+    lines = []
+    for fee_name, fee_data in (custom_fees or {}).items():
+        if isinstance(fee_data, dict):
+            fee_type, amount = fee_data.get("fee_type"), fee_data.get("amount", 0)
+        else:
+            fee_type, amount = fee_data.fee_type, fee_data.amount
+        lines.append((fee_name, "percentage" if fee_type == "percentage" else "fixed", float(amount)))
+    return tuple(lines)
+
+
+@dataclass
+class CompiledChannel:
+    """
+    رسوم قناة مُجمّعة مرة واحدة. أسماء الحقول مطابقة لـ channels.ChannelFees
+    فيمكن تمريرها لأي دالة تقرأ تلك الحقول.
+
+    القيم العددية يمكن أن تكون مصفوفات (معاملات لكل صف) في الدوال المصفوفية.
+    """
+    channel_name: str = ""
+    platform_pct: float = 0.0
+    marketing_pct: float = 0.28
+    opex_pct: float = 0.04
+    vat_rate: float = 0.15
+    discount_rate: float = 0.10
+    shipping_fixed: float = 0.0
+    preparation_fee: float = 0.0
+    free_shipping_threshold: float = 0.0
+    custom_lines: Tuple[Tuple[str, str, float], ...] = ()
+
+    # محسوبة مسبقاً
+    channel_pct: float = field(init=False)  # إداري + تسويق + منصة
+    custom_pct: float = field(init=False)
+    custom_fixed: float = field(init=False)
+    variable_pct: float = field(init=False)  # كل النسب من السعر الصافي
+    net_factor: float = field(init=False)  # السعر الصافي D = السعر قبل الخصم × net_factor
+    fulfilment: float = field(init=False)  # الشحن + التحضير
+    has_threshold: bool = field(init=False)
+
+    def __post_init__(self):
+        self.channel_pct = self.opex_pct + self.marketing_pct + self.platform_pct
+        self.custom_pct = sum(amount for _, fee_type, amount in self.custom_lines if fee_type == "percentage")
+        self.custom_fixed = sum(amount for _, fee_type, amount in self.custom_lines if fee_type == "fixed")
+        self.variable_pct = self.channel_pct + self.custom_pct
+        self.net_factor = (1 - np.asarray(self.discount_rate)) / (1 + np.asarray(self.vat_rate))
+        if np.ndim(self.net_factor) == 0:
+            self.net_factor = float(self.net_factor)
+        self.fulfilment = self.shipping_fixed + self.preparation_fee
+        self.has_threshold = np.asarray(self.free_shipping_threshold) > 0
+        if np.ndim(self.has_threshold) == 0:
+            self.has_threshold = bool(self.has_threshold)
+
+    @property
+    def custom_fees(self) -> Dict[str, Dict]:
+        """الرسوم المخصصة بصيغة channels.json"""
+        return {name: {"amount": amount, "fee_type": fee_type} for name, fee_type, amount in self.custom_lines}
+
+    def custom_fee_amounts(self, net_price) -> Dict[str, float]:
+        """مبلغ كل رسم مخصص عند سعر صافي معين"""
+        return {
+            name: net_price * amount if fee_type == "percentage" else amount
+            for name, fee_type, amount in self.custom_lines
+        }
+
+    def is_free_fulfilment(self, price_with_vat):
+        """الشحن والتحضير مجاني إذا كان السعر قبل الخصم تحت الحد"""
+        return self.has_threshold & (np.asarray(price_with_vat) < self.free_shipping_threshold)
+
+    @classmethod
+    def from_channel(cls, channel, **overrides) -> "CompiledChannel":
+        """
+        من channels.ChannelFees أو models.ChannelFees
+        overrides: أي حقل بقيمة مختلفة لهذا السيناريو (مثلاً discount_rate أو marketing_pct)
+        """
+        params = {
+            "channel_name": getattr(channel, "channel_name", ""),
+            "platform_pct": channel.platform_pct,
+            "marketing_pct": channel.marketing_pct,
+            "opex_pct": channel.opex_pct,
+            "vat_rate": channel.vat_rate,
+            "discount_rate": channel.discount_rate,
+            "shipping_fixed": channel.shipping_fixed,
+            "preparation_fee": channel.preparation_fee,
+            "free_shipping_threshold": getattr(channel, "free_shipping_threshold", 0.0) or 0.0,
+            "custom_lines": _custom_fee_lines(getattr(channel, "custom_fees", None)),
+        }
+        if "custom_fees" in overrides:
+            overrides["custom_lines"] = _custom_fee_lines(overrides.pop("custom_fees"))
+        params.update(overrides)
+        return cls(**params)
+
+    @classmethod
+    def from_fee_dict(
+        cls,
+        channel_fees: Dict,
+        shipping=0,
+        preparation=0,
+        discount_rate=0.1,
+        vat_rate=0.15,
+        free_shipping_threshold=0,
+        custom_fees: Dict = None,
+        defaults: Dict = DEFAULT_FEE_DICT,
+    ) -> "CompiledChannel":
+        """من قاموس الرسوم والمعاملات المنفصلة المستخدمة في دوال advanced_pricing"""
+        return cls(
+            platform_pct=channel_fees.get("platform_pct", defaults.get("platform_pct", 0.0)),
+            marketing_pct=channel_fees.get("marketing_pct", defaults.get("marketing_pct", 0.0)),
+            opex_pct=channel_fees.get("opex_pct", defaults.get("opex_pct", 0.0)),
+            vat_rate=vat_rate,
+            discount_rate=discount_rate,
+            shipping_fixed=shipping,
+            preparation_fee=preparation,
+            free_shipping_threshold=free_shipping_threshold,
+            custom_lines=_custom_fee_lines(custom_fees),
+        )
+
+
+def as_compiled_channel(channel_fees, defaults: Dict = DEFAULT_FEE_DICT, **params) -> CompiledChannel:
+    """
+    توحيد مدخل الرسوم في دوال التسعير: CompiledChannel يُستخدم كما هو (وتُهمل المعاملات المنفصلة
+    لأنه يحملها)، وقاموس الرسوم يُجمّع مع المعاملات المنفصلة
+    """
+    if isinstance(channel_fees, CompiledChannel):
+        return channel_fees
+    return CompiledChannel.from_fee_dict(channel_fees, defaults=defaults, **params)
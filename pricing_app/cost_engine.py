@@ -0,0 +1,187 @@
+"""
+محرك تكلفة قائمة المواد - BOM Cost Engine
+Sparse materials × products quantity matrix: every product's COGS in one pass,
+and the fully exploded (flattened) BOM for every sellable SKU
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .bom_graph import BOMReport, resolve_costs
+from .models import Material
+
+
+@dataclass
+class BOMMatrix:
+    """مصفوفة الكميات (مواد × منتجات) مبنية مرة واحدة من وصفات المنتجات"""
+    material_skus: List[str]
+    product_skus: List[str]
+    quantities: sparse.csr_matrix  # shape: (len(material_skus), len(product_skus))
+
+    def __post_init__(self):
+        self.material_pos = {sku: i for i, sku in enumerate(self.material_skus)}
+        self.product_pos = {sku: j for j, sku in enumerate(self.product_skus)}
+
+    def cost_vector(self, materials: Dict[str, Material]) -> np.ndarray:
+        """متجه تكلفة الوحدة بنفس ترتيب صفوف المصفوفة (0 للمادة المحذوفة)"""
+        return np.array(
+            [materials[sku].cost_per_unit if sku in materials else 0.0 for sku in self.material_skus],
+            dtype=float,
+        )
+
+    def product_costs(self, materials: Dict[str, Material]) -> np.ndarray:
+        """COGS لجميع المنتجات = Qᵀ · c (ضرب مصفوفة في متجه واحد)"""
+        return self.quantities.T @ self.cost_vector(materials)
+
+    def cost_map(self, materials: Dict[str, Material]) -> Dict[str, float]:
+        """COGS لكل منتج كقاموس {Product_SKU: cost}"""
+        costs = self.product_costs(materials)
+        return dict(zip(self.product_skus, costs.tolist()))
+
+
+def build_bom_matrix(product_recipes: Dict[str, Dict[str, float]], materials: Dict[str, Material]) -> BOMMatrix:
+    """
+    بناء مصفوفة الكميات المتفرقة من وصفات المنتجات (ناتج load_products)
+
+    المكونات غير الموجودة في المواد الخام يتم تجاهلها، تماماً كما في حساب التكلفة
+    في صفحات اللوحة (تكلفتها صفر).
+    """
+    material_skus = list(materials.keys())
+    product_skus = list(product_recipes.keys())
+    material_pos = {sku: i for i, sku in enumerate(material_skus)}
+
+    rows, cols, qtys = [], [], []
+    for j, recipe in enumerate(product_recipes.values()):
+        for material_code, qty in recipe.items():
+            i = material_pos.get(material_code)
+            if i is not None:
+                rows.append(i)
+                cols.append(j)
+                qtys.append(qty)
+
+    quantities = sparse.csr_matrix(
+        (np.asarray(qtys, dtype=float), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+        shape=(len(material_skus), len(product_skus)),
+    )
+    return BOMMatrix(material_skus=material_skus, product_skus=product_skus, quantities=quantities)
+
+
+def compute_product_cogs(product_recipes: Dict[str, Dict[str, float]], materials: Dict[str, Material]) -> Dict[str, float]:
+    """حساب تكلفة جميع المنتجات دفعة واحدة"""
+    return build_bom_matrix(product_recipes, materials).cost_map(materials)
+
+
+@dataclass
+class FlatBOM:
+    """
+    قائمة المواد المُفككة: إجمالي كمية كل مادة خام لكل SKU قابل للبيع
+    بعد فك جميع البكجات المتداخلة (صف لكل SKU، عمود لكل مادة)
+    """
+    skus: List[str]
+    sku_types: List[str]  # 'product' / 'package'
+    material_skus: List[str]
+    quantities: sparse.csr_matrix  # shape: (len(skus), len(material_skus))
+    report: BOMReport  # الدورات والمراجع المفقودة (SKU غير القابلة للحل لا تظهر في skus)
+
+    def __post_init__(self):
+        self.sku_pos = {sku: i for i, sku in enumerate(self.skus)}
+        self.material_pos = {sku: j for j, sku in enumerate(self.material_skus)}
+
+    def cost_vector(self, materials: Dict[str, Material]) -> np.ndarray:
+        """متجه تكلفة الوحدة بنفس ترتيب أعمدة المصفوفة"""
+        return np.array(
+            [materials[sku].cost_per_unit if sku in materials else 0.0 for sku in self.material_skus],
+            dtype=float,
+        )
+
+    def costs(self, materials: Dict[str, Material]) -> np.ndarray:
+        """COGS لكل SKU = F · c"""
+        return self.quantities @ self.cost_vector(materials)
+
+    def cost_map(self, materials: Dict[str, Material]) -> Dict[str, float]:
+        return dict(zip(self.skus, self.costs(materials).tolist()))
+
+    def requirements(self, sku_quantities: Dict[str, float]) -> Dict[str, float]:
+        """احتياج المواد الخام لكميات مبيعات/إنتاج معينة = qᵀ · F"""
+        demand = np.zeros(len(self.skus))
+        for sku, qty in sku_quantities.items():
+            i = self.sku_pos.get(sku)
+            if i is not None:
+                demand[i] += qty
+        needed = self.quantities.T @ demand
+        return {self.material_skus[j]: float(needed[j]) for j in np.flatnonzero(needed)}
+
+    def cost_composition(self, sku: str, materials: Dict[str, Material]) -> pd.DataFrame:
+        """تركيبة تكلفة SKU على مستوى المواد الخام (كمية، تكلفة، نسبة من COGS)"""
+        row = self.quantities.getrow(self.sku_pos[sku])
+        codes = [self.material_skus[j] for j in row.indices]
+        unit_costs = self.cost_vector(materials)[row.indices]
+        df = pd.DataFrame({
+            "material_sku": codes,
+            "quantity": row.data,
+            "unit_cost": unit_costs,
+            "cost": row.data * unit_costs,
+        })
+        total = df["cost"].sum()
+        df["share_pct"] = df["cost"] / total * 100 if total else 0.0
+        return df.sort_values("cost", ascending=False).reset_index(drop=True)
+
+
+def build_flat_bom(
+    materials: Dict[str, Material],
+    product_recipes: Dict[str, Dict[str, float]],
+    package_compositions: Dict[str, Dict[str, float]],
+) -> FlatBOM:
+    """
+    بناء قائمة المواد المُفككة من مخرجات load_cost_data
+
+    F = B + A·F حيث B الكميات المباشرة من المواد و A كميات المكونات المركبة؛
+    لأن الشجرة بلا دورات فإن A معدومة القوى ويُحسب F = Σ Aᵏ·B بعدد ضربات يساوي عمق التداخل.
+    المكون يُعامل كمادة خام أولاً إذا وُجد في المواد (نفس أولوية resolve_costs).
+    """
+    compositions = {**package_compositions, **product_recipes}
+    report = resolve_costs(compositions, {sku: mat.cost_per_unit for sku, mat in materials.items()})
+
+    skus = [sku for sku in product_recipes if sku in report.costs]
+    sku_types = ["product"] * len(skus)
+    for sku in package_compositions:
+        if sku in report.costs and sku not in product_recipes:
+            skus.append(sku)
+            sku_types.append("package")
+
+    material_skus = list(materials.keys())
+    material_pos = {sku: j for j, sku in enumerate(material_skus)}
+    sku_pos = {sku: i for i, sku in enumerate(skus)}
+
+    b_rows, b_cols, b_qty = [], [], []
+    a_rows, a_cols, a_qty = [], [], []
+    for i, sku in enumerate(skus):
+        for comp, qty in compositions[sku].items():
+            if comp in material_pos:
+                b_rows.append(i)
+                b_cols.append(material_pos[comp])
+                b_qty.append(qty)
+            elif comp in sku_pos:
+                a_rows.append(i)
+                a_cols.append(sku_pos[comp])
+                a_qty.append(qty)
+
+    n, m = len(skus), len(material_skus)
+    direct = sparse.csr_matrix((np.asarray(b_qty, dtype=float), (b_rows, b_cols)), shape=(n, m))
+    nested = sparse.csr_matrix((np.asarray(a_qty, dtype=float), (a_rows, a_cols)), shape=(n, n))
+
+    flat = direct
+    term = direct
+    for _ in range(n):
+        term = nested @ term
+        if term.nnz == 0:
+            break
+        flat = flat + term
+    flat = sparse.csr_matrix(flat)
+    flat.eliminate_zeros()
+
+    return FlatBOM(skus=skus, sku_types=sku_types, material_skus=material_skus, quantities=flat, report=report)
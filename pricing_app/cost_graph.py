@@ -0,0 +1,211 @@
+"""
+خدمة التكلفة المشتركة - Shared Cost Graph Service
+One loaded cost catalog per data directory, with memoized costs and component breakdowns,
+reused by the dashboard, the CLI and the Salla analytics
+"""
+
+import os
+import threading
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .bom_graph import BOMReport, resolve_package_costs
+from .cost_engine import FlatBOM, compute_product_cogs
+from .cost_index import ReverseDependencyIndex, changed_materials
+from .cost_snapshot import SOURCE_FILES
+from .data_loader import load_cost_data, load_flat_bom
+from .models import Material
+
+
+def _source_signature(data_dir: str) -> Tuple:
+    """الحجم ووقت التعديل لملفات المصدر (فحص سريع بدون قراءة الملفات)"""
+    signature = []
+    for name in SOURCE_FILES:
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            signature.append((name, st.st_size, st.st_mtime_ns))
+        else:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+
+class CostGraph:
+    """
+    كتالوج التكلفة المحمّل مرة واحدة: المواد، الوصفات، التكاليف، وتفصيل المكونات
+
+    القواميس لا تُعدّل في مكانها؛ عند إعادة التحميل أو تحديث المواد تُستبدل بنسخ جديدة،
+    فالقارئ الذي يحمل مرجعاً قديماً يرى نسخة متسقة. version يزيد مع كل تغيير.
+    """
+
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = data_dir
+        self.version = 0
+        self._lock = threading.RLock()
+        self.reload()
+
+    def reload(self):
+        """إعادة تحميل الكتالوج من الملفات ومسح الذاكرة المؤقتة"""
+        with self._lock:
+            signature = _source_signature(self.data_dir)
+            (
+                self.materials,
+                self.product_recipes,
+                self.products_summary,
+                self.package_compositions,
+                self.packages_summary,
+            ) = load_cost_data(self.data_dir)
+            self._set_costs(self.materials, compute_product_cogs(self.product_recipes, self.materials))
+            self._signature = signature
+            self._flat_bom: Optional[FlatBOM] = None
+            self._index: Optional[ReverseDependencyIndex] = None
+
+    def _set_costs(self, materials: Dict[str, Material], product_costs: Dict[str, float]):
+        """حل تكاليف كل البكجات من جديد (عند التحميل أو تغيّر مجموعة المواد)"""
+        report = resolve_package_costs(self.package_compositions, product_costs, materials)
+        self._apply_costs(materials, product_costs, report)
+
+    def _apply_costs(self, materials: Dict[str, Material], product_costs: Dict[str, float], report: BOMReport):
+        self.materials = materials
+        self.product_costs = product_costs
+        self.report: BOMReport = report
+        self.package_costs = report.costs
+        self._breakdowns: Dict[str, List[Dict]] = {}
+        self.version += 1
+
+    def is_stale(self) -> bool:
+        return _source_signature(self.data_dir) != self._signature
+
+    def refresh_if_stale(self) -> bool:
+        """إعادة التحميل فقط إذا تغيرت ملفات المصدر على القرص"""
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+                return True
+        return False
+
+    @property
+    def flat_bom(self) -> FlatBOM:
+        """قائمة المواد المُفككة (تُبنى عند أول طلب، من اللقطة إن وُجدت)"""
+        with self._lock:
+            if self._flat_bom is None:
+                self._flat_bom = load_flat_bom(self.data_dir)
+            return self._flat_bom
+
+    @property
+    def index(self) -> ReverseDependencyIndex:
+        with self._lock:
+            if self._index is None:
+                self._index = ReverseDependencyIndex(self.product_recipes, self.package_compositions)
+            return self._index
+
+    def component_type(self, sku: str) -> Optional[str]:
+        """نوع المكون بنفس أولوية حساب التكلفة: material ثم product ثم package (None إذا غير معروف)"""
+        if sku in self.materials:
+            return "material"
+        if sku in self.product_recipes:
+            return "product"
+        if sku in self.package_compositions:
+            return "package"
+        return None
+
+    def cost(self, sku: str, component_type: Optional[str] = None) -> float:
+        """
+        تكلفة مادة/منتج/بكج (0 إذا غير موجود أو لم تُحسب تكلفته)
+        component_type: إذا حُدد يُبحث في هذا النوع فقط
+        """
+        component_type = component_type or self.component_type(sku)
+        if component_type == "material" and sku in self.materials:
+            return self.materials[sku].cost_per_unit
+        if component_type == "product" and sku in self.product_recipes:
+            return self.product_costs.get(sku, 0.0)
+        if component_type == "package" and sku in self.package_compositions:
+            return self.package_costs.get(sku, 0.0)
+        return 0.0
+
+    def breakdown(self, sku: str) -> List[Dict]:
+        """
+        تفصيل المكونات المباشرة لمنتج أو بكج (محفوظ في الذاكرة حتى التغيير التالي)
+        Returns: [{component_sku, component_type, quantity, unit_cost, cost}] - لا تعدّل القائمة المُرجعة
+        """
+        cached = self._breakdowns.get(sku)
+        if cached is not None:
+            return cached
+
+        if sku in self.product_recipes:
+            # وصفات المنتجات تُحسب من المواد الخام فقط (مثل compute_product_cogs)
+            components = {code: qty for code, qty in self.product_recipes[sku].items() if code in self.materials}
+        else:
+            components = self.package_compositions.get(sku, {})
+
+        rows = []
+        for component_sku, quantity in components.items():
+            comp_type = self.component_type(component_sku)
+            unit_cost = self.cost(component_sku, comp_type)
+            rows.append({
+                "component_sku": component_sku,
+                "component_type": comp_type,
+                "quantity": quantity,
+                "unit_cost": unit_cost,
+                "cost": unit_cost * quantity,
+            })
+        self._breakdowns[sku] = rows
+        return rows
+
+    def cost_frame(self) -> pd.DataFrame:
+        """جدول COGS لكل المنتجات والبكجات: type, SKU, Name, COGS"""
+        products = pd.DataFrame({
+            "type": "product",
+            "SKU": self.products_summary["Product_SKU"],
+            "Name": self.products_summary["Product_Name"],
+        })
+        packages = pd.DataFrame({
+            "type": "package",
+            "SKU": self.packages_summary["Package_SKU"],
+            "Name": self.packages_summary["Package_Name"],
+        })
+        products["COGS"] = products["SKU"].map(self.product_costs).astype(float)
+        packages["COGS"] = packages["SKU"].map(self.package_costs).astype(float)
+        return pd.concat([products, packages], ignore_index=True)
+
+    def update_materials(self, new_materials: Dict[str, Material]) -> pd.DataFrame:
+        """
+        تطبيق أسعار مواد جديدة في مكانها: تُعاد تكلفة الأصناف المتأثرة فقط عبر الفهرس العكسي
+        Returns: جدول الفروقات (type, SKU, old_cogs, new_cogs, change, change_pct)
+        """
+        with self._lock:
+            changed = changed_materials(self.materials, new_materials)
+            new_product_costs, new_package_costs, delta = self.index.recompute(
+                new_materials, self.product_costs, self.package_costs, changed
+            )
+            if set(new_materials) != set(self.materials):
+                # مواد أُضيفت أو حُذفت: المكونات المفقودة في التقرير وأعمدة FlatBOM تتغير، فيُعاد الحل كاملاً
+                self._set_costs(new_materials, new_product_costs)
+                self._flat_bom = None
+                self._index = None
+            elif changed:
+                # نفس المواد بأسعار جديدة: الدورات والمكونات المفقودة كما هي، وتكاليف البكجات من الفهرس
+                self._apply_costs(
+                    new_materials, new_product_costs, replace(self.report, costs=new_package_costs)
+                )
+            # ملف المواد المحفوظ يطابق ما في الذاكرة الآن، فلا حاجة لإعادة التحميل
+            self._signature = _source_signature(self.data_dir)
+            return delta
+
+
+_graphs: Dict[str, CostGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_cost_graph(data_dir: str = "data") -> CostGraph:
+    """نسخة واحدة لكل مجلد بيانات على مستوى العملية، تُحدّث تلقائياً إذا تغيرت الملفات"""
+    key = os.path.abspath(data_dir)
+    with _graphs_lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = _graphs[key] = CostGraph(data_dir)
+            return graph
+    graph.refresh_if_stale()
+    return graph
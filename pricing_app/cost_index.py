@@ -0,0 +1,98 @@
+"""
+الفهرس العكسي للتكاليف - Reverse Cost Dependency Index
+material → products → packages, so a price change only recosts the affected SKUs
+"""
+
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+import pandas as pd
+
+from .bom_graph import resolve_costs
+from .models import Material
+
+
+def changed_materials(old_materials: Dict[str, Material], new_materials: Dict[str, Material]) -> List[str]:
+    """المواد التي تغيرت تكلفتها أو أُضيفت أو حُذفت"""
+    changed = set(old_materials) ^ set(new_materials)
+    for sku in set(old_materials) & set(new_materials):
+        if old_materials[sku].cost_per_unit != new_materials[sku].cost_per_unit:
+            changed.add(sku)
+    return sorted(changed)
+
+
+class ReverseDependencyIndex:
+    """فهرس عكسي فوق مخرجات load_cost_data: لكل مكون، الـ SKU المركبة التي تستخدمه مباشرة"""
+
+    def __init__(self, product_recipes: Dict[str, Dict[str, float]], package_compositions: Dict[str, Dict[str, float]]):
+        self.product_recipes = product_recipes
+        self.package_compositions = package_compositions
+        self.used_by: Dict[str, Set[str]] = defaultdict(set)
+        for product_sku, recipe in product_recipes.items():
+            for component in recipe:
+                self.used_by[component].add(product_sku)
+        for package_sku, components in package_compositions.items():
+            for component in components:
+                self.used_by[component].add(package_sku)
+
+    def affected_skus(self, changed: Iterable[str]) -> Set[str]:
+        """كل المنتجات والبكجات التي تعتمد (مباشرة أو عبر بكجات متداخلة) على المكونات المتغيرة"""
+        affected: Set[str] = set()
+        queue = deque(changed)
+        while queue:
+            sku = queue.popleft()
+            for parent in self.used_by.get(sku, ()):
+                if parent not in affected:
+                    affected.add(parent)
+                    queue.append(parent)
+        return affected
+
+    def recompute(
+        self,
+        materials: Dict[str, Material],
+        product_costs: Dict[str, float],
+        package_costs: Dict[str, float],
+        changed: Iterable[str],
+    ) -> Tuple[Dict[str, float], Dict[str, float], pd.DataFrame]:
+        """
+        إعادة حساب التكلفة للـ SKU المتأثرة فقط
+
+        materials: المواد بعد التحديث
+        product_costs / package_costs: التكاليف الحالية (قبل التحديث)
+        Returns: (تكاليف المنتجات الجديدة, تكاليف البكجات الجديدة, جدول الفروقات)
+        """
+        affected = self.affected_skus(changed)
+
+        new_product_costs = dict(product_costs)
+        affected_products = [sku for sku in affected if sku in self.product_recipes]
+        for sku in affected_products:
+            new_product_costs[sku] = sum(
+                materials[code].cost_per_unit * qty
+                for code, qty in self.product_recipes[sku].items()
+                if code in materials
+            )
+
+        # البكجات المتأثرة تُحسب طوبولوجياً؛ غير المتأثرة تدخل كتكاليف ثابتة
+        affected_packages = {sku: self.package_compositions[sku] for sku in affected if sku in self.package_compositions}
+        leaf_costs = {sku: mat.cost_per_unit for sku, mat in materials.items()}
+        for costs in (new_product_costs, package_costs):
+            for sku, cost in costs.items():
+                if sku not in leaf_costs and sku not in affected_packages:
+                    leaf_costs[sku] = cost
+        report = resolve_costs(affected_packages, leaf_costs)
+
+        new_package_costs = {sku: cost for sku, cost in package_costs.items() if sku not in affected_packages}
+        new_package_costs.update(report.costs)
+
+        rows = []
+        for sku in affected_products:
+            rows.append(("product", sku, product_costs.get(sku), new_product_costs[sku]))
+        for sku in affected_packages:
+            rows.append(("package", sku, package_costs.get(sku), new_package_costs.get(sku)))
+        delta = pd.DataFrame(rows, columns=["type", "SKU", "old_cogs", "new_cogs"])
+        delta[["old_cogs", "new_cogs"]] = delta[["old_cogs", "new_cogs"]].astype(float)
+        delta["change"] = delta["new_cogs"] - delta["old_cogs"]
+        delta["change_pct"] = (delta["change"] / delta["old_cogs"].where(delta["old_cogs"] != 0)) * 100
+        delta = delta.sort_values("change", key=lambda s: s.abs(), ascending=False).reset_index(drop=True)
+
+        return new_product_costs, new_package_costs, delta
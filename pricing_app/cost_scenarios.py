@@ -0,0 +1,123 @@
+"""
+سيناريوهات صدمات أسعار المواد - Material Price Shock Scenarios
+N what-if scenarios × every SKU in one sparse product over the flattened BOM,
+with the matching list prices and margins from the pricing formulas
+"""
+
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from .advanced_pricing import margin_at_price_array, price_for_margin_array
+from .channels import ChannelFees
+from .compiled_channel import CompiledChannel
+from .cost_engine import FlatBOM
+from .models import Material
+
+BASE_SCENARIO = "base"
+ALL_MATERIALS = "*"
+
+ScenarioSpec = Union[Dict[str, Dict[str, float]], pd.DataFrame]
+
+
+def shock_matrix(flat_bom: FlatBOM, materials: Dict[str, Material], scenarios: ScenarioSpec) -> pd.DataFrame:
+    """
+    مضاعفات الأسعار (سيناريوهات × مواد)
+
+    scenarios: إما قاموس {اسم السيناريو: {مفتاح: نسبة التغير}} حيث المفتاح رمز مادة،
+    أو اسم فئة (Category)، أو "*" لكل المواد (مثل تغير سعر الصرف) - المفاتيح المتطابقة تتضاعف؛
+    أو DataFrame (صف لكل سيناريو، عمود لكل مادة) بنسب التغير مباشرة.
+    0.10 = +10%، -0.05 = -5%
+    """
+    columns = pd.Index(flat_bom.material_skus)
+    if isinstance(scenarios, pd.DataFrame):
+        changes = scenarios.reindex(columns=columns).fillna(0.0).astype(float)
+        return 1.0 + changes
+
+    categories = np.array([
+        materials[sku].category if sku in materials else "" for sku in flat_bom.material_skus
+    ], dtype=object)
+    factors = np.ones((len(scenarios), len(columns)))
+    for i, shocks in enumerate(scenarios.values()):
+        for key, change in shocks.items():
+            if key == ALL_MATERIALS:
+                factors[i] *= 1.0 + change
+            elif key in flat_bom.material_pos:
+                factors[i, flat_bom.material_pos[key]] *= 1.0 + change
+            else:
+                mask = categories == key
+                if not mask.any():
+                    raise KeyError(f"'{key}' ليس رمز مادة ولا فئة معروفة (السيناريو: {list(scenarios)[i]})")
+                factors[i, mask] *= 1.0 + change
+    return pd.DataFrame(factors, index=list(scenarios), columns=columns)
+
+
+def scenario_cogs(
+    flat_bom: FlatBOM,
+    materials: Dict[str, Material],
+    scenarios: ScenarioSpec,
+    include_base: bool = True,
+) -> pd.DataFrame:
+    """
+    مصفوفة COGS (سيناريوهات × SKU) في عملية واحدة: (F · Uᵀ)ᵀ
+    حيث U أسعار المواد لكل سيناريو و F قائمة المواد المُفككة
+    """
+    factors = shock_matrix(flat_bom, materials, scenarios)
+    if include_base and BASE_SCENARIO not in factors.index:
+        base = pd.DataFrame(1.0, index=[BASE_SCENARIO], columns=factors.columns)
+        factors = pd.concat([base, factors])
+    unit_costs = factors.to_numpy() * flat_bom.cost_vector(materials)
+    cogs = np.asarray(flat_bom.quantities @ unit_costs.T).T
+    return pd.DataFrame(cogs, index=factors.index, columns=pd.Index(flat_bom.skus, name="SKU"))
+
+
+def scenario_pricing(
+    cogs: pd.DataFrame,
+    channel: ChannelFees,
+    target_margin: float = 0.10,
+    current_prices: Union[pd.Series, Dict[str, float], None] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    الأسعار والهوامش لكل سيناريو (نفس معادلات calculate_price_breakdown)
+
+    cogs: ناتج scenario_cogs
+    current_prices: أسعار البيع الحالية (شامل الضريبة قبل الخصم) لكل SKU؛
+    إذا لم تُمرر تُستخدم أسعار السيناريو الأساسي عند الهامش المستهدف
+    Returns: {"cogs", "price": السعر المطلوب للهامش المستهدف,
+              "margin" / "profit": الهامش والربح إذا بقيت الأسعار الحالية كما هي}
+    """
+    compiled = CompiledChannel.from_channel(channel)
+    values = cogs.to_numpy()
+    required = price_for_margin_array(values, compiled, target_margin=target_margin)
+
+    if current_prices is None:
+        base_row = cogs.index.get_loc(BASE_SCENARIO) if BASE_SCENARIO in cogs.index else 0
+        prices = required[base_row]
+    else:
+        prices = pd.Series(current_prices, dtype=float).reindex(cogs.columns).to_numpy()
+    profit, margin = margin_at_price_array(prices[None, :], values, compiled)
+
+    def frame(data: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(data, index=cogs.index, columns=cogs.columns)
+
+    return {"cogs": cogs, "price": frame(required), "margin": frame(margin), "profit": frame(profit)}
+
+
+def scenario_summary(results: Dict[str, pd.DataFrame], min_margin: float = 0.0) -> pd.DataFrame:
+    """ملخص لكل سيناريو: متوسط تغير COGS، متوسط الهامش، وعدد الـ SKU تحت الحد الأدنى للهامش"""
+    cogs = results["cogs"]
+    base = cogs.iloc[0].replace(0, np.nan)
+    margin = results["margin"]
+    return pd.DataFrame({
+        "avg_cogs_change_pct": ((cogs / base - 1) * 100).mean(axis=1),
+        "avg_margin_pct": margin.mean(axis=1) * 100,
+        "skus_below_min_margin": (margin < min_margin).sum(axis=1),
+        "total_profit_per_unit": results["profit"].sum(axis=1),
+    })
+
+
+def skus_at_risk(results: Dict[str, pd.DataFrame], scenario: str, min_margin: float = 0.0) -> List[str]:
+    """الـ SKU التي ينخفض هامشها تحت الحد في سيناريو معين، مرتبة من الأسوأ"""
+    margin = results["margin"].loc[scenario]
+    return margin[margin < min_margin].sort_values().index.tolist()
@@ -0,0 +1,95 @@
+"""
+لقطة مُجمّعة لبيانات التكلفة - Compiled Cost Catalog Snapshot
+Pickled materials / recipes / compositions keyed by the source files' size, mtime and content hash
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Dict, Tuple
+
+SNAPSHOT_FILE = ".cost_catalog.pkl"
+FLAT_BOM_FILE = ".flat_bom.pkl"
+SNAPSHOT_VERSION = 2
+SOURCE_FILES = ("raw_materials_template.csv", "products_template.csv", "packages_template.csv")
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stat_key(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def source_fingerprint(data_dir: str) -> Dict[str, Dict]:
+    """بصمة ملفات المصدر: الحجم، وقت التعديل، وهاش المحتوى"""
+    fingerprint = {}
+    for name in SOURCE_FILES:
+        path = os.path.join(data_dir, name)
+        size, mtime_ns = _stat_key(path)
+        fingerprint[name] = {"size": size, "mtime_ns": mtime_ns, "sha256": _file_hash(path)}
+    return fingerprint
+
+
+def _is_fresh(data_dir: str, stored: Dict[str, Dict]) -> bool:
+    """
+    اللقطة صالحة إذا لم تتغير الملفات.
+    الحجم ووقت التعديل يكفيان في الحالة العادية؛ الهاش يُحسب فقط عند اختلاف وقت التعديل
+    (مثلاً ملف أُعيد حفظه بنفس المحتوى).
+    """
+    for name in SOURCE_FILES:
+        entry = stored.get(name)
+        path = os.path.join(data_dir, name)
+        if entry is None or not os.path.exists(path):
+            return False
+        size, mtime_ns = _stat_key(path)
+        if size != entry["size"]:
+            return False
+        if mtime_ns != entry["mtime_ns"] and _file_hash(path) != entry["sha256"]:
+            return False
+    return True
+
+
+def read_snapshot(data_dir: str, name: str = SNAPSHOT_FILE):
+    """قراءة اللقطة إذا كانت حديثة، وإلا None"""
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    sources = payload.get("sources", {})
+    if payload.get("version") != SNAPSHOT_VERSION or not _is_fresh(data_dir, sources):
+        return None
+    # ملف أُعيد حفظه بنفس المحتوى: نحدّث البصمة حتى لا يُعاد حساب الهاش في كل تشغيل
+    if any(_stat_key(os.path.join(data_dir, source))[1] != sources[source]["mtime_ns"] for source in SOURCE_FILES):
+        write_snapshot(data_dir, payload["data"], source_fingerprint(data_dir), name)
+    return payload["data"]
+
+
+def write_snapshot(data_dir: str, data, sources: Dict[str, Dict], name: str = SNAPSHOT_FILE) -> bool:
+    """
+    حفظ اللقطة (كتابة ذرية). ترجع False إذا تعذر الحفظ، مثل مجلد للقراءة فقط
+
+    sources: البصمة المأخوذة قبل قراءة الملفات، حتى لا تُربط بيانات قديمة ببصمة أحدث
+    """
+    path = os.path.join(data_dir, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        payload = {"version": SNAPSHOT_VERSION, "sources": sources, "data": data}
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
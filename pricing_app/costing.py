@@ -1,87 +1,71 @@
 import pandas as pd
 from typing import Dict
 
+from .bom_graph import resolve_costs, resolve_package_costs
+from .cost_engine import compute_product_cogs
+
+def _recipes_from_frame(products_df: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+    """Build {Product_SKU: {material: qty}} from either BOM layout"""
+    recipes: Dict[str, Dict[str, float]] = {}
+    if 'BOM' in products_df.columns:
+        for sku, bom in zip(products_df['Product_SKU'], products_df['BOM']):
+            recipe = recipes.setdefault(sku, {})
+            for component in bom.split(';'):
+                mat_sku, qty = component.split(':')
+                recipe[mat_sku] = recipe.get(mat_sku, 0.0) + float(qty)
+    else:
+        for sku, mat_sku, qty in zip(products_df['Product_SKU'], products_df['Material_Code'], products_df['Quantity']):
+            recipes.setdefault(sku, {})[mat_sku] = float(qty)
+    return recipes
+
 def compute_product_costs(products_df: pd.DataFrame, materials: Dict) -> Dict[str, float]:
     """
     Compute COGS for each product based on BOM
     BOM format: MAT001:0.5;MAT002:1.0
+    (or the long Product_SKU / Material_Code / Quantity layout from load_products)
+
+    All products are costed in one sparse matrix-vector product.
     """
-    product_costs = {}
-    
-    for _, row in products_df.iterrows():
-        sku = row['Product_SKU']
-        bom = row['BOM']
-        
-        total_cost = 0.0
-        for component in bom.split(';'):
-            mat_sku, qty = component.split(':')
-            qty = float(qty)
-            if mat_sku in materials:
-                total_cost += materials[mat_sku].cost_per_unit * qty
-        
-        product_costs[sku] = total_cost
-    
-    return product_costs
+    return compute_product_cogs(_recipes_from_frame(products_df), materials)
 
 def compute_package_costs(
     packages_df: pd.DataFrame,
     product_costs: Dict[str, float],
     materials: Dict,
-    max_depth: int = 10
 ) -> Dict[str, float]:
     """
     Compute COGS for packages (supports nested packages)
     Components format: PROD001:2:product;MAT010:1:material;PKG001:1:package
+    (or the long Package_SKU / Product_SKU / Quantity layout from load_packages)
+
+    Packages are resolved in one topological pass, so nesting depth is not
+    limited. The explicit component type decides which catalog a SKU is
+    costed from, even when it exists in more than one; components of any
+    other type are ignored. The long layout has no type column, so there a
+    SKU is looked up as material, then product, then package. Packages on a
+    cycle or with missing components are left out of the result, use
+    bom_graph.resolve_package_costs for the full diagnostics report.
     """
-    package_costs = {}
-    unresolved = set(packages_df['Package_SKU'].tolist())
-    
-    # Iterative resolution for nested packages
-    for _ in range(max_depth):
-        if not unresolved:
-            break
-            
-        resolved_this_round = []
-        
-        for _, row in packages_df.iterrows():
-            pkg_sku = row['Package_SKU']
-            if pkg_sku not in unresolved:
+    if 'Components' not in packages_df.columns:
+        compositions: Dict[str, Dict[str, float]] = {}
+        for pkg_sku, comp_sku, qty in zip(packages_df['Package_SKU'], packages_df['Product_SKU'], packages_df['Quantity']):
+            compositions.setdefault(pkg_sku, {})[comp_sku] = float(qty)
+        return resolve_package_costs(compositions, product_costs, materials, strict=True).costs
+
+    # المواد والمنتجات أوراق بمفتاح (النوع، SKU) والبكج المتداخل بـ SKU نفسه،
+    # فلا يختلط SKU مكرر بين الكتالوجات
+    leaf_costs = {('material', sku): mat.cost_per_unit for sku, mat in materials.items()}
+    leaf_costs.update({('product', sku): cost for sku, cost in product_costs.items()})
+    typed: Dict[str, Dict] = {}
+    for pkg_sku, components in zip(packages_df['Package_SKU'], packages_df['Components']):
+        comps = typed.setdefault(pkg_sku, {})
+        for comp in components.split(';'):
+            comp_sku, qty, comp_type = comp.split(':')[:3]
+            if comp_type in ('material', 'product'):
+                key = (comp_type, comp_sku)
+            elif comp_type == 'package':
+                key = comp_sku
+            else:
                 continue
-                
-            components = row['Components']
-            total_cost = 0.0
-            can_resolve = True
-            
-            for comp in components.split(';'):
-                parts = comp.split(':')
-                comp_sku = parts[0]
-                qty = float(parts[1])
-                comp_type = parts[2]
-                
-                if comp_type == 'product':
-                    if comp_sku in product_costs:
-                        total_cost += product_costs[comp_sku] * qty
-                    else:
-                        can_resolve = False
-                        break
-                elif comp_type == 'material':
-                    if comp_sku in materials:
-                        total_cost += materials[comp_sku].cost_per_unit * qty
-                    else:
-                        can_resolve = False
-                        break
-                elif comp_type == 'package':
-                    if comp_sku in package_costs:
-                        total_cost += package_costs[comp_sku] * qty
-                    else:
-                        can_resolve = False
-                        break
-            
-            if can_resolve:
-                package_costs[pkg_sku] = total_cost
-                resolved_this_round.append(pkg_sku)
-        
-        for sku in resolved_this_round:
-            unresolved.remove(sku)
-    
-    return package_costs
\ No newline at end of file
+            comps[key] = comps.get(key, 0.0) + float(qty)
+    return resolve_costs(typed, leaf_costs, strict=True).costs
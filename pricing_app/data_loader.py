@@ -1,98 +1,173 @@
 import pandas as pd
+import numpy as np
 from typing import Dict, Tuple
 from .models import Material, Product, Package
+from .cost_snapshot import FLAT_BOM_FILE, read_snapshot, source_fingerprint, write_snapshot
 
-def load_materials(filepath: str) -> Dict[str, Material]:
-    """Load raw materials from CSV"""
+REJECTION_COLUMNS = ['row', 'sku', 'reason']
+
+def clean_str(df: pd.DataFrame, column: str, default: str = '') -> pd.Series:
+    """Strip a whole text column at once; missing column/cells become `default`"""
+    if column not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    values = df[column].astype('string').str.strip().fillna('')
+    if default:
+        values = values.mask(values == '', default)
+    return values.astype(object)
+
+def clean_number(df: pd.DataFrame, column: str) -> pd.Series:
+    """Coerce a whole numeric column at once (thousands separators allowed); invalid cells become NaN"""
+    if column not in df.columns:
+        return pd.Series(np.nan, index=df.index, dtype=float)
+    values = df[column]
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype('string').str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(values, errors='coerce').astype(float)
+
+def _rejections(masks: Dict[str, pd.Series], skus: pd.Series) -> pd.DataFrame:
+    """Per-row rejection report; a row is reported once with the first failing reason"""
+    reason = pd.Series('', index=skus.index, dtype=object)
+    for label, mask in masks.items():
+        reason = reason.mask((reason == '') & mask, label)
+    rejected = reason != ''
+    return pd.DataFrame({
+        'row': skus.index[rejected],
+        'sku': skus[rejected].to_numpy(),
+        'reason': reason[rejected].to_numpy(),
+    }, columns=REJECTION_COLUMNS)
+
+def _group_mapping(keys: pd.Series, components: pd.Series, quantities: pd.Series) -> Dict[str, Dict[str, float]]:
+    """Build {key: {component: qty}} with one groupby; duplicated pairs keep the last row"""
+    frame = pd.DataFrame({'key': keys, 'component': components, 'qty': quantities})
+    frame = frame.drop_duplicates(['key', 'component'], keep='last')
+    component_values = frame['component'].to_numpy()
+    qty_values = frame['qty'].to_numpy()
+    return {
+        key: dict(zip(component_values[positions], qty_values[positions].tolist()))
+        for key, positions in frame.groupby('key', sort=False).indices.items()
+    }
+
+def load_materials(filepath: str, with_rejections: bool = False):
+    """Load raw materials from CSV
+
+    Columns are cleaned and coerced as whole vectors. With with_rejections=True
+    returns (materials, rejections) where rejections lists every dropped row
+    (row, sku, reason).
+    """
     df = pd.read_csv(filepath)
     
     # Normalize column names
     df.columns = df.columns.str.strip()
     
-    materials = {}
-    for _, row in df.iterrows():
-        try:
-            sku = str(row.get('Material_SKU', '')).strip()
-            name = str(row.get('Material_Name', '')).strip()
-            category = str(row.get('Category', 'Unknown')).strip()
-            unit = str(row.get('Purchase_UoM', 'Unit')).strip()
-            cost = float(row.get('Cost_Price', 0))
-            
-            if sku and cost > 0:
-                mat = Material(
-                    material_sku=sku,
-                    material_name=name or sku,
-                    category=category,
-                    unit=unit,
-                    cost_per_unit=cost
-                )
-                materials[mat.material_sku] = mat
-        except Exception as e:
-            print(f"Warning: Could not load material row: {e}")
-            continue
+    sku = clean_str(df, 'Material_SKU')
+    name = clean_str(df, 'Material_Name')
+    category = clean_str(df, 'Category', 'Unknown')
+    unit = clean_str(df, 'Purchase_UoM', 'Unit')
+    cost = clean_number(df, 'Cost_Price')
+    name = name.mask(name == '', sku)
+
+    invalid = (sku == '') | cost.isna() | (cost <= 0)
+    rejections = _rejections({
+        'missing_sku': sku == '',
+        'invalid_cost': cost.isna(),
+        'non_positive_cost': cost <= 0,
+        # a later valid row with the same SKU wins, as before
+        'duplicate_sku': sku.where(~invalid).duplicated(keep='last') & ~invalid,
+    }, sku)
+    valid = ~df.index.isin(rejections['row'])
+
+    materials = {
+        s: Material(material_sku=s, material_name=n, category=c, unit=u, cost_per_unit=v)
+        for s, n, c, u, v in zip(
+            sku[valid], name[valid], category[valid], unit[valid], cost[valid].tolist()
+        )
+    }
     
+    if with_rejections:
+        return materials, rejections
     return materials
 
-def load_products(filepath: str) -> Tuple[pd.DataFrame, Dict]:
-    """Load products BOM from CSV - returns DataFrame and product recipe dictionary"""
+def load_products(filepath: str, with_rejections: bool = False) -> Tuple[pd.DataFrame, Dict]:
+    """Load products BOM from CSV - returns DataFrame and product recipe dictionary
+
+    With with_rejections=True a fourth element lists the dropped BOM rows.
+    """
     df = pd.read_csv(filepath)
     df.columns = df.columns.str.strip()
     
+    product_sku = clean_str(df, 'Product_SKU')
+    material_code = clean_str(df, 'Material_Code')
+    quantity = clean_number(df, 'Quantity')
+
+    rejections = _rejections({
+        'missing_sku': product_sku == '',
+        'missing_component': material_code == '',
+        'invalid_quantity': quantity.isna(),
+    }, product_sku)
+    valid = ~df.index.isin(rejections['row'])
+
     # Create a dictionary mapping Product_SKU to list of materials
-    product_recipes = {}
-    
-    for _, row in df.iterrows():
-        product_sku = str(row.get('Product_SKU', '')).strip()
-        material_code = str(row.get('Material_Code', '')).strip()
-        quantity = float(row.get('Quantity', 0))
-        
-        if product_sku and material_code:
-            if product_sku not in product_recipes:
-                product_recipes[product_sku] = {}
-            product_recipes[product_sku][material_code] = quantity
+    product_recipes = _group_mapping(product_sku[valid], material_code[valid], quantity[valid])
     
     # Create a summary DataFrame with unique products
     products_summary = df.groupby('Product_SKU').agg({
         'Product_Name': 'first'
     }).reset_index()
     
+    if with_rejections:
+        return df, product_recipes, products_summary, rejections
     return df, product_recipes, products_summary
 
-def load_packages(filepath: str) -> Tuple[pd.DataFrame, Dict]:
+def load_packages(filepath: str, with_rejections: bool = False) -> Tuple[pd.DataFrame, Dict]:
     """Load packages components from CSV - returns DataFrame and package composition dictionary.
     البكج قد يحتوي على:
     - مواد خام مباشرة (يتم تخزينها مع بادئة MAT_)
     - منتجات (يتم تخزينها مع بادئة PRD_)
     - بكجات أخرى (يتم تخزينها مع بادئة PKG_)
+
+    With with_rejections=True a fourth element lists the dropped rows.
     """
     df = pd.read_csv(filepath)
     df.columns = df.columns.str.strip()
     
-    # Create a dictionary mapping Package_SKU to list of components
-    # Key format: "MAT_<sku>" for materials, "PRD_<sku>" for products, "PKG_<sku>" for packages
-    package_compositions = {}
-    
-    for _, row in df.iterrows():
-        package_sku = str(row.get('Package_SKU', '')).strip()
-        component_sku = str(row.get('Product_SKU', '')).strip()  # Can be product, package, or material SKU
-        quantity = float(row.get('Quantity', 0))
-        
-        if package_sku and component_sku:
-            if package_sku not in package_compositions:
-                package_compositions[package_sku] = {}
-            # Store with the component SKU as-is (caller will determine type)
-            package_compositions[package_sku][component_sku] = quantity
+    package_sku = clean_str(df, 'Package_SKU')
+    component_sku = clean_str(df, 'Product_SKU')  # Can be product, package, or material SKU
+    quantity = clean_number(df, 'Quantity')
+
+    rejections = _rejections({
+        'missing_sku': package_sku == '',
+        'missing_component': component_sku == '',
+        'invalid_quantity': quantity.isna(),
+    }, package_sku)
+    valid = ~df.index.isin(rejections['row'])
+
+    # Create a dictionary mapping Package_SKU to its components
+    # Store with the component SKU as-is (caller will determine type)
+    package_compositions = _group_mapping(package_sku[valid], component_sku[valid], quantity[valid])
     
     # Create a summary DataFrame with unique packages
     packages_summary = df.groupby('Package_SKU').agg({
         'Package_Name': 'first'
     }).reset_index()
     
+    if with_rejections:
+        return df, package_compositions, packages_summary, rejections
     return df, package_compositions, packages_summary
 
-def load_cost_data(data_dir: str) -> Tuple[Dict, Dict, pd.DataFrame, Dict, pd.DataFrame]:
-    """Load all cost-related data"""
+def load_cost_data(data_dir: str, use_snapshot: bool = True) -> Tuple[Dict, Dict, pd.DataFrame, Dict, pd.DataFrame]:
+    """Load all cost-related data
+
+    When use_snapshot is True the parsed result is reused from the compiled
+    snapshot in data_dir (see cost_snapshot) as long as the three template
+    CSVs are unchanged, and rebuilt when any of them is stale.
+    """
     import os
+
+    if use_snapshot:
+        cached = read_snapshot(data_dir)
+        if cached is not None:
+            return cached
+        sources = source_fingerprint(data_dir)
     
     materials = load_materials(os.path.join(data_dir, 'raw_materials_template.csv'))
     
@@ -104,4 +179,29 @@ def load_cost_data(data_dir: str) -> Tuple[Dict, Dict, pd.DataFrame, Dict, pd.Da
         os.path.join(data_dir, 'packages_template.csv')
     )
     
-    return materials, product_recipes, products_summary, package_compositions, packages_summary
\ No newline at end of file
+    data = (materials, product_recipes, products_summary, package_compositions, packages_summary)
+    if use_snapshot:
+        write_snapshot(data_dir, data, sources)
+    return data
+
+
+def load_flat_bom(data_dir: str, use_snapshot: bool = True):
+    """Load the fully exploded BOM (cost_engine.FlatBOM) for every product and package
+
+    Stored next to the cost catalog snapshot and rebuilt with it when the
+    template CSVs change.
+    """
+    from .cost_engine import build_flat_bom
+
+    if use_snapshot:
+        cached = read_snapshot(data_dir, FLAT_BOM_FILE)
+        if cached is not None:
+            return cached
+        sources = source_fingerprint(data_dir)
+
+    materials, product_recipes, _, package_compositions, _ = load_cost_data(data_dir, use_snapshot)
+    flat_bom = build_flat_bom(materials, product_recipes, package_compositions)
+
+    if use_snapshot:
+        write_snapshot(data_dir, flat_bom, sources, FLAT_BOM_FILE)
+    return flat_bom
@@ -0,0 +1,252 @@
+"""
+مرونة الطلب السعرية - Price Elasticity & Profit-Maximizing Prices
+Per-SKU elasticity from the order history and pricing_history.csv (shrunk toward a family estimate),
+then a batched grid search for the profit-maximizing list price per channel above the BUSINESS_RULES floor
+"""
+
+import argparse
+import os
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from config.settings import BUSINESS_RULES
+from .advanced_pricing import margin_at_price_array, solve_price_for_margin_array
+from .channels import load_channels
+from .compiled_channel import CompiledChannel
+from .cost_graph import get_cost_graph
+from .data_loader import clean_number, clean_str
+from .order_store import load_orders_table, resolve_orders_file
+
+HISTORY_FILE = "pricing_history.csv"
+DEMAND_COLUMNS = ["sku_code", "qty", "order_date"]  # أعمدة الطلبات التي يقرأها demand_observations
+DEFAULT_ELASTICITY = -1.5  # عند غياب تغيرات سعرية كافية للـ SKU وعائلته
+ELASTICITY_BOUNDS = (-6.0, -0.1)
+OPTIMUM_COLUMNS = [
+    "channel", "SKU", "elasticity", "cogs", "reference_price", "floor_price", "optimal_price",
+    "optimal_margin", "expected_qty", "expected_profit", "profit_change_pct", "meets_recommended", "at_price_cap",
+]
+
+
+def load_price_history(filepath: str) -> pd.DataFrame:
+    """
+    سجلات pricing_history.csv (المحفوظة من صفحة التسعير) بأعمدة موحدة:
+    date, SKU, channel, list_price, discount_rate, paid_price (السعر بعد الخصم)
+    """
+    columns = ["date", "SKU", "channel", "list_price", "discount_rate", "paid_price"]
+    if not os.path.exists(filepath):
+        return pd.DataFrame(columns=columns)
+    raw = pd.read_csv(filepath, encoding="utf-8-sig")
+    history = pd.DataFrame({
+        "date": pd.to_datetime(clean_str(raw, "التاريخ"), errors="coerce"),
+        "SKU": clean_str(raw, "SKU"),
+        "channel": clean_str(raw, "المنصة"),
+        "list_price": clean_number(raw, "سعر القائمة"),
+        "discount_rate": clean_number(raw, "نسبة الخصم").fillna(0.0) / 100,
+    })
+    history["paid_price"] = clean_number(raw, "سعر بعد الخصم").fillna(
+        history["list_price"] * (1 - history["discount_rate"])
+    )
+    history = history.dropna(subset=["date", "list_price"])
+    history = history[(history["SKU"] != "") & (history["list_price"] > 0)]
+    return history.sort_values("date", kind="stable").reset_index(drop=True)[columns]
+
+
+def latest_list_prices(history: pd.DataFrame, channel: Optional[str] = None) -> pd.Series:
+    """
+    آخر سعر قائمة لكل SKU من load_price_history (الترتيب حسب التاريخ)
+    channel: قناة واحدة فقط (أسماء القنوات تُقارن بدون المسافات الزائدة)
+    """
+    if channel is not None:
+        history = history[history["channel"] == str(channel).strip()]
+    return history.drop_duplicates("SKU", keep="last").set_index("SKU")["list_price"]
+
+
+def demand_observations(orders_df: pd.DataFrame, price_history: pd.DataFrame, freq: str = "M") -> pd.DataFrame:
+    """
+    (SKU، فترة): الكمية المباعة والسعر المدفوع الساري في بداية الفترة (merge-asof على سجل الأسعار)
+    orders_df: الطلبات المفككة (sku_code, qty, order_date)؛ الفترات بدون سعر معروف أو بدون مبيعات تُستبعد
+    """
+    orders = orders_df[DEMAND_COLUMNS].copy()
+    orders["order_date"] = pd.to_datetime(orders["order_date"], errors="coerce")
+    orders = orders.dropna(subset=["order_date"])
+    orders["period"] = orders["order_date"].dt.to_period(freq).dt.start_time
+    sales = orders.groupby(["sku_code", "period"], as_index=False)["qty"].sum()
+    sales = sales[sales["qty"] > 0].rename(columns={"sku_code": "SKU"})
+
+    prices = price_history[["date", "SKU", "paid_price"]].rename(columns={"date": "period"})
+    key_types = {"period": "datetime64[ns]", "SKU": str}
+    observations = pd.merge_asof(
+        sales.sort_values("period").astype(key_types),
+        prices.sort_values("period").astype(key_types),
+        on="period", by="SKU", direction="backward",
+    )
+    observations = observations.dropna(subset=["paid_price"])
+    return observations[observations["paid_price"] > 0].reset_index(drop=True)
+
+
+def estimate_elasticities(
+    observations: pd.DataFrame,
+    families: Optional[Union[pd.Series, Dict[str, str]]] = None,
+    prior_strength: float = 0.02,
+    default: float = DEFAULT_ELASTICITY,
+) -> pd.DataFrame:
+    """
+    مرونة log-log لكل SKU: ln(الكمية) = a + e · ln(السعر)، محسوبة لكل الـ SKU دفعة واحدة بمجاميع groupby
+
+    التقدير مُنكمش نحو مرونة العائلة (انحدار مجمّع بعد طرح متوسط كل SKU)، أو default إذا لم تتغير أسعار العائلة:
+    e = (Sxy + k · e_عائلة) / (Sxx + k) حيث Sxx تباين ln(السعر) للـ SKU و k = prior_strength
+    (0.02 ≈ ستة أشهر بتغير سعر ±6%)؛ الناتج مقصوص إلى ELASTICITY_BOUNDS
+    Returns: elasticity, family, periods, price_changes (عدد الأسعار المختلفة), raw_elasticity
+    """
+    obs = observations.assign(lp=np.log(observations["paid_price"]), lq=np.log(observations["qty"]))
+    grouped = obs.groupby("SKU")
+    obs["dp"] = obs["lp"] - grouped["lp"].transform("mean")
+    obs["dq"] = obs["lq"] - grouped["lq"].transform("mean")
+    obs["sxx"] = obs["dp"] ** 2
+    obs["sxy"] = obs["dp"] * obs["dq"]
+
+    stats = obs.groupby("SKU").agg(
+        sxx=("sxx", "sum"), sxy=("sxy", "sum"), periods=("lq", "size"), price_changes=("paid_price", "nunique"),
+    )
+    family_map = pd.Series(families, dtype=object) if families is not None else pd.Series(dtype=object)
+    # الـ SKU بدون عائلة = عائلة من نفسه
+    stats["family"] = pd.Series(stats.index.map(family_map), index=stats.index).fillna(stats.index.to_series())
+
+    family_stats = stats.groupby("family")[["sxx", "sxy"]].sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        family_elasticity = (family_stats["sxy"] / family_stats["sxx"]).where(family_stats["sxx"] > 0, default)
+        raw = (stats["sxy"] / stats["sxx"]).where(stats["sxx"] > 0)
+    prior = stats["family"].map(family_elasticity).clip(*ELASTICITY_BOUNDS)
+    elasticity = (stats["sxy"] + prior_strength * prior) / (stats["sxx"] + prior_strength)
+
+    stats["elasticity"] = elasticity.clip(*ELASTICITY_BOUNDS)
+    stats["raw_elasticity"] = raw
+    return stats[["elasticity", "family", "periods", "price_changes", "raw_elasticity"]]
+
+
+def _profit_grid(prices, cogs, channel, reference, elasticity, base_qty, floor_margin):
+    """ربح الفترة لكل نقطة في الشبكة؛ النقاط تحت الحد الأدنى للهامش = -inf"""
+    unit_profit, margin = margin_at_price_array(prices, cogs[:, None], channel)
+    qty = base_qty[:, None] * (prices / reference[:, None]) ** elasticity[:, None]
+    profit = np.where(margin >= floor_margin - 1e-12, unit_profit * qty, -np.inf)
+    return profit, margin, qty
+
+
+def optimal_prices(
+    cogs: Union[pd.Series, Dict[str, float]],
+    channels: Dict[str, object],
+    elasticities: Union[pd.Series, Dict[str, float]],
+    reference_prices: Optional[Union[pd.Series, Dict[str, float]]] = None,
+    base_qty: Optional[Union[pd.Series, Dict[str, float]]] = None,
+    min_margin: float = BUSINESS_RULES["min_profit_margin"],
+    recommended_margin: float = BUSINESS_RULES["recommended_profit_margin"],
+    max_price_ratio: float = 2.0,
+    grid_points: int = 101,
+    refinements: int = 2,
+) -> pd.DataFrame:
+    """
+    سعر القائمة (شامل الضريبة قبل الخصم) الذي يعظم ربح الفترة لكل SKU على كل قناة
+
+    الطلب بمرونة ثابتة حول السعر المرجعي: q(P) = q0 · (P / P0)^e
+    البحث: شبكة (SKU × نقاط) من سعر الحد الأدنى للهامش (min_margin) حتى max_price_ratio × السعر المرجعي،
+    ثم تضييق الشبكة حول الأفضل refinements مرات - كل ذلك مصفوفات لكل الـ SKU معاً.
+    at_price_cap = True يعني أن الربح ما زال يزيد عند حد البحث (مرونة ضعيفة)
+    reference_prices: الأسعار الحالية؛ الـ SKU بدون سعر تأخذ سعر الهامش الموصى به على كل قناة
+    base_qty: الكمية المرجعية للفترة (1 إذا لم تُمرر - السعر الأمثل لا يتأثر بها)
+    elasticities: مرونة لكل SKU (ناتج estimate_elasticities)؛ الناقص = DEFAULT_ELASTICITY
+    """
+    cogs = pd.Series(cogs, dtype=float)
+    skus = cogs.index
+    cogs_values = cogs.to_numpy()
+    e = pd.Series(elasticities, dtype=float).reindex(skus).fillna(DEFAULT_ELASTICITY).to_numpy()
+    q0 = (pd.Series(base_qty, dtype=float).reindex(skus).fillna(1.0) if base_qty is not None
+          else pd.Series(1.0, index=skus)).to_numpy()
+    current = pd.Series(reference_prices, dtype=float).reindex(skus) if reference_prices is not None else None
+
+    blocks = []
+    for channel_name, channel in channels.items():
+        compiled = channel if isinstance(channel, CompiledChannel) else CompiledChannel.from_channel(channel)
+        reference = solve_price_for_margin_array(cogs_values, compiled, target_margin=recommended_margin)
+        if current is not None:
+            reference = current.fillna(pd.Series(reference, index=skus)).to_numpy()
+        floor_price = solve_price_for_margin_array(cogs_values, compiled, target_margin=min_margin)
+
+        cap = np.fmax(reference * max_price_ratio, floor_price * 1.5)
+        low, high = floor_price, cap
+        steps = np.linspace(0.0, 1.0, grid_points)
+        for _ in range(refinements + 1):
+            grid = low[:, None] + (high - low)[:, None] * steps[None, :]
+            profit, margin, qty = _profit_grid(grid, cogs_values, compiled, reference, e, q0, min_margin)
+            best = np.argmax(np.where(np.isnan(profit), -np.inf, profit), axis=1)
+            best_price = grid[np.arange(len(skus)), best]
+            width = (high - low) / (grid_points - 1)
+            low, high = np.fmax(best_price - width, floor_price), np.fmin(best_price + width, cap)
+
+        rows = np.arange(len(skus))
+        best_profit = profit[rows, best]
+        ref_profit, _, _ = _profit_grid(reference[:, None], cogs_values, compiled, reference, e, q0, -np.inf)
+        feasible = np.isfinite(best_profit)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = np.where(ref_profit[:, 0] != 0, (best_profit / ref_profit[:, 0] - 1) * 100, np.nan)
+
+        blocks.append(pd.DataFrame({
+            "channel": channel_name,
+            "SKU": skus,
+            "elasticity": e,
+            "cogs": cogs_values,
+            "reference_price": reference,
+            "floor_price": floor_price,
+            "optimal_price": np.where(feasible, best_price, np.nan),
+            "optimal_margin": np.where(feasible, margin[rows, best], np.nan),
+            "expected_qty": np.where(feasible, qty[rows, best], np.nan),
+            "expected_profit": np.where(feasible, best_profit, np.nan),
+            "profit_change_pct": np.where(feasible, change, np.nan),
+            "meets_recommended": feasible & (margin[rows, best] >= recommended_margin - 1e-9),
+            "at_price_cap": feasible & np.isclose(best_price, cap),  # الأمثل الحقيقي أعلى من حد البحث
+        }))
+
+    if not blocks:
+        return pd.DataFrame(columns=OPTIMUM_COLUMNS)
+    return pd.concat(blocks, ignore_index=True)[OPTIMUM_COLUMNS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate price elasticities and profit-maximizing list prices")
+    parser.add_argument("--data-dir", default="data", help="Data directory")
+    parser.add_argument(
+        "--orders", default=None,
+        help="Exploded orders CSV or .parquet/.feather order store (default: <data-dir>/salla_orders_exploded.csv, "
+             "read from the store next to it when that is newer)",
+    )
+    parser.add_argument("--output", default=None, help="Output CSV (default: <data-dir>/optimal_prices.csv)")
+    args = parser.parse_args()
+
+    orders_file = resolve_orders_file(args.orders or os.path.join(args.data_dir, "salla_orders_exploded.csv"))
+    channels = load_channels(os.path.join(args.data_dir, "channels.json"))
+    if not channels:
+        print("⚠️ لا توجد قنوات محفوظة")
+        return
+
+    history = load_price_history(os.path.join(args.data_dir, HISTORY_FILE))
+    elasticities = pd.Series(dtype=float)
+    base_qty = None
+    if os.path.exists(orders_file) and not history.empty:
+        observations = demand_observations(load_orders_table(orders_file, DEMAND_COLUMNS), history)
+        elasticities = estimate_elasticities(observations)["elasticity"]
+        base_qty = observations.groupby("SKU")["qty"].mean()
+    else:
+        print(f"⚠️ لا يوجد سجل طلبات/أسعار كافٍ - المرونة الافتراضية {DEFAULT_ELASTICITY}")
+
+    costs = get_cost_graph(args.data_dir).cost_frame().dropna(subset=["COGS"]).drop_duplicates("SKU")
+    latest = latest_list_prices(history) if not history.empty else None
+    result = optimal_prices(costs.set_index("SKU")["COGS"], channels, elasticities, latest, base_qty)
+
+    output = args.output or os.path.join(args.data_dir, "optimal_prices.csv")
+    result.to_csv(output, index=False, encoding="utf-8-sig")
+    print(f"✅ {len(result)} سعر أمثل ({len(elasticities)} SKU بمرونة مقدرة) → {output}")
+
+
+if __name__ == "__main__":
+    main()
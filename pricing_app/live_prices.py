@@ -0,0 +1,77 @@
+"""
+فحص الأسعار الحالية - Live Price List Health Check
+Scores the current live price list (SKU, channel, price) for the whole catalog in one vectorized call
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+from .advanced_pricing_engine import ALERT_MESSAGES, AdvancedPricingEngine
+from .channels import load_channels
+from .cost_graph import CostGraph, get_cost_graph
+from .data_loader import clean_number, clean_str
+
+LIVE_PRICES_FILE = "live_prices.csv"
+# أسماء الأعمدة المقبولة في ملف الأسعار (إنجليزي أو عربي)
+COLUMN_ALIASES = {
+    "SKU": ("SKU", "sku", "sku_code"),
+    "channel": ("channel", "المنصة", "القناة"),
+    "price_with_vat": ("price_with_vat", "price", "السعر", "سعر القائمة"),
+}
+
+
+def load_live_prices(filepath: str) -> pd.DataFrame:
+    """قائمة الأسعار الحالية: SKU, channel, price_with_vat (شامل الضريبة قبل الخصم)؛ الصفوف بدون سعر تُستبعد"""
+    raw = pd.read_csv(filepath, encoding="utf-8-sig")
+    columns = {}
+    for target, aliases in COLUMN_ALIASES.items():
+        source = next((alias for alias in aliases if alias in raw.columns), None)
+        if source is None:
+            raise ValueError(f"عمود مفقود في ملف الأسعار: {target} (المقبول: {', '.join(aliases)})")
+        columns[target] = source
+    prices = pd.DataFrame({
+        "SKU": clean_str(raw, columns["SKU"]),
+        "channel": clean_str(raw, columns["channel"]),
+        "price_with_vat": clean_number(raw, columns["price_with_vat"]),
+    })
+    return prices[(prices["SKU"] != "") & prices["price_with_vat"].notna()].reset_index(drop=True)
+
+
+def score_live_prices(price_list: pd.DataFrame, cost_graph: CostGraph, channels: dict) -> pd.DataFrame:
+    """تقييم قائمة الأسعار بتكاليف cost_graph الحالية (AdvancedPricingEngine.evaluate_price_list)"""
+    costs = cost_graph.cost_frame().dropna(subset=["COGS"]).drop_duplicates("SKU").set_index("SKU")["COGS"]
+    return AdvancedPricingEngine().evaluate_price_list(price_list, costs, channels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the live price list against current costs and channel fees")
+    parser.add_argument("--data-dir", default="data", help="Data directory")
+    parser.add_argument("--prices", default=None, help=f"Live prices CSV (default: <data-dir>/{LIVE_PRICES_FILE})")
+    parser.add_argument("--output", default=None, help="Output file (.parquet or .csv, default: <data-dir>/live_price_health.csv)")
+    args = parser.parse_args()
+
+    prices_file = args.prices or os.path.join(args.data_dir, LIVE_PRICES_FILE)
+    if not os.path.exists(prices_file):
+        print(f"❌ لم يتم العثور على ملف الأسعار: {prices_file}")
+        return
+    channels = load_channels(os.path.join(args.data_dir, "channels.json"))
+    scored = score_live_prices(load_live_prices(prices_file), get_cost_graph(args.data_dir), channels)
+
+    output = args.output or os.path.join(args.data_dir, "live_price_health.csv")
+    if output.endswith(".parquet"):
+        scored.to_parquet(output, index=False)
+    else:
+        scored.to_csv(output, index=False, encoding="utf-8-sig")
+
+    print(f"✅ {len(scored)} سعر تم تقييمه → {output}")
+    for band, count in scored["margin_band"].value_counts(sort=False).items():
+        print(f"   {band}: {count}")
+    codes = scored["alert_codes"].astype(str).str.split("|").explode()
+    for code, count in codes[codes != ""].value_counts().items():
+        print(f"   {ALERT_MESSAGES.get(code, code)}: {count}")
+
+
+if __name__ == "__main__":
+    main()
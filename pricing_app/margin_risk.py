@@ -0,0 +1,170 @@
+"""
+محاكاة مخاطر الهامش - Monte Carlo Margin-at-Risk
+Seeded samples × SKUs simulation of marketing %, discount depth, material costs
+and cancel/return rates, reduced to margin percentiles and probability of loss per channel
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .advanced_pricing import margin_at_price_array, solve_price_for_margin_array
+from .compiled_channel import CompiledChannel
+from .cost_graph import CostGraph
+from .salla_signals import STATUS_FILE, build_risk_table
+
+RISK_COLUMNS = [
+    "channel", "SKU", "cogs", "list_price", "expected_margin",
+    "margin_p5", "margin_p50", "margin_p95", "prob_loss", "risk_pct",
+]
+
+
+@dataclass
+class MarginUncertainty:
+    """توزيعات المدخلات غير المؤكدة (انحرافات مطلقة حول قيم القناة)"""
+    marketing_sd: float = 0.03  # انحراف نسبة التسويق (طبيعي، مقصوص عند 0)
+    discount_spread: float = 0.05  # عمق الخصم: منتظم ± هذه النقاط حول خصم القناة
+    material_cost_sd: float = 0.05  # تغير سعر كل مادة (لوغاريتمي طبيعي بمتوسط 1)
+    risk_prior_orders: int = 30  # وزن المعدل العام للـ SKU بدون سجل إلغاء/استرجاع كافٍ
+
+    def __post_init__(self):
+        if min(self.marketing_sd, self.discount_spread, self.material_cost_sd) < 0:
+            raise ValueError("الانحرافات يجب أن تكون ≥ 0")
+
+
+def load_status_table(data_dir: str = "data") -> Optional[pd.DataFrame]:
+    """حالات الطلبات لكل SKU من تحليل سلة (None إذا لم يوجد الملف)"""
+    path = os.path.join(data_dir, STATUS_FILE)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+
+def risk_beta_parameters(
+    skus, status_df: Optional[pd.DataFrame], min_orders: int = 30, prior_orders: int = 30,
+) -> pd.DataFrame:
+    """
+    معاملات توزيع Beta لمعدل الإلغاء/الاسترجاع لكل SKU من build_risk_table:
+    (ملغي + مسترجع + 1، مُسلّم + 1)؛ الـ SKU تحت min_orders تأخذ المعدل العام بوزن prior_orders طلب
+    """
+    skus = pd.Index(skus)
+    pooled_rate = 0.0
+    table = pd.DataFrame(columns=["sku_code", "delivered", "canceled", "returned", "risk_pct"])
+    if status_df is not None and not status_df.empty:
+        table = build_risk_table(status_df, min_orders=min_orders)
+        totals = status_df[["delivered", "canceled", "returned"]].sum()
+        total = totals.sum()
+        pooled_rate = float((totals["canceled"] + totals["returned"]) / total) if total else 0.0
+
+    table = table.drop_duplicates("sku_code").set_index("sku_code").reindex(skus)
+    failed = (table["canceled"] + table["returned"]).to_numpy(dtype=float)
+    delivered = table["delivered"].to_numpy(dtype=float)
+    known = ~np.isnan(failed)
+    alpha = np.where(known, failed, pooled_rate * prior_orders) + 1
+    beta = np.where(known, delivered, (1 - pooled_rate) * prior_orders) + 1
+    return pd.DataFrame({"alpha": alpha, "beta": beta, "risk_pct": alpha / (alpha + beta)}, index=skus)
+
+
+def simulate_channel_margins(
+    cogs_samples,
+    list_prices: np.ndarray,
+    channel: CompiledChannel,
+    marketing: np.ndarray,
+    discount: np.ndarray,
+    risk: np.ndarray,
+) -> np.ndarray:
+    """
+    هامش كل عينة (عينات × SKU) بمعادلات margin_at_price_array، مع توزيع تكلفة الطلبات الفاشلة:
+    كل طلب ملغي/مسترجع يخسر الشحن والتحضير، فتُحمّل على الطلبات المُسلّمة بنسبة r / (1 - r)
+    """
+    sampled = CompiledChannel.from_channel(channel, marketing_pct=marketing, discount_rate=discount)
+    profit, _ = margin_at_price_array(list_prices, cogs_samples, sampled)
+    net_price = list_prices * sampled.net_factor
+    fulfilment = np.where(sampled.is_free_fulfilment(list_prices), 0.0, sampled.fulfilment)
+    profit = profit - risk / (1 - risk) * fulfilment
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(net_price > 0, profit / net_price, 0.0)
+
+
+def margin_at_risk(
+    cost_graph: CostGraph,
+    channels: Dict[str, object],
+    n_samples: int = 10_000,
+    list_prices: Optional[Union[pd.Series, Dict[str, float]]] = None,
+    target_margin: float = 0.10,
+    uncertainty: Optional[MarginUncertainty] = None,
+    status_df: Optional[pd.DataFrame] = None,
+    seed: int = 0,
+    chunk_size: int = 1_000,
+) -> pd.DataFrame:
+    """
+    محاكاة مونت كارلو لهامش كل SKU على كل قناة
+
+    channels: {الاسم: channels.ChannelFees أو CompiledChannel}
+    list_prices: الأسعار الحالية (شامل الضريبة قبل الخصم)؛ الـ SKU بدون سعر تُسعّر عند target_margin لكل قناة
+    status_df: حالات الطلبات (salla_status_by_sku.csv)؛ إذا لم تُمرر تُقرأ من مجلد بيانات cost_graph
+    العينات تُولّد على دفعات بحجم chunk_size لحصر الذاكرة؛ نفس seed ونفس chunk_size ⇒ نفس النتائج،
+    وكل القنوات ترى نفس السحوبات فالمقارنة بينها عادلة.
+    Returns: صف لكل (قناة، SKU) بالأعمدة RISK_COLUMNS (الهوامش كنسب، prob_loss = P(الهامش < 0))
+    """
+    uncertainty = uncertainty or MarginUncertainty()
+    if status_df is None:
+        status_df = load_status_table(cost_graph.data_dir)
+
+    flat_bom = cost_graph.flat_bom
+    skus = pd.Index(flat_bom.skus)
+    unit_costs = flat_bom.cost_vector(cost_graph.materials)
+    base_cogs = np.asarray(flat_bom.quantities @ unit_costs)
+    risk_params = risk_beta_parameters(
+        skus, status_df, prior_orders=uncertainty.risk_prior_orders,
+    )
+    alpha, beta = risk_params["alpha"].to_numpy(), risk_params["beta"].to_numpy()
+    current = pd.Series(list_prices, dtype=float).reindex(skus) if list_prices is not None else None
+
+    blocks = []
+    for channel_name, channel in channels.items():
+        compiled = channel if isinstance(channel, CompiledChannel) else CompiledChannel.from_channel(channel)
+        prices = solve_price_for_margin_array(base_cogs, compiled, target_margin=target_margin)
+        if current is not None:
+            prices = current.fillna(pd.Series(prices, index=skus)).to_numpy()
+
+        margins = np.empty((n_samples, len(skus)), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_samples, chunk_size):
+            size = min(chunk_size, n_samples - start)
+            sigma = uncertainty.material_cost_sd
+            shocks = rng.lognormal(-sigma ** 2 / 2, sigma, size=(size, len(unit_costs)))
+            cogs_samples = np.asarray(flat_bom.quantities @ (shocks * unit_costs).T).T
+            marketing = np.clip(
+                compiled.marketing_pct + rng.normal(0.0, uncertainty.marketing_sd, size=(size, len(skus))), 0.0, None,
+            )
+            discount = np.clip(
+                compiled.discount_rate
+                + rng.uniform(-uncertainty.discount_spread, uncertainty.discount_spread, size=(size, len(skus))),
+                0.0, 0.95,
+            )
+            risk = rng.beta(alpha, beta, size=(size, len(skus)))
+            margins[start:start + size] = simulate_channel_margins(
+                cogs_samples, prices, compiled, marketing, discount, risk,
+            )
+
+        p5, p50, p95 = np.percentile(margins, [5, 50, 95], axis=0)
+        blocks.append(pd.DataFrame({
+            "channel": channel_name,
+            "SKU": skus,
+            "cogs": base_cogs,
+            "list_price": prices,
+            "expected_margin": margins.mean(axis=0, dtype=np.float64),
+            "margin_p5": p5,
+            "margin_p50": p50,
+            "margin_p95": p95,
+            "prob_loss": (margins < 0).mean(axis=0),
+            "risk_pct": risk_params["risk_pct"].to_numpy(),
+        }))
+
+    if not blocks:
+        return pd.DataFrame(columns=RISK_COLUMNS)
+    return pd.concat(blocks, ignore_index=True)[RISK_COLUMNS]
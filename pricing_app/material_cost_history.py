@@ -0,0 +1,103 @@
+"""
+تكاليف المواد حسب التاريخ - Time-versioned Material Costs
+Effective-dated material prices and as-of COGS for every order line in one merge-asof
+"""
+
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from .cost_engine import FlatBOM
+from .data_loader import clean_number, clean_str
+from .models import Material
+
+HISTORY_FILE = "material_cost_history.csv"
+
+
+def load_material_cost_history(filepath: str) -> pd.DataFrame:
+    """
+    تحميل سجل أسعار المواد: Material_SKU, Cost_Price, Effective_From
+    (الصفوف غير الصالحة تُستبعد)
+    """
+    df = pd.read_csv(filepath)
+    df.columns = df.columns.str.strip()
+    history = pd.DataFrame({
+        "material_sku": clean_str(df, "Material_SKU"),
+        "cost_per_unit": clean_number(df, "Cost_Price"),
+        "effective_from": pd.to_datetime(df.get("Effective_From"), errors="coerce"),
+    })
+    valid = (history["material_sku"] != "") & (history["cost_per_unit"] > 0) & history["effective_from"].notna()
+    return history[valid].sort_values("effective_from", kind="stable").reset_index(drop=True)
+
+
+class MaterialCostTimeline:
+    """
+    جدول COGS لكل SKU في كل فترة سعرية
+
+    الفترات تُحدد بتواريخ السريان في السجل: الفترة 0 قبل أول تاريخ، والفترة k تبدأ من التاريخ k.
+    المادة بدون سجل تبقى بسعرها الحالي (Cost_Price)، والمادة قبل أول سجل لها تأخذ أقدم سعر مسجل.
+    """
+
+    def __init__(self, flat_bom: FlatBOM, materials: Dict[str, Material], history: pd.DataFrame):
+        self.flat_bom = flat_bom
+        history = history[history["material_sku"].isin(flat_bom.material_pos)]
+        self.breakpoints = pd.DatetimeIndex(np.sort(history["effective_from"].unique()))
+
+        n_epochs = len(self.breakpoints) + 1
+        current = flat_bom.cost_vector(materials)
+        prices = np.repeat(current[:, None], n_epochs, axis=1)  # مواد × فترات
+        if len(history):
+            versions = (
+                history.pivot_table(index="effective_from", columns="material_sku", values="cost_per_unit", aggfunc="last")
+                .reindex(self.breakpoints)
+                .ffill()
+                .bfill()
+            )
+            cols = [flat_bom.material_pos[sku] for sku in versions.columns]
+            prices[cols, 0] = versions.iloc[0].to_numpy()
+            prices[cols, 1:] = versions.to_numpy().T
+
+        self.prices = prices
+        self.cogs = np.asarray(flat_bom.quantities @ prices)  # SKU × فترات
+
+    def cogs_table(self) -> pd.DataFrame:
+        """COGS لكل SKU (صفوف) لكل فترة سعرية (أعمدة بتاريخ بداية الفترة)"""
+        columns = ["before_" + str(self.breakpoints[0].date()) if len(self.breakpoints) else "current"]
+        columns += [str(d.date()) for d in self.breakpoints]
+        return pd.DataFrame(self.cogs, index=self.flat_bom.skus, columns=columns)
+
+    def epochs_for(self, dates: pd.Series) -> np.ndarray:
+        """رقم الفترة السعرية لكل تاريخ (merge-asof على تواريخ السريان). التاريخ المفقود = آخر فترة"""
+        dates = pd.to_datetime(pd.Series(dates).reset_index(drop=True), errors="coerce")
+        epoch = np.full(len(dates), len(self.breakpoints), dtype=np.int64)
+        known = dates.notna().to_numpy()
+        if len(self.breakpoints) and known.any():
+            lines = pd.DataFrame({"order_date": dates[known].astype("datetime64[ns]"), "pos": np.flatnonzero(known)})
+            lines = lines.sort_values("order_date", kind="stable")
+            starts = pd.DataFrame({
+                "order_date": self.breakpoints.astype("datetime64[ns]"),
+                "epoch": np.arange(1, len(self.breakpoints) + 1),
+            })
+            matched = pd.merge_asof(lines, starts, on="order_date", direction="backward")
+            epoch[matched["pos"].to_numpy()] = matched["epoch"].fillna(0).to_numpy(dtype=np.int64)
+        return epoch
+
+    def unit_cogs_as_of(self, sku_codes: pd.Series, dates: pd.Series) -> pd.Series:
+        """تكلفة الوحدة لكل سطر طلب بأسعار تاريخه (NaN للـ SKU غير الموجودة في قائمة المواد)"""
+        sku_codes = pd.Series(sku_codes)
+        sku_idx = pd.Index(self.flat_bom.skus).get_indexer(sku_codes.astype(str).str.strip())
+        epoch = self.epochs_for(dates)
+        unit = np.full(len(sku_idx), np.nan)
+        found = sku_idx >= 0
+        unit[found] = self.cogs[sku_idx[found], epoch[found]]
+        return pd.Series(unit, index=sku_codes.index)
+
+
+def load_cost_timeline(data_dir: str, flat_bom: FlatBOM, materials: Dict[str, Material]):
+    """بناء الجدول الزمني إذا كان ملف السجل موجوداً، وإلا None"""
+    path = os.path.join(data_dir, HISTORY_FILE)
+    if not os.path.exists(path):
+        return None
+    return MaterialCostTimeline(flat_bom, materials, load_material_cost_history(path))
@@ -0,0 +1,151 @@
+"""
+احتياج المواد الخام من طلبات سلة - Material Requirements from Salla Orders
+Joins exploded orders with the flattened BOM: one sparse product per grouping
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .cost_engine import FlatBOM
+from .cost_graph import get_cost_graph
+from .models import Material
+from .order_store import load_orders_table, resolve_orders_file
+
+DEFAULT_DATA_DIR = "data"
+ORDERS_FILE = "salla_orders_exploded.csv"
+ORDER_COLUMNS = ["order_date", "status", "city", "sku_code", "qty"]
+CANCELED_PATTERN = r"ملغي|cancel"
+
+
+def load_exploded_orders(path: str = os.path.join(DEFAULT_DATA_DIR, ORDERS_FILE)) -> pd.DataFrame:
+    """تحميل الطلبات المفككة (الأعمدة اللازمة فقط) من المخزن العمودي بجانب الملف إن وُجد وإلا من CSV"""
+    path = resolve_orders_file(path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"لم يتم العثور على الملف: {path}")
+    return load_orders_table(path, ORDER_COLUMNS)
+
+
+def sku_family(sku_codes: pd.Series) -> pd.Series:
+    """عائلة الـ SKU = البادئة الحرفية (OLIVEOILE1000M → OLIVEOILE)، وإلا الـ SKU نفسه"""
+    codes = sku_codes.astype(str).str.strip()
+    family = codes.str.extract(r"^([A-Za-z]+)", expand=False).str.upper()
+    return family.fillna(codes)
+
+
+def _prepare_orders(orders: pd.DataFrame, exclude_canceled: bool) -> pd.DataFrame:
+    df = orders
+    if exclude_canceled and "status" in df.columns:
+        canceled = df["status"].astype(str).str.lower().str.contains(CANCELED_PATTERN, regex=True, na=False)
+        df = df[~canceled]
+    df = df.assign(
+        sku_code=df["sku_code"].astype(str).str.strip(),
+        qty=pd.to_numeric(df["qty"], errors="coerce").fillna(0),
+    )
+    if "order_date" in df.columns:
+        df = df.assign(month=pd.to_datetime(df["order_date"], errors="coerce").dt.to_period("M").astype(str))
+    if "city" in df.columns:
+        df = df.assign(city=df["city"].astype(str).str.strip())
+    return df.assign(family=sku_family(df["sku_code"]))
+
+
+def _consumption(
+    df: pd.DataFrame,
+    flat_bom: FlatBOM,
+    by: List[str],
+    materials: Optional[Dict[str, Material]],
+) -> pd.DataFrame:
+    sku_idx = pd.Index(flat_bom.skus).get_indexer(df["sku_code"])
+    df = df[sku_idx >= 0]
+    sku_idx = sku_idx[sku_idx >= 0]
+
+    group_codes, groups = pd.MultiIndex.from_frame(df[by]).factorize()
+    demand = sparse.csr_matrix(
+        (df["qty"].to_numpy(dtype=float), (group_codes, sku_idx)),
+        shape=(len(groups), len(flat_bom.skus)),
+    )
+    consumption = (demand @ flat_bom.quantities).tocoo()
+
+    result = pd.DataFrame(list(groups[consumption.row]), columns=by)
+    result["material_sku"] = np.asarray(flat_bom.material_skus, dtype=object)[consumption.col]
+    result["quantity"] = consumption.data
+    if materials is not None:
+        unit_costs = flat_bom.cost_vector(materials)
+        result["cost"] = consumption.data * unit_costs[consumption.col]
+    result = result[result["quantity"] != 0]
+    return result.sort_values(by + ["quantity"], ascending=[True] * len(by) + [False]).reset_index(drop=True)
+
+
+def _unmatched(df: pd.DataFrame, flat_bom: FlatBOM) -> pd.DataFrame:
+    missing = df[~df["sku_code"].isin(flat_bom.sku_pos)]
+    return missing.groupby("sku_code")["qty"].sum().sort_values(ascending=False).reset_index()
+
+
+def material_consumption(
+    orders: pd.DataFrame,
+    flat_bom: FlatBOM,
+    by: Union[str, List[str]] = "month",
+    materials: Optional[Dict[str, Material]] = None,
+    exclude_canceled: bool = True,
+) -> pd.DataFrame:
+    """
+    استهلاك المواد الخام مجمعاً حسب أبعاد الطلب
+
+    by: عمود أو أكثر من: month, city, family, sku_code (أو أي عمود موجود في الطلبات)
+    الحساب: مصفوفة متفرقة (مجموعات × SKU) بالكميات المباعة مضروبة في قائمة المواد المُفككة (SKU × مواد)
+    Returns: أعمدة by + material_sku, quantity (+ cost إذا مُررت المواد)
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    return _consumption(_prepare_orders(orders, exclude_canceled), flat_bom, by, materials)
+
+
+def unmatched_skus(orders: pd.DataFrame, flat_bom: FlatBOM, exclude_canceled: bool = True) -> pd.DataFrame:
+    """الـ SKU المباعة غير الموجودة في قائمة المواد (لا يُحسب لها استهلاك)"""
+    return _unmatched(_prepare_orders(orders, exclude_canceled), flat_bom)
+
+
+def build_requirement_tables(
+    orders: pd.DataFrame,
+    flat_bom: FlatBOM,
+    materials: Optional[Dict[str, Material]] = None,
+    exclude_canceled: bool = True,
+) -> Dict[str, pd.DataFrame]:
+    """جداول الاحتياج الشهري، حسب المدينة، حسب عائلة الـ SKU، والـ SKU غير المطابقة"""
+    df = _prepare_orders(orders, exclude_canceled)
+    return {
+        "month": _consumption(df, flat_bom, ["month"], materials),
+        "city": _consumption(df, flat_bom, ["city"], materials),
+        "family": _consumption(df, flat_bom, ["family"], materials),
+        "unmatched": _unmatched(df, flat_bom),
+    }
+
+
+def generate_material_requirements(data_dir: str = DEFAULT_DATA_DIR, output_dir: Optional[str] = None) -> Dict:
+    output_dir = output_dir or data_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    orders = load_exploded_orders(os.path.join(data_dir, ORDERS_FILE))
+    cost_graph = get_cost_graph(data_dir)
+    tables = build_requirement_tables(orders, cost_graph.flat_bom, cost_graph.materials)
+
+    tables["month"].to_csv(os.path.join(output_dir, "salla_material_by_month.csv"), index=False)
+    tables["city"].to_csv(os.path.join(output_dir, "salla_material_by_city.csv"), index=False)
+    tables["family"].to_csv(os.path.join(output_dir, "salla_material_by_family.csv"), index=False)
+    tables["unmatched"].to_csv(os.path.join(output_dir, "salla_material_unmatched_skus.csv"), index=False)
+
+    return {
+        "months": int(tables["month"]["month"].nunique()),
+        "materials": int(tables["month"]["material_sku"].nunique()),
+        "total_material_cost": float(tables["month"]["cost"].sum()),
+        "unmatched_skus": int(len(tables["unmatched"])),
+        "unmatched_qty": float(tables["unmatched"]["qty"].sum()),
+    }
+
+
+if __name__ == "__main__":
+    summary = generate_material_requirements()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
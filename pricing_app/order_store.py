@@ -0,0 +1,193 @@
+"""
+مخزن الطلبات العمودي - Typed Columnar Order Store
+Exploded Salla orders persisted as Parquet/Feather with categorical dimensions, datetime dates and int32 quantities,
+read back column-by-column instead of re-inferring types from CSV on every run.
+The Parquet store is partitioned by year/month so a filtered view only reads its own partitions.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+ORDER_STORE_FILE = "salla_orders_exploded.parquet"
+STORE_FORMATS = (".parquet", ".feather")
+ORDER_STORE_COLUMNS = ["order_id", "order_date", "status", "city", "payment_method", "sku_code", "sku_name", "qty"]
+CATEGORICAL_COLUMNS = ("city", "status", "payment_method", "sku_code")
+PARTITION_COLUMNS = ["year", "month"]
+# قاموس الفلاتر بنفس شكل process_salla_data_lite في الداشبورد: المفتاح → العمود، و"الكل" = بدون تصفية
+ALL = "الكل"
+FILTER_COLUMNS = {"year": "year", "month": "month", "status": "status", "city": "city", "payment": "payment_method"}
+# قيم الفلاتر المتاحة (سنوات، شهور، حالات...) محفوظة بجانب الأقسام حتى لا يُقرأ كل السجل لبناء القوائم
+DIMENSIONS_FILE = "_dimensions.json"
+
+
+def to_typed_orders(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    أنواع المخزن: الأبعاد category، order_date datetime، qty int32، وباقي النصوص string
+    (الأعمدة غير الموجودة تُتجاهل؛ الأعمدة المحوّلة مسبقاً تبقى كما هي)
+    """
+    typed = df.copy(deep=False)
+    if "order_date" in typed.columns and not pd.api.types.is_datetime64_any_dtype(typed["order_date"]):
+        typed["order_date"] = pd.to_datetime(typed["order_date"], errors="coerce")
+    if "qty" in typed.columns and typed["qty"].dtype != "int32":
+        typed["qty"] = pd.to_numeric(typed["qty"], errors="coerce").fillna(0).astype("int32")
+    for column in PARTITION_COLUMNS:
+        # أعمدة الأقسام تُقرأ من أسماء المجلدات كـ category
+        if column in typed.columns and typed[column].dtype != "Int16":
+            typed[column] = pd.to_numeric(typed[column].astype(object), errors="coerce").astype("Int16")
+    for column in typed.columns:
+        if column in CATEGORICAL_COLUMNS:
+            if not isinstance(typed[column].dtype, pd.CategoricalDtype):
+                typed[column] = typed[column].astype("string").astype("category")
+        elif typed[column].dtype == object:
+            # أعمدة نصية بقيم مختلطة (أرقام ونصوص) لا تُكتب في Parquet كما هي
+            typed[column] = typed[column].astype("string")
+    return typed
+
+
+def add_partition_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """year / month (Int16) من order_date؛ الطلبات بدون تاريخ تأخذ قيمة فارغة"""
+    df = df.copy(deep=False)
+    dates = pd.to_datetime(df["order_date"], errors="coerce")
+    df["year"] = dates.dt.year.astype("Int16")
+    df["month"] = dates.dt.month.astype("Int16")
+    return df
+
+
+def order_dimensions(df: pd.DataFrame) -> Dict[str, list]:
+    """القيم المتاحة لكل فلتر (مفاتيح FILTER_COLUMNS) مرتبة وبدون الفارغ"""
+    if any(column not in df.columns for column in PARTITION_COLUMNS) and "order_date" in df.columns:
+        df = add_partition_columns(df)
+    dimensions = {}
+    for key, column in FILTER_COLUMNS.items():
+        values = df[column].dropna().unique() if column in df.columns else []
+        dimensions[key] = sorted(int(v) for v in values) if column in PARTITION_COLUMNS else sorted(str(v) for v in values)
+    return dimensions
+
+
+def _remove_path(path: str) -> None:
+    """حذف مجلد أو ملف إن وُجد"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def save_order_store(df: pd.DataFrame, path: str = os.path.join("data", ORDER_STORE_FILE)) -> pd.DataFrame:
+    """
+    حفظ الطلبات المفككة بأنواع المخزن حسب الامتداد:
+    .parquet = مجلد مقسّم year=YYYY/month=M/ (يستبدل المخزن السابق كاملاً) + DIMENSIONS_FILE؛ .feather = ملف واحد
+    Returns: الجدول المحوّل (مع year / month)
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix not in STORE_FORMATS:
+        raise ValueError(f"صيغة المخزن يجب أن تكون واحدة من {STORE_FORMATS}")
+    typed = to_typed_orders(add_partition_columns(df)).reset_index(drop=True)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if suffix == ".feather":
+        typed.to_feather(path)
+        return typed
+
+    # الكتابة في مجلد مؤقت ثم تبديل الاسمين، حتى لا يقرأ أحد مخزناً نصف مكتوب أو ممزوجاً بأقسام قديمة
+    # (المخزن السابق يُنقل إلى .old أولاً فلا تمر لحظة بدون مخزن أثناء الحذف)
+    staging, previous = f"{path}.tmp", f"{path}.old"
+    for leftover in (staging, previous):
+        _remove_path(leftover)
+    typed.to_parquet(staging, index=False, partition_cols=PARTITION_COLUMNS)
+    with open(os.path.join(staging, DIMENSIONS_FILE), "w", encoding="utf-8") as f:
+        json.dump(order_dimensions(typed), f, ensure_ascii=False)
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(staging, path)
+    _remove_path(previous)
+    return typed
+
+
+def filter_expressions(filters: Optional[Dict[str, object]]) -> List[tuple]:
+    """قاموس الفلاتر (year, month, status, city, payment؛ "الكل" = الكل) → فلاتر pd.read_parquet"""
+    expressions = []
+    for key, column in FILTER_COLUMNS.items():
+        value = (filters or {}).get(key, ALL)
+        if value is None or value == ALL:
+            continue
+        expressions.append((column, "==", int(value) if column in PARTITION_COLUMNS else str(value)))
+    return expressions
+
+
+def load_order_store(
+    path: str, columns: Optional[Sequence[str]] = None, filters: Optional[Dict[str, object]] = None,
+) -> pd.DataFrame:
+    """
+    قراءة المخزن؛ columns: الأعمدة المطلوبة فقط (الأعمدة غير الموجودة في الملف تُتجاهل)
+    filters: قاموس الفلاتر (filter_expressions) - في Parquet تُقرأ أقسام السنة/الشهر المطابقة فقط
+    """
+    if columns is not None:
+        columns = [column for column in columns if column in store_columns(path)]
+    expressions = filter_expressions(filters)
+    if Path(path).suffix.lower() != ".feather":
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        # أقسام hive بأنواعها (int) وليس category حتى تطابق البيانات الوصفية المحفوظة من pandas
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+        table = dataset.to_table(
+            columns=columns, filter=pq.filters_to_expression(expressions) if expressions else None,
+        )
+        return to_typed_orders(table.to_pandas())
+
+    df = to_typed_orders(pd.read_feather(path))
+    if "year" not in df.columns and "order_date" in df.columns:
+        df = add_partition_columns(df)
+    for column, _, value in expressions:
+        df = df[df[column] == value]
+    return (df if columns is None else df[columns]).reset_index(drop=True)
+
+
+def load_dimensions(path: str) -> Dict[str, list]:
+    """قيم الفلاتر المتاحة من DIMENSIONS_FILE، أو من أعمدة الفلاتر إن لم يوجد"""
+    sidecar = os.path.join(path, DIMENSIONS_FILE)
+    if os.path.isfile(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            return json.load(f)
+    return order_dimensions(load_order_store(path, ["order_date", *FILTER_COLUMNS.values()]))
+
+
+def store_columns(path: str):
+    """أسماء أعمدة المخزن (مع أعمدة الأقسام) من البيانات الوصفية بدون قراءة البيانات"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if Path(path).suffix.lower() == ".feather":
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+    return ds.dataset(path, format="parquet", partitioning="hive").schema.names
+
+
+def resolve_orders_file(path: str) -> str:
+    """
+    المخزن العمودي بجانب ملف CSV (نفس الاسم بامتداد .parquet أو .feather) إذا كان أحدث منه،
+    مثلاً salla_orders_exploded.csv ← salla_orders_exploded.parquet؛ وإلا path كما هو
+    """
+    path = Path(path)
+    if path.suffix.lower() in STORE_FORMATS:
+        return str(path)
+    for candidate in (path.with_suffix(suffix) for suffix in STORE_FORMATS):
+        if candidate.exists() and (not path.exists() or candidate.stat().st_mtime >= path.stat().st_mtime):
+            return str(candidate)
+    return str(path)
+
+
+def load_orders_table(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    تحميل الطلبات من المخزن العمودي إن وُجد (resolve_orders_file) وإلا من CSV
+    columns: الأعمدة المطلوبة فقط (في CSV تُقرأ الأعمدة الموجودة منها فقط)
+    """
+    path = resolve_orders_file(path)
+    if Path(path).suffix.lower() in STORE_FORMATS:
+        return load_order_store(path, columns)
+    wanted = set(columns) if columns is not None else None
+    return pd.read_csv(path, usecols=lambda column: wanted is None or column in wanted, low_memory=False)
@@ -4,10 +4,14 @@ import os
 import re
 from collections import Counter, defaultdict
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from .parallel_orders import explode_parallel
+from .salla_normalizer import split_list_cells
+
 SKU_REGEX = re.compile(r"\(SKU:\s*([^\)]+)\)")
 QTY_REGEX = re.compile(r"\(Qty:\s*(\d+)\)")
 
@@ -72,24 +76,48 @@ def parse_sku_cell(cell: str) -> List[Tuple[str, int]]:
     return result
 
 
-def explode_orders(df: pd.DataFrame) -> pd.DataFrame:
-    """Explode orders to one row per SKU with quantity."""
-    records = []
-    for _, row in df.iterrows():
-        skus = parse_sku_cell(row["sku"])
-        for sku_code, qty in skus:
-            records.append(
-                {
-                    "order_id": row["order_id"],
-                    "status": str(row["status"]).strip().lower(),
-                    "city": str(row["city"]).strip(),
-                    "payment": str(row["payment"]).strip(),
-                    "date": row["date"],
-                    "sku_code": sku_code,
-                    "qty": qty,
-                }
-            )
-    return pd.DataFrame(records)
+def parse_sku_column(values: pd.Series) -> pd.DataFrame:
+    """Columnar parse_sku_cell: one row per item (row label, sku_code, qty), same output cell by cell."""
+    items, fallback = split_list_cells(values)
+    sku_codes = items["item"].str.extract(SKU_REGEX, expand=False)
+    matched = sku_codes.notna().to_numpy()
+    quantities = items["item"][matched].str.extract(QTY_REGEX, expand=False)
+    parsed = pd.DataFrame({
+        "pos": items["pos"].to_numpy()[matched],
+        "sku_code": sku_codes[matched].str.strip().astype(object).to_numpy(),
+        "qty": quantities.fillna("1").astype(np.int64).to_numpy(),
+    })
+
+    cells = pd.Series(values).to_numpy(dtype=object)
+    slow = [(pos, sku_code, qty) for pos in fallback for sku_code, qty in parse_sku_cell(cells[pos])]
+    if slow:
+        parsed = pd.concat([parsed, pd.DataFrame(slow, columns=parsed.columns)], ignore_index=True)
+        parsed["qty"] = parsed["qty"].astype(np.int64)
+    parsed = parsed.sort_values("pos", kind="stable").reset_index(drop=True)
+    parsed.insert(0, "row", pd.Series(values).index[parsed.pop("pos").to_numpy()])
+    return parsed
+
+
+def explode_orders(df: pd.DataFrame, workers: Optional[int] = None) -> pd.DataFrame:
+    """Explode orders to one row per SKU with quantity (row-range partitions on `workers` processes if > 1)."""
+    if workers and workers > 1:
+        return explode_parallel(df, explode_orders, workers=workers)
+    df = df.reset_index(drop=True)
+    items = parse_sku_column(df["sku"])
+    if items.empty:
+        return pd.DataFrame()
+    orders = df.iloc[items["row"].to_numpy(dtype=np.int64)].reset_index(drop=True)
+    return pd.DataFrame(
+        {
+            "order_id": orders["order_id"],
+            "status": orders["status"].map(str).str.strip().str.lower(),
+            "city": orders["city"].map(str).str.strip(),
+            "payment": orders["payment"].map(str).str.strip(),
+            "date": orders["date"],
+            "sku_code": items["sku_code"],
+            "qty": items["qty"],
+        }
+    )
 
 
 def compute_combos(df_orders: pd.DataFrame, min_items: int = 2, max_items: int = 5, top_n: int = 10) -> List[Dict]:
@@ -170,16 +198,16 @@ def save_outputs(summary: Dict, output_dir: str = "data") -> None:
     dump_csv("top_combos", "salla_top_combos.csv")
 
 
-def run_pipeline():
+def run_pipeline(workers: Optional[int] = None):
     orders_raw = load_orders()
     orders_norm = normalize_columns(orders_raw)
     orders_norm["date"] = pd.to_datetime(orders_norm["date"], errors="coerce")
-    exploded = explode_orders(orders_norm)
+    exploded = explode_orders(orders_norm, workers=workers)
     summary = summarize(exploded)
     save_outputs(summary)
     return summary
 
 
 if __name__ == "__main__":
-    result = run_pipeline()
+    result = run_pipeline(workers=os.cpu_count())
     print(json.dumps(result, ensure_ascii=False, indent=2))
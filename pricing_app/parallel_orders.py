@@ -0,0 +1,143 @@
+"""
+تفكيك الطلبات المتوازي - Parallel Order Explosion
+Raw orders partitioned by row range, exploded on a process pool and concatenated back in input order,
+optionally returning each partition through shared memory (Arrow IPC) instead of pickling it
+"""
+
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Collection, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+EXECUTORS = ("serial", "thread", "process")
+DEFAULT_PARTITION_SIZE = 20_000
+
+ExplodeFunction = Callable[[pd.DataFrame], pd.DataFrame]
+ProgressCallback = Callable[[int, int, str], None]
+# نتيجة شريحة عبر الذاكرة المشتركة: (اسم الكتلة، حجم بيانات Arrow IPC)
+SharedResult = Tuple[str, int]
+
+
+def _partitions(n_rows: int, partition_size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + partition_size, n_rows)) for start in range(0, n_rows, partition_size)]
+
+
+def _to_shared_memory(frame: pd.DataFrame) -> Union[SharedResult, pd.DataFrame]:
+    """كتابة الشريحة كـ Arrow IPC في كتلة ذاكرة مشتركة تملكها العملية الرئيسية؛ الجداول غير القابلة للتحويل تُعاد كما هي"""
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return frame
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    payload = sink.getvalue()
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, payload.size))
+    try:
+        block.buf[:payload.size] = memoryview(payload).cast("B")
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    # الحذف مسؤولية العملية الرئيسية بعد القراءة
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block.name, payload.size
+
+
+def _from_shared_memory(result: SharedResult) -> pd.DataFrame:
+    import pyarrow as pa
+
+    name, size = result
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # نسخة واحدة للبايتات ثم تحرير الكتلة فوراً (أعمدة Arrow قد تشير للذاكرة بدون نسخ)
+        payload = bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
+
+
+def _unlink_shared_memory(name: str) -> None:
+    block = shared_memory.SharedMemory(name=name)
+    block.close()
+    block.unlink()
+
+
+def _release_unread(futures: Dict[Future, int], read: Collection[Future]) -> None:
+    """بعد فشل شريحة: إلغاء الشرائح المنتظرة، وانتظار الجارية وحذف كتل الذاكرة المشتركة التي لم تُقرأ"""
+    pending = [future for future in futures if future not in read and not future.cancel()]
+    for future in pending:
+        try:
+            result = future.result()
+        except BaseException:
+            continue
+        if isinstance(result, tuple):
+            _unlink_shared_memory(result[0])
+
+
+def _explode_partition(explode: ExplodeFunction, partition: pd.DataFrame, use_shared_memory: bool):
+    exploded = explode(partition)
+    return _to_shared_memory(exploded) if use_shared_memory else exploded
+
+
+def explode_parallel(
+    df: pd.DataFrame,
+    explode: ExplodeFunction,
+    workers: Optional[int] = None,
+    partition_size: int = DEFAULT_PARTITION_SIZE,
+    executor: str = "process",
+    use_shared_memory: bool = False,
+    progress: Optional[ProgressCallback] = None,
+) -> pd.DataFrame:
+    """
+    تطبيق explode (مثل salla_normalizer.explode_orders_frame أو orders_analysis.explode_orders)
+    على شرائح متتالية من df بحجم partition_size صف على مجمع عمليات، ثم دمج النتائج بترتيب الشرائح
+
+    explode: دالة على مستوى الوحدة (لتُرسل للعمليات)، تفكك كل صف مستقلاً عن غيره
+    executor: "process"، "thread" أو "serial"؛ جدول بشريحة واحدة يُفكك مباشرة بدون مجمع
+    use_shared_memory: إرجاع نتائج العمليات عبر الذاكرة المشتركة بصيغة Arrow بدلاً من pickle
+                       (أسرع للنتائج الكبيرة؛ أنواع الأعمدة تتبع تحويل Arrow)
+    progress(منجز، الإجمالي، وصف الشريحة): بعد كل شريحة بترتيب الانتهاء
+    Returns: نفس ناتج explode(df) بنفس ترتيب الصفوف
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor يجب أن يكون واحداً من {EXECUTORS}")
+    df = df.reset_index(drop=True)
+    partitions = _partitions(len(df), max(1, partition_size))
+    if executor == "serial" or len(partitions) <= 1:
+        return explode(df)
+
+    workers = workers or os.cpu_count() or 1
+    shared = use_shared_memory and executor == "process"
+    pool = ProcessPoolExecutor(max_workers=workers) if executor == "process" else ThreadPoolExecutor(max_workers=workers)
+    results: List[Optional[pd.DataFrame]] = [None] * len(partitions)
+    with pool:
+        futures = {
+            pool.submit(_explode_partition, explode, df.iloc[start:stop], shared): i
+            for i, (start, stop) in enumerate(partitions)
+        }
+        read = set()
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                read.add(future)
+                result = future.result()
+                results[i] = _from_shared_memory(result) if isinstance(result, tuple) else result
+                if progress is not None:
+                    start, stop = partitions[i]
+                    progress(done, len(partitions), f"[{start}:{stop}]")
+        except BaseException:
+            _release_unread(futures, read)
+            raise
+
+    frames = [frame for frame in results if not frame.empty]
+    if not frames:
+        return results[0]
+    return pd.concat(frames, ignore_index=True)
@@ -1,9 +1,12 @@
+from typing import Union
+
+from .compiled_channel import CompiledChannel
 from .models import ChannelFees, PriceBreakdown
 
 def price_item(
     sku: str,
     cogs: float,
-    channel_fees: ChannelFees,
+    channel_fees: Union[ChannelFees, CompiledChannel],
     is_package: bool = False,
     target_margin: float = 0.09
 ) -> PriceBreakdown:
@@ -14,16 +17,15 @@ def price_item(
     1. NetPriceExclVAT = COGS / (1 - fees_pct - target_margin)
     2. PriceBeforeDiscount = NetPriceExclVAT / (1 - discount_rate)
     3. ListPriceInclVAT = PriceBeforeDiscount * (1 + vat_rate)
+
+    channel_fees: pass a CompiledChannel when pricing many items on one channel
     """
     
-    total_fee_pct = (
-        channel_fees.platform_pct +
-        channel_fees.marketing_pct +
-        channel_fees.opex_pct +
-        target_margin
-    )
+    if not isinstance(channel_fees, CompiledChannel):
+        channel_fees = CompiledChannel.from_channel(channel_fees)
+    total_fee_pct = channel_fees.channel_pct + target_margin
     
-    fixed_costs = cogs + channel_fees.preparation_fee + channel_fees.shipping_fixed
+    fixed_costs = cogs + channel_fees.fulfilment
     net_price_excl_vat = fixed_costs / (1 - total_fee_pct)
     
     preparation_fee = channel_fees.preparation_fee
@@ -0,0 +1,128 @@
+"""
+مكعب التسعير - SKU × Channel × Target-Margin Pricing Cube
+The whole catalog priced on every channel at several target margins in one call,
+written to a columnar file for channel managers to slice
+"""
+
+import argparse
+import os
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .advanced_pricing import margin_at_price_array, solve_price_for_margin_array
+from .channels import ChannelFees, load_channels
+from .compiled_channel import CompiledChannel
+from .cost_graph import CostGraph, get_cost_graph
+
+DEFAULT_MARGINS = (0.05, 0.10, 0.15, 0.20, 0.25)
+CUBE_COLUMNS = [
+    "SKU", "item_type", "channel", "target_margin",
+    "cogs", "list_price", "price_after_discount", "net_price", "profit", "breakeven_price",
+]
+
+
+def build_pricing_cube(
+    cost_graph: CostGraph,
+    channels: Dict[str, ChannelFees],
+    margins: Iterable[float] = DEFAULT_MARGINS,
+) -> pd.DataFrame:
+    """
+    مكعب التسعير بصيغة طويلة: صف لكل (SKU، قناة، هامش مستهدف)
+
+    لكل قناة تُحسب مصفوفة (SKU × هوامش) دفعة واحدة بالحل المباشر؛ list_price هو السعر شامل الضريبة
+    قبل الخصم، و NaN إذا كان الهامش غير قابل للتحقيق على هذه القناة.
+    الأعمدة النصية من نوع category لتصغير الملف وتسريع التصفية.
+    """
+    costs = cost_graph.cost_frame().dropna(subset=["COGS"]).drop_duplicates("SKU")
+    cogs = costs["COGS"].to_numpy()
+    margins = np.asarray(list(margins), dtype=float)
+    n_skus, n_margins = len(cogs), len(margins)
+
+    blocks = []
+    for channel_name, channel in channels.items():
+        compiled = CompiledChannel.from_channel(channel)
+        list_price = solve_price_for_margin_array(cogs[:, None], compiled, target_margin=margins[None, :])
+        price_after_discount = list_price * (1 - compiled.discount_rate)
+        net_price = list_price * compiled.net_factor
+        profit, _ = margin_at_price_array(list_price, cogs[:, None], compiled)
+        breakeven = solve_price_for_margin_array(cogs, compiled, target_margin=0.0)
+
+        blocks.append(pd.DataFrame({
+            "SKU": np.repeat(costs["SKU"].to_numpy(), n_margins),
+            "item_type": np.repeat(costs["type"].to_numpy(), n_margins),
+            "channel": channel_name,
+            "target_margin": np.tile(margins, n_skus),
+            "cogs": np.repeat(cogs, n_margins),
+            "list_price": list_price.ravel(),
+            "price_after_discount": price_after_discount.ravel(),
+            "net_price": net_price.ravel(),
+            "profit": profit.ravel(),
+            "breakeven_price": np.repeat(breakeven, n_margins),
+        }))
+
+    if not blocks:
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+    cube = pd.concat(blocks, ignore_index=True)
+    for column in ("SKU", "item_type", "channel"):
+        cube[column] = cube[column].astype("category")
+    return cube[CUBE_COLUMNS]
+
+
+def write_pricing_cube(cube: pd.DataFrame, path: str) -> str:
+    """حفظ المكعب حسب الامتداد: parquet (افتراضي) أو feather أو csv"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".feather":
+        cube.reset_index(drop=True).to_feather(path)
+    elif extension == ".csv":
+        cube.to_csv(path, index=False, encoding="utf-8-sig")
+    else:
+        cube.to_parquet(path, index=False)
+    return path
+
+
+def load_pricing_cube(path: str, channels: Optional[Iterable[str]] = None, margins: Optional[Iterable[float]] = None) -> pd.DataFrame:
+    """قراءة المكعب مع تصفية اختيارية حسب القنوات والهوامش (تُطبق أثناء القراءة في parquet)"""
+    extension = os.path.splitext(path)[1].lower()
+    filters = []
+    if channels is not None:
+        filters.append(("channel", "in", list(channels)))
+    if margins is not None:
+        filters.append(("target_margin", "in", [float(m) for m in margins]))
+
+    if extension not in (".feather", ".csv"):
+        return pd.read_parquet(path, filters=filters or None)
+
+    cube = pd.read_feather(path) if extension == ".feather" else pd.read_csv(path)
+    for column, _, values in filters:
+        cube = cube[cube[column].isin(values)]
+    return cube.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the SKU x channel x target-margin pricing cube")
+    parser.add_argument("--data-dir", default="data", help="Data directory")
+    parser.add_argument("--channels-file", default=None, help="Channels JSON (default: <data-dir>/channels.json)")
+    parser.add_argument("--margins", default=",".join(str(m) for m in DEFAULT_MARGINS),
+                        help="Comma-separated target margins, e.g. 0.05,0.1,0.15")
+    parser.add_argument("--output", default=None, help="Output file (.parquet, .feather or .csv)")
+    args = parser.parse_args()
+
+    channels = load_channels(args.channels_file or os.path.join(args.data_dir, "channels.json"))
+    if not channels:
+        print("⚠️ لا توجد قنوات محفوظة")
+        return
+    margins = [float(m) for m in args.margins.split(",") if m.strip()]
+
+    cube = build_pricing_cube(get_cost_graph(args.data_dir), channels, margins)
+    output = write_pricing_cube(cube, args.output or os.path.join(args.data_dir, "pricing_cube.parquet"))
+    unreachable = int(cube["list_price"].isna().sum())
+    print(f"✅ {len(cube)} صف ({cube['SKU'].nunique()} SKU × {len(channels)} قناة × {len(margins)} هامش) → {output}")
+    if unreachable:
+        print(f"⚠️ {unreachable} تركيبة بهامش غير قابل للتحقيق (list_price = NaN)")
+
+
+if __name__ == "__main__":
+    main()
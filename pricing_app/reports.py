@@ -1,5 +1,6 @@
 import pandas as pd
 from typing import Dict
+from .compiled_channel import CompiledChannel
 from .models import ChannelFees
 from .pricing import price_item
 
@@ -14,6 +15,7 @@ def build_full_pricing_table(
     """Build complete pricing table for all SKUs"""
     
     rows = []
+    channel_fees = CompiledChannel.from_channel(channel_fees)
     
     # Add products
     for _, row in products_df.iterrows():
@@ -10,7 +10,12 @@ from datetime import datetime
 from collections import defaultdict
 import json
 
-from pricing_app.data_loader import load_cost_data
+from pricing_app.cost_graph import get_cost_graph
+from pricing_app.material_cost_history import load_cost_timeline
+from pricing_app.order_store import load_orders_table, resolve_orders_file
+
+# أعمدة الطلبات التي تستخدمها التحليلات (تُقرأ وحدها من المخزن العمودي)
+INSIGHTS_COLUMNS = ["order_id", "order_date", "تاريخ الطلب", "city", "sku_code", "sku_name", "qty"]
 
 
 class SallaInsights:
@@ -18,7 +23,7 @@ class SallaInsights:
     
     def __init__(self, orders_file="data/salla_orders_exploded.csv"):
         """
-        تحميل بيانات الطلبات المفككة
+        تحميل بيانات الطلبات المفككة (من المخزن العمودي بجانب orders_file إن وُجد - order_store)
         """
         self.orders_df = None
         self.products_df = None
@@ -29,9 +34,14 @@ class SallaInsights:
         self.package_compositions = None
         self._product_cost_cache = {}
         self._package_cost_cache = {}
+        self.cost_graph = None
+        self.flat_bom = None
+        self.bom_report = None
+        self.cost_timeline = None
         
+        orders_file = resolve_orders_file(orders_file)
         if Path(orders_file).exists():
-            self.orders_df = pd.read_csv(orders_file)
+            self.orders_df = load_orders_table(orders_file, INSIGHTS_COLUMNS)
             
             # التحقق من وجود عمود order_date
             if 'order_date' in self.orders_df.columns:
@@ -53,64 +63,38 @@ class SallaInsights:
                          packages_file="data/packages_template.csv",
                          raw_materials_file="data/raw_materials_template.csv"):
         """تحميل بيانات التسعير"""
-        # تحميل بيانات التكلفة (مواد، وصفات منتجات، مكونات بكجات)
+        # بيانات التكلفة من الخدمة المشتركة (تُحمّل مرة واحدة لكل مجلد بيانات في العملية)
         data_dir = str(Path(products_file).parent)
-        self.materials, self.product_recipes, products_summary, self.package_compositions, packages_summary = load_cost_data(data_dir)
+        self.cost_graph = get_cost_graph(data_dir)
+        self.materials = self.cost_graph.materials
+        self.product_recipes = self.cost_graph.product_recipes
+        self.package_compositions = self.cost_graph.package_compositions
+        products_summary = self.cost_graph.products_summary
+        packages_summary = self.cost_graph.packages_summary
 
-        # تجهيز DataFrames مع أعمدة COGS المطلوبة من بقية الكود
-        def _calc_cost_for_product(prod_sku: str, seen=None) -> float:
-            """حساب تكلفة منتج من مكوناته مع دعم التكرار المتداخل."""
-            if prod_sku in self._product_cost_cache:
-                return self._product_cost_cache[prod_sku]
-            seen = seen or set()
-            if prod_sku in seen:
-                return 0.0
-            seen.add(prod_sku)
-            recipe = (self.product_recipes or {}).get(prod_sku, {})
-            total = 0.0
-            for comp_sku, qty in recipe.items():
-                if comp_sku in self.materials:
-                    total += self.materials[comp_sku].cost_per_unit * qty
-                elif comp_sku in (self.product_recipes or {}):
-                    total += _calc_cost_for_product(comp_sku, seen) * qty
-                elif comp_sku in (self.package_compositions or {}):
-                    total += _calc_cost_for_package(comp_sku, seen) * qty
-            self._product_cost_cache[prod_sku] = total
-            return total
+        # الـ SKU الواقع في دورة لا يُحسب بصفر بل يظهر في self.bom_report وتكون تكلفته NaN
+        self.flat_bom = self.cost_graph.flat_bom
+        self.bom_report = self.cost_graph.report
+        if self.bom_report.has_errors:
+            print(f"⚠️ تحذير: {len(self.bom_report.errors_frame())} مشكلة في شجرة المكونات (دورات/مكونات مفقودة)")
 
-        def _calc_cost_for_package(pkg_sku: str, seen=None) -> float:
-            if pkg_sku in self._package_cost_cache:
-                return self._package_cost_cache[pkg_sku]
-            seen = seen or set()
-            if pkg_sku in seen:
-                return 0.0
-            seen.add(pkg_sku)
-            comps = (self.package_compositions or {}).get(pkg_sku, {})
-            total = 0.0
-            for comp_sku, qty in comps.items():
-                if comp_sku in self.materials:
-                    total += self.materials[comp_sku].cost_per_unit * qty
-                elif comp_sku in (self.product_recipes or {}):
-                    total += _calc_cost_for_product(comp_sku, seen) * qty
-                elif comp_sku in (self.package_compositions or {}):
-                    total += _calc_cost_for_package(comp_sku, seen) * qty
-            self._package_cost_cache[pkg_sku] = total
-            return total
+        self._product_cost_cache = self.cost_graph.product_costs
+        self._package_cost_cache = self.cost_graph.package_costs
 
-        # بناء جداول مع COGS
-        product_rows = []
-        for _, row in products_summary.iterrows():
-            sku = row["Product_SKU"]
-            cost = _calc_cost_for_product(sku)
-            product_rows.append({"Product_Name": row["Product_Name"], "SKU": sku, "COGS": cost})
-        self.products_df = pd.DataFrame(product_rows)
+        # أسعار المواد حسب التاريخ (data/material_cost_history.csv) إن وُجدت: COGS كل طلب بأسعار تاريخه
+        self.cost_timeline = load_cost_timeline(data_dir, self.flat_bom, self.materials)
 
-        package_rows = []
-        for _, row in packages_summary.iterrows():
-            sku = row["Package_SKU"]
-            cost = _calc_cost_for_package(sku)
-            package_rows.append({"Package_Name": row["Package_Name"], "SKU": sku, "Total_COGS": cost})
-        self.packages_df = pd.DataFrame(package_rows)
+        # بناء جداول مع COGS
+        self.products_df = pd.DataFrame({
+            "Product_Name": products_summary["Product_Name"],
+            "SKU": products_summary["Product_SKU"],
+            "COGS": products_summary["Product_SKU"].map(self._product_cost_cache).astype(float),
+        })
+        self.packages_df = pd.DataFrame({
+            "Package_Name": packages_summary["Package_Name"],
+            "SKU": packages_summary["Package_SKU"],
+            "Total_COGS": packages_summary["Package_SKU"].map(self._package_cost_cache).astype(float),
+        })
         
         # تحميل المواد الخام للرجوع إليها لاحقاً إذا احتجناها
         if Path(raw_materials_file).exists():
@@ -214,45 +198,45 @@ class SallaInsights:
         
         return missing_products, found_items, summary
     
-    def calculate_cogs_for_sales(self):
+    def calculate_cogs_for_sales(self, as_of=True):
         """
         حساب تكلفة البضاعة المباعة (COGS) لكل منتج/بكج من سلة
         بناءً على بيانات التسعير
+
+        as_of: إذا توفر سجل أسعار المواد، تُحسب تكلفة كل سطر بأسعار المواد في تاريخ الطلب
         """
         if self.orders_df is None:
             return None
         
-        # ربط مع المنتجات
+        # ربط مع المنتجات ثم البكجات (المنتج أولاً عند تكرار الـ SKU)
         sales_with_cost = self.orders_df.copy()
-        sales_with_cost['item_type'] = 'unknown'
-        sales_with_cost['unit_cogs'] = 0.0
-        sales_with_cost['total_cogs'] = 0.0
-        sales_with_cost['found_in_pricing'] = False
+        sku = sales_with_cost['sku_code']
+        item_type = pd.Series('unknown', index=sales_with_cost.index, dtype=object)
+        unit_cogs = pd.Series(np.nan, index=sales_with_cost.index)
         
-        # البحث في المنتجات
         if self.products_df is not None and 'SKU' in self.products_df.columns:
             product_map = self.products_df.set_index('SKU')['COGS'].to_dict()
-            
-            for idx, row in sales_with_cost.iterrows():
-                sku = row['sku_code']
-                if sku in product_map:
-                    sales_with_cost.at[idx, 'item_type'] = 'product'
-                    sales_with_cost.at[idx, 'unit_cogs'] = product_map[sku]
-                    sales_with_cost.at[idx, 'total_cogs'] = product_map[sku] * row['qty']
-                    sales_with_cost.at[idx, 'found_in_pricing'] = True
-        
-        # البحث في البكجات
+            is_product = sku.isin(product_map.keys())
+            item_type[is_product] = 'product'
+            unit_cogs[is_product] = sku[is_product].map(product_map)
+        
         if self.packages_df is not None and 'SKU' in self.packages_df.columns:
             package_map = self.packages_df.set_index('SKU')['Total_COGS'].to_dict()
-            
-            for idx, row in sales_with_cost.iterrows():
-                if not sales_with_cost.at[idx, 'found_in_pricing']:
-                    sku = row['sku_code']
-                    if sku in package_map:
-                        sales_with_cost.at[idx, 'item_type'] = 'package'
-                        sales_with_cost.at[idx, 'unit_cogs'] = package_map[sku]
-                        sales_with_cost.at[idx, 'total_cogs'] = package_map[sku] * row['qty']
-                        sales_with_cost.at[idx, 'found_in_pricing'] = True
+            is_package = (item_type == 'unknown') & sku.isin(package_map.keys())
+            item_type[is_package] = 'package'
+            unit_cogs[is_package] = sku[is_package].map(package_map)
+        
+        found = item_type != 'unknown'
+        if as_of and self.cost_timeline is not None:
+            dated_cogs = self.cost_timeline.unit_cogs_as_of(sku, sales_with_cost['order_date'])
+            use_dated = found & dated_cogs.notna()
+            unit_cogs[use_dated] = dated_cogs[use_dated]
+        
+        unit_cogs = unit_cogs.where(found, 0.0)
+        sales_with_cost['item_type'] = item_type
+        sales_with_cost['unit_cogs'] = unit_cogs
+        sales_with_cost['total_cogs'] = unit_cogs * sales_with_cost['qty']
+        sales_with_cost['found_in_pricing'] = found
         
         return sales_with_cost
     
@@ -271,7 +255,7 @@ class SallaInsights:
             df = df[df['month'] == month]
         
         # تجميع حسب المنتج
-        top_products = df.groupby(['sku_code', 'sku_name']).agg({
+        top_products = df.groupby(['sku_code', 'sku_name'], observed=True).agg({
             'qty': 'sum',
             'order_id': 'nunique'
         }).reset_index()
@@ -297,12 +281,12 @@ class SallaInsights:
             data = data.copy()
             data['year'] = pd.to_datetime(data['order_date'], errors='coerce').dt.year
 
-        monthly_sales = data.groupby(['year', 'month', 'sku_code', 'sku_name'])['qty'].sum().reset_index()
+        monthly_sales = data.groupby(['year', 'month', 'sku_code', 'sku_name'], observed=True)['qty'].sum().reset_index()
         monthly_sales = monthly_sales.dropna(subset=['month'])
 
         # أفضل N منتجات لكل شهر (ولكل سنة في حال تعدد السنوات)
         monthly_sales = monthly_sales.sort_values(['year', 'month', 'qty'], ascending=[False, True, False])
-        best_per_month = monthly_sales.groupby(['year', 'month']).head(max(1, top_n_per_month)).reset_index(drop=True)
+        best_per_month = monthly_sales.groupby(['year', 'month'], observed=True).head(max(1, top_n_per_month)).reset_index(drop=True)
 
         months_ar = {
             1: "يناير", 2: "فبراير", 3: "مارس", 4: "أبريل",
@@ -323,11 +307,11 @@ class SallaInsights:
         if self.orders_df is None:
             return None
         
-        city_sales = self.orders_df.groupby(['city', 'sku_code', 'sku_name'])['qty'].sum().reset_index()
+        city_sales = self.orders_df.groupby(['city', 'sku_code', 'sku_name'], observed=True)['qty'].sum().reset_index()
         
         # أفضل منتجات لكل مدينة
         top_per_city = city_sales.sort_values(['city', 'qty'], ascending=[True, False])
-        top_per_city = top_per_city.groupby('city').head(top_n).reset_index(drop=True)
+        top_per_city = top_per_city.groupby('city', observed=True).head(top_n).reset_index(drop=True)
         
         return top_per_city
     
@@ -339,7 +323,7 @@ class SallaInsights:
             return None
         
         # تجميع المنتجات حسب الطلب
-        order_products = self.orders_df.groupby('order_id')['sku_code'].apply(list).reset_index()
+        order_products = self.orders_df.groupby('order_id', observed=True)['sku_code'].apply(list).reset_index()
         
         # حساب الأزواج
         associations = defaultdict(int)
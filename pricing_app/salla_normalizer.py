@@ -4,9 +4,13 @@ Salla Orders Normalizer - Explodes SKUs from raw format to normalized rows
 """
 
 import pandas as pd
+import numpy as np
 import ast
 import re
 from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .parallel_orders import explode_parallel
 
 
 # ========= 1) إعداد أسماء الأعمدة بالعربي كما هي في ملف سلة =========
@@ -72,14 +76,117 @@ def parse_sku_cell(cell_value):
     return results
 
 
+# ========= 2ب) التفكيك العمودي لعمود SKU كامل =========
+# خلية "قائمة بسيطة": ['...', "..."] بنصوص بلا هروب (\\) ولا أسطر جديدة - وهي شكل تصدير سلة المعتاد.
+# هذه تُفكك لكل العمود بمسح واحد للنمط المترجم، وأي خلية أخرى تمر على parse_sku_cell كما هي
+# فيبقى الناتج مطابقاً للمحلل الأصلي (literal_eval) حرفياً.
+_LIST_ITEM = r"'[^'\\\r\n\x00]*'" "|" r'"[^"\\\r\n\x00]*"'
+_LIST_WS = r"[ \t\f\r\n]*"
+SIMPLE_LIST_PATTERN = re.compile(
+    rf"\[{_LIST_WS}(?:(?:{_LIST_ITEM}){_LIST_WS}(?:,{_LIST_WS}(?:{_LIST_ITEM}){_LIST_WS})*,?{_LIST_WS})?\]"
+)
+LIST_ITEM_PATTERN = re.compile(r"'([^'\\\r\n\x00]*)'" "|" r'"([^"\\\r\n\x00]*)"')
+
+
+def split_list_cells(values: pd.Series):
+    """
+    عناصر خلايا القوائم البسيطة في عمود كامل
+    Returns: (DataFrame [pos, item] بترتيب الخلايا ثم العناصر، مواقع الخلايا الأخرى التي تحتاج المحلل النصي)
+    pos = الموقع الرقمي للخلية في values
+    """
+    cells = pd.Series(values).to_numpy(dtype=object)
+    fullmatch = SIMPLE_LIST_PATTERN.fullmatch
+    simple = np.fromiter(
+        (type(cell) is str and fullmatch(cell) is not None for cell in cells), dtype=bool, count=len(cells),
+    )
+    texts = cells[simple]
+
+    # كل الخلايا في نص واحد بفاصل سطر جديد (لا يظهر داخل أي عنصر) ثم مسح واحد؛
+    # موضع بداية كل تطابق يحدد خليته
+    starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]])
+    offsets, items = [], []
+    for m in LIST_ITEM_PATTERN.finditer("\n".join(texts)):
+        offsets.append(m.start())
+        items.append(m.group(1) if m.group(1) is not None else m.group(2))
+    cell_index = np.searchsorted(starts, np.asarray(offsets, dtype=np.int64), side="right") - 1
+    items = pd.DataFrame({
+        "pos": np.flatnonzero(simple)[cell_index],
+        "item": pd.Series(items, dtype=object),
+    })
+    fallback = np.flatnonzero(~simple & ~pd.isna(cells))
+    return items, fallback
+
+
+def parse_sku_column(values: pd.Series) -> pd.DataFrame:
+    """
+    نسخة عمودية من parse_sku_cell لعمود SKU كامل
+    Returns: صف لكل عنصر: row (تسمية الصف في values), sku_code, sku_name, qty
+             بترتيب الخلايا ثم العناصر - نفس ناتج parse_sku_cell خلية خلية
+    """
+    items, fallback = split_list_cells(values)
+    stripped = items["item"].str.strip().str.strip("'").str.strip('"')
+    # أعمدة التطابق الثلاثة (الكود، الاسم، الكمية)؛ NaN للعناصر بدون كود
+    parts = stripped.str.extract(sku_pattern)
+    parsed = pd.DataFrame({
+        "pos": items["pos"],
+        "sku_code": parts[0].str.strip().fillna("").astype(object),
+        "sku_name": parts[1].str.strip().fillna(stripped).astype(object),
+        "qty": parts[2].fillna("1").astype(np.int64),
+    })
+
+    cells = pd.Series(values).to_numpy(dtype=object)
+    slow = [{"pos": pos, **item} for pos in fallback for item in parse_sku_cell(cells[pos])]
+    if slow:
+        parsed = pd.concat([parsed, pd.DataFrame(slow, columns=parsed.columns)], ignore_index=True)
+        parsed["qty"] = parsed["qty"].astype(np.int64)
+    parsed = parsed.sort_values("pos", kind="stable").reset_index(drop=True)
+    parsed.insert(0, "row", pd.Series(values).index[parsed.pop("pos").to_numpy()])
+    return parsed
+
+
+NORMALIZED_COLUMNS = ["order_id", "order_date", "status", "city", "payment_method", "sku_code", "sku_name", "qty"]
+
+
+def explode_orders_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    تفجير الطلبات (بأسماء الأعمدة الموحدة) إلى صف لكل منتج/بكج بـ parse_sku_column؛
+    الطلب بدون عناصر يبقى صفاً واحداً بـ sku_code = "" و qty = 0
+    Returns: DataFrame بالأعمدة NORMALIZED_COLUMNS
+    """
+    df = df.reset_index(drop=True)
+    items = parse_sku_column(df["sku_raw"])
+    empty = np.setdiff1d(np.arange(len(df)), items["row"].to_numpy())
+    if len(empty):
+        blanks = pd.DataFrame({"row": empty, "sku_code": "", "sku_name": "", "qty": 0})
+        items = pd.concat([items, blanks], ignore_index=True).sort_values("row", kind="stable")
+    rows = items["row"].to_numpy(dtype=np.int64)
+    exploded = df.iloc[rows][NORMALIZED_COLUMNS[:5]].reset_index(drop=True)
+    for column in NORMALIZED_COLUMNS[5:]:
+        exploded[column] = items[column].to_numpy()
+    return exploded
+
+
 # ========= 3) الدالة الرئيسية =========
-def normalize_salla_orders(input_path: str, output_path: str = None):
+COLUMN_RENAMES = {
+    ORDER_ID_COL_AR: "order_id",
+    STATUS_COL_AR: "status",
+    CITY_COL_AR: "city",
+    SKU_COL_AR: "sku_raw",
+    PAYMENT_COL_AR: "payment_method",
+    DATE_COL_AR: "order_date",
+}
+STREAM_FORMATS = (".csv", ".parquet")
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def normalize_salla_orders(input_path: str, output_path: str = None, workers: Optional[int] = None):
     """
     تحويل ملف طلبات سلة الخام إلى صيغة منظمة
     
     Args:
         input_path: مسار ملف سلة الأصلي (xlsx أو csv)
         output_path: مسار الملف الناتج (اختياري، افتراضيًا salla_orders_normalized.xlsx)
+        workers: عدد العمليات لتفكيك الطلبات بالتوازي (explode_parallel)؛ None = تفكيك مباشر
     
     Returns:
         DataFrame: البيانات المنظمة
@@ -98,47 +205,13 @@ def normalize_salla_orders(input_path: str, output_path: str = None):
         df = pd.read_excel(input_path)
 
     # توحيد أسماء الأعمدة إلى إنجليزي
-    df = df.rename(columns={
-        ORDER_ID_COL_AR: "order_id",
-        STATUS_COL_AR: "status",
-        CITY_COL_AR: "city",
-        SKU_COL_AR: "sku_raw",
-        PAYMENT_COL_AR: "payment_method",
-        DATE_COL_AR: "order_date",
-    })
-
-    normalized_rows = []
+    df = df.rename(columns=COLUMN_RENAMES)
 
     # تفجير كل طلب إلى صفوف حسب كل منتج/بكج
-    for _, row in df.iterrows():
-        sku_items = parse_sku_cell(row["sku_raw"])
-
-        if not sku_items:
-            normalized_rows.append({
-                "order_id": row["order_id"],
-                "order_date": row["order_date"],
-                "status": row["status"],
-                "city": row["city"],
-                "payment_method": row["payment_method"],
-                "sku_code": "",
-                "sku_name": "",
-                "qty": 0,
-            })
-            continue
-
-        for item in sku_items:
-            normalized_rows.append({
-                "order_id": row["order_id"],
-                "order_date": row["order_date"],
-                "status": row["status"],
-                "city": row["city"],
-                "payment_method": row["payment_method"],
-                "sku_code": item["sku_code"],
-                "sku_name": item["sku_name"],
-                "qty": item["qty"],
-            })
-
-    normalized_df = pd.DataFrame(normalized_rows)
+    if workers and workers > 1:
+        normalized_df = explode_parallel(df, explode_orders_frame, workers=workers)
+    else:
+        normalized_df = explode_orders_frame(df)
 
     # حفظ الملف الناتج
     output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -151,12 +224,77 @@ def normalize_salla_orders(input_path: str, output_path: str = None):
     return normalized_df
 
 
+def normalize_salla_orders_streaming(
+    input_path: str,
+    output_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, int]:
+    """
+    نسخة متدفقة من normalize_salla_orders لملفات CSV الكبيرة
+
+    يقرأ الملف دفعات بحجم chunk_size طلب، يفكك كل دفعة بـ explode_orders_frame ويلحقها بالملف الناتج
+    (.csv أو .parquet) فلا يبقى في الذاكرة إلا دفعة واحدة. كل الأعمدة تُقرأ وتُكتب كنصوص كما في الملف
+    الأصلي (عدا qty) حتى يبقى شكل الأعمدة ثابتاً بين الدفعات.
+    progress(طلبات مقروءة، صفوف مكتوبة): بعد كل دفعة (افتراضياً سطر طباعة)
+    Returns: {"orders": عدد الطلبات، "rows": عدد الصفوف بعد التفكيك}
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    if input_path.suffix.lower() != ".csv":
+        raise ValueError("الوضع المتدفق يدعم ملفات CSV فقط (ملفات Excel لا تُقرأ على دفعات)")
+    if output_path.suffix.lower() not in STREAM_FORMATS:
+        raise ValueError(f"صيغة الملف الناتج يجب أن تكون واحدة من {STREAM_FORMATS}")
+    if progress is None:
+        def progress(orders, rows):
+            print(f"   ⏳ {orders:,} طلب → {rows:,} صف")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    writer = None
+    orders = rows = 0
+    try:
+        for chunk in pd.read_csv(input_path, chunksize=max(1, chunk_size), dtype=str):
+            exploded = explode_orders_frame(chunk.rename(columns=COLUMN_RENAMES))
+            for column in NORMALIZED_COLUMNS[:-1]:
+                exploded[column] = exploded[column].astype("string")
+
+            if output_path.suffix.lower() == ".parquet":
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(exploded, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+            else:
+                exploded.to_csv(output_path, mode="w" if orders == 0 else "a", header=orders == 0, index=False)
+
+            orders += len(chunk)
+            rows += len(exploded)
+            progress(orders, rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"✅ تم إنشاء الملف: {output_path.resolve()}")
+    print(f"📊 عدد الطلبات الأصلية: {orders}")
+    print(f"📦 عدد الصفوف بعد التفكيك: {rows}")
+    return {"orders": orders, "rows": rows}
+
+
 def main():
     """
     استخدام من سطر الأوامر
     """
     # المسارات افتراضيًا من مجلد data
+    import argparse
     import sys
+
+    parser = argparse.ArgumentParser(description="Explode the raw Salla orders export to one row per SKU")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Stream a CSV export in chunks of this many orders (bounded memory)")
+    parser.add_argument("--output", default=None, help="Output file (.csv or .parquet when streaming)")
+    parser.add_argument("--workers", type=int, default=None, help="Explode orders on this many processes")
+    args = parser.parse_args()
     
     # تحديد المسار النسبي من جذر المشروع
     project_root = Path(__file__).parent.parent
@@ -171,12 +309,15 @@ def main():
         sys.exit(1)
     
     input_path = input_files[0]
-    output_path = data_dir / "salla_orders.csv"
+    output_path = Path(args.output) if args.output else data_dir / "salla_orders.csv"
     
     print(f"📂 الملف المصدر: {input_path}")
     print(f"📂 الملف الناتج: {output_path}")
     
-    normalize_salla_orders(str(input_path), str(output_path))
+    if args.chunk_size:
+        normalize_salla_orders_streaming(str(input_path), str(output_path), chunk_size=args.chunk_size)
+    else:
+        normalize_salla_orders(str(input_path), str(output_path), workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""
+تحليل الحساسية للكتالوج - Catalog Sensitivity Surfaces
+Joint COGS × price × discount grid for every SKU in one broadcast,
+with the exact points where each SKU's margin turns negative
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .advanced_pricing import FeeModel, margin_at_price_array, solve_price_for_margin_array
+from .compiled_channel import CompiledChannel, as_compiled_channel
+from .cost_graph import CostGraph
+
+# نفس خطوات perform_sensitivity_analysis: -20% .. +20% بخطوة 5%
+DEFAULT_STEPS = np.round(np.arange(-0.2, 0.21, 0.05), 2)
+# تغير الخصم بالنقاط المئوية (يُضاف لخصم القناة)
+DEFAULT_DISCOUNT_STEPS = np.round(np.arange(-0.10, 0.11, 0.05), 2)
+
+
+@dataclass
+class SensitivitySurface:
+    """
+    شبكة الحساسية لكل SKU: المحاور (SKU، تغير COGS، تغير السعر، تغير الخصم)
+
+    profit / margin: مصفوفات بشكل (SKU × COGS × سعر × خصم)
+    cogs_headroom: تغير COGS الذي يصبح عنده الهامش صفراً، لكل (SKU × سعر × خصم)
+    price_floor: تغير السعر الذي يصبح عنده الهامش صفراً (أرخص سعر تعادل)، لكل (SKU × COGS × خصم)؛ NaN إذا تعذر
+    """
+    skus: pd.Index
+    cogs_changes: np.ndarray
+    price_changes: np.ndarray
+    discount_changes: np.ndarray
+    base_cogs: np.ndarray
+    base_prices: np.ndarray
+    profit: np.ndarray
+    margin: np.ndarray
+    cogs_headroom: np.ndarray
+    price_floor: np.ndarray
+
+    def _position(self, axis: np.ndarray, value: float) -> int:
+        matches = np.flatnonzero(np.isclose(axis, value))
+        if not len(matches):
+            raise KeyError(f"{value} ليس من خطوات الشبكة: {axis.tolist()}")
+        return int(matches[0])
+
+    def grid(self, sku: str, discount_change: float = 0.0, value: str = "margin") -> pd.DataFrame:
+        """مقطع ثنائي لـ SKU واحد: صفوف تغير COGS × أعمدة تغير السعر"""
+        data = getattr(self, value)[self.skus.get_loc(sku), :, :, self._position(self.discount_changes, discount_change)]
+        return pd.DataFrame(
+            data,
+            index=pd.Index(self.cogs_changes, name="cogs_change"),
+            columns=pd.Index(self.price_changes, name="price_change"),
+        )
+
+    def negative_margin_share(self) -> pd.Series:
+        """نسبة خلايا الشبكة ذات الهامش السالب لكل SKU"""
+        share = (self.margin < 0).reshape(len(self.skus), -1).mean(axis=1)
+        return pd.Series(share, index=self.skus, name="negative_share")
+
+    def contours(self, discount_change: float = 0.0) -> pd.DataFrame:
+        """
+        خطوط "الهامش يصبح سالباً عند" لكل SKU عند تغير خصم معين:
+        أعمدة cogs_at_price_<تغير> (تغير COGS المسموح عند كل تغير سعر)
+        و price_at_cogs_<تغير> (تغير السعر الأدنى عند كل تغير COGS)
+        """
+        k = self._position(self.discount_changes, discount_change)
+        columns = {}
+        for j, change in enumerate(self.price_changes):
+            columns[f"cogs_at_price_{change:+.2f}"] = self.cogs_headroom[:, j, k]
+        for i, change in enumerate(self.cogs_changes):
+            columns[f"price_at_cogs_{change:+.2f}"] = self.price_floor[:, i, k]
+        return pd.DataFrame(columns, index=self.skus)
+
+    def summary(self) -> pd.DataFrame:
+        """ملخص لكل SKU عند الوضع الحالي، مرتب من الأكثر هشاشة (أقل هامش أمان في COGS)"""
+        i0 = self._position(self.cogs_changes, 0.0)
+        j0 = self._position(self.price_changes, 0.0)
+        k0 = self._position(self.discount_changes, 0.0)
+        frame = pd.DataFrame({
+            "cogs": self.base_cogs,
+            "list_price": self.base_prices,
+            "margin_pct": self.margin[:, i0, j0, k0] * 100,
+            "cogs_change_at_zero": self.cogs_headroom[:, j0, k0],
+            "price_change_at_zero": self.price_floor[:, i0, k0],
+            "negative_share": self.negative_margin_share().to_numpy(),
+        }, index=self.skus)
+        return frame.sort_values("cogs_change_at_zero")
+
+    def fragile_skus(self, cogs_tolerance: float = 0.10) -> pd.DataFrame:
+        """الـ SKU التي يصبح هامشها سالباً بزيادة COGS أقل من cogs_tolerance (أو سالبة الآن)"""
+        summary = self.summary()
+        return summary[summary["cogs_change_at_zero"] < cogs_tolerance]
+
+
+def sensitivity_surface(
+    cogs: Union[pd.Series, Dict[str, float]],
+    list_prices: Union[pd.Series, Dict[str, float]],
+    channel_fees: FeeModel,
+    cogs_changes: Iterable[float] = DEFAULT_STEPS,
+    price_changes: Iterable[float] = DEFAULT_STEPS,
+    discount_changes: Iterable[float] = DEFAULT_DISCOUNT_STEPS,
+    **params,
+) -> SensitivitySurface:
+    """
+    الشبكة الكاملة (SKU × COGS × سعر × خصم) في عملية واحدة بمعادلات calculate_price_breakdown
+
+    cogs / list_prices: لكل SKU؛ السعر شامل الضريبة قبل الخصم (يشمل قاعدة حد الشحن المجاني)
+    channel_fees: CompiledChannel أو قاموس الرسوم مع المعاملات المنفصلة في params
+    discount_changes: نقاط تُضاف لخصم القناة (0.05 = خصم أعلى بـ 5 نقاط)، مقصوصة إلى [0, 0.99]
+    """
+    base = as_compiled_channel(channel_fees, **params)
+    cogs = pd.Series(cogs, dtype=float)
+    skus = cogs.index
+    prices = pd.Series(list_prices, dtype=float).reindex(skus).to_numpy()
+    base_cogs = cogs.to_numpy()
+
+    cogs_changes = np.asarray(list(cogs_changes), dtype=float)
+    price_changes = np.asarray(list(price_changes), dtype=float)
+    discount_changes = np.asarray(list(discount_changes), dtype=float)
+
+    discount = np.clip(np.asarray(base.discount_rate) + discount_changes, 0.0, 0.99)
+    channel = CompiledChannel.from_channel(base, discount_rate=discount[None, None, None, :])
+
+    # (SKU، COGS، سعر، خصم)
+    grid_cogs = base_cogs[:, None, None, None] * (1 + cogs_changes[None, :, None, None])
+    grid_prices = prices[:, None, None, None] * (1 + price_changes[None, None, :, None])
+    profit, margin = margin_at_price_array(grid_prices, grid_cogs, channel)
+
+    # تغير COGS الذي يلغي الربح: الربح خطي في COGS عند سعر ثابت
+    price_axis = grid_prices[:, 0]  # (SKU، سعر، 1)
+    channel_3d = CompiledChannel.from_channel(base, discount_rate=discount[None, None, :])
+    profit_before_cogs, _ = margin_at_price_array(price_axis, 0.0, channel_3d)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cogs_headroom = np.where(
+            base_cogs[:, None, None] > 0,
+            profit_before_cogs / base_cogs[:, None, None] - 1,
+            np.where(profit_before_cogs >= 0, np.inf, -np.inf),
+        )
+
+    # تغير السعر عند أرخص سعر تعادل (هامش 0) لكل تغير COGS
+    breakeven = solve_price_for_margin_array(grid_cogs[:, :, 0, :], channel_3d, target_margin=0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_floor = np.where(prices[:, None, None] > 0, breakeven / prices[:, None, None] - 1, np.nan)
+
+    return SensitivitySurface(
+        skus=skus,
+        cogs_changes=cogs_changes,
+        price_changes=price_changes,
+        discount_changes=discount_changes,
+        base_cogs=base_cogs,
+        base_prices=prices,
+        profit=profit,
+        margin=margin,
+        cogs_headroom=np.broadcast_to(cogs_headroom, (len(skus), len(price_changes), len(discount_changes))),
+        price_floor=np.broadcast_to(price_floor, (len(skus), len(cogs_changes), len(discount_changes))),
+    )
+
+
+def catalog_sensitivity(
+    cost_graph: CostGraph,
+    channel,
+    list_prices: Optional[Union[pd.Series, Dict[str, float]]] = None,
+    target_margin: float = 0.10,
+    **grid,
+) -> SensitivitySurface:
+    """
+    شبكة الحساسية لكل منتجات وبكجات الكتالوج على قناة واحدة (channels.ChannelFees أو CompiledChannel)
+    list_prices: الأسعار الحالية؛ الـ SKU بدون سعر تُسعّر عند target_margin
+    """
+    compiled = channel if isinstance(channel, CompiledChannel) else CompiledChannel.from_channel(channel)
+    costs = cost_graph.cost_frame().dropna(subset=["COGS"]).drop_duplicates("SKU").set_index("SKU")["COGS"]
+    prices = pd.Series(
+        solve_price_for_margin_array(costs.to_numpy(), compiled, target_margin=target_margin), index=costs.index,
+    )
+    if list_prices is not None:
+        current = pd.Series(list_prices, dtype=float).reindex(costs.index)
+        prices = current.fillna(prices)
+    return sensitivity_surface(costs, prices, compiled, **grid)